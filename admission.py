@@ -0,0 +1,215 @@
+"""
+Admission control for LLM calls.
+
+At most LLM_CONCURRENCY calls run at once. The rest wait in a priority queue
+holding at most LLM_QUEUE_LIMIT entries. Cheap classifier calls go before
+chat generations, and within each kind higher tiers go first. A call that
+cannot get in is shed with Overloaded instead of piling onto the API:
+- the queue is full of work at least as important
+- it waited longer than LLM_QUEUE_TIMEOUT
+- something more important needed its place in the queue
+Callers answer Overloaded with choose_fallback().
+
+    async with admission.slot("classifier"):
+        ...
+
+The tier comes from set_tier(), which on_message calls once per message; the
+context variable carries it into every task the handler creates. A slot is
+held per task, so nested calls made while holding one do not queue again.
+A second concurrent request made on the caller's behalf, such as a hedge,
+takes its own slot with try_acquire() and gives it back with release().
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "16"))
+QUEUE_LIMIT = int(os.getenv("LLM_QUEUE_LIMIT", "100"))
+QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "20"))
+STATS_INTERVAL = 300
+
+KIND_RANK = {"classifier": 0, "short": 1, "chat": 2}
+TIER_RANK = {"enterprise": 0, "gold": 1, "premium": 2, "basic": 3}
+
+_tier = contextvars.ContextVar("admission_tier", default="basic")
+_holding = contextvars.ContextVar("admission_holding", default=False)
+
+_running = 0
+_queue: list = []  # heap of [priority, seq, future]
+_seq = itertools.count()
+
+_waits: dict[str, deque[float]] = {kind: deque(maxlen=500) for kind in KIND_RANK}
+_stats = {
+    "admitted": 0,
+    "queued": 0,
+    "shed": 0,
+    "max_depth": 0,
+}
+
+
+class Overloaded(Exception):
+    pass
+
+
+def set_tier(tier: str) -> None:
+    _tier.set(tier)
+
+
+def top_tier(tiers) -> str:
+    """The highest of several tiers, for work done on behalf of several users."""
+    return min(tiers, key=lambda tier: TIER_RANK.get(tier, TIER_RANK["basic"]), default="basic")
+
+
+def queue_depth() -> int:
+    return len(_queue)
+
+
+def _priority(kind: str) -> tuple[int, int]:
+    return KIND_RANK.get(kind, KIND_RANK["chat"]), TIER_RANK.get(_tier.get(), TIER_RANK["basic"])
+
+
+def _shed(reason: str) -> Overloaded:
+    _stats["shed"] += 1
+    print(f"[ADMISSION] Shedding LLM call: {reason} ({_running} running, {len(_queue)} queued)")
+    return Overloaded(reason)
+
+
+def _release() -> None:
+    """Hand the slot to the best waiter, or free it."""
+    global _running
+    while _queue:
+        _, _, future = heapq.heappop(_queue)
+        if not future.done():
+            future.set_result(None)
+            return
+    _running -= 1
+
+
+def _drop(entry) -> None:
+    try:
+        _queue.remove(entry)
+    except ValueError:
+        return
+    heapq.heapify(_queue)
+
+
+def try_acquire(kind: str = "chat") -> bool:
+    """Take a slot only if one is free right now, without queueing."""
+    global _running
+    if _running >= CONCURRENCY or _queue:
+        return False
+    _running += 1
+    _stats["admitted"] += 1
+    _waits[kind].append(0.0)
+    return True
+
+
+def release() -> None:
+    """Give back a slot taken with try_acquire()."""
+    _release()
+
+
+async def _acquire(kind: str) -> None:
+    global _running
+    if _running < CONCURRENCY and not _queue:
+        _running += 1
+        _stats["admitted"] += 1
+        _waits[kind].append(0.0)
+        return
+
+    priority = _priority(kind)
+    if len(_queue) >= QUEUE_LIMIT:
+        worst = max(_queue)
+        if worst[0] <= priority:
+            raise _shed("queue full")
+        _drop(worst)
+        if not worst[2].done():
+            worst[2].set_exception(_shed("displaced by higher priority work"))
+
+    entry = [priority, next(_seq), asyncio.get_running_loop().create_future()]
+    heapq.heappush(_queue, entry)
+    _stats["queued"] += 1
+    _stats["max_depth"] = max(_stats["max_depth"], len(_queue))
+    started = time.monotonic()
+
+    try:
+        await asyncio.wait_for(entry[2], QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        _drop(entry)
+        raise _shed(f"waited over {QUEUE_TIMEOUT:g}s")
+    except asyncio.CancelledError:
+        _drop(entry)
+        future = entry[2]
+        if future.done() and not future.cancelled() and future.exception() is None:
+            _release()
+        raise
+
+    _stats["admitted"] += 1
+    _waits[kind].append(time.monotonic() - started)
+
+
+@asynccontextmanager
+async def slot(kind: str = "chat"):
+    """Hold one of the LLM_CONCURRENCY slots for the duration of the block."""
+    if _holding.get():
+        yield
+        return
+
+    await _acquire(kind)
+    token = _holding.set(True)
+    try:
+        yield
+    finally:
+        _holding.reset(token)
+        _release()
+
+
+def get_stats() -> dict:
+    waits = {}
+    for kind, samples in _waits.items():
+        if samples:
+            ordered = sorted(samples)
+            waits[kind] = {
+                "p50": ordered[len(ordered) // 2],
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            }
+    return {
+        **_stats,
+        "running": _running,
+        "depth": len(_queue),
+        "waits": waits,
+    }
+
+
+def _report_and_reset() -> None:
+    s = get_stats()
+    waits = " | ".join(
+        f"{kind} wait p50 {w['p50'] * 1000:.0f} ms p95 {w['p95'] * 1000:.0f} ms"
+        for kind, w in s["waits"].items()
+    )
+    print(
+        f"[ADMISSION] running {s['running']}/{CONCURRENCY} | queued {s['depth']} "
+        f"(max {s['max_depth']}/{QUEUE_LIMIT}) | {s['admitted']} admitted, "
+        f"{s['queued']} waited, {s['shed']} shed"
+        + (f" | {waits}" if waits else "")
+    )
+    for key in _stats:
+        _stats[key] = 0
+    for samples in _waits.values():
+        samples.clear()
+
+
+async def _stats_loop():
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        _report_and_reset()
+
+
+def start() -> None:
+    asyncio.create_task(_stats_loop())
@@ -0,0 +1,118 @@
+"""
+Offline benchmark: local intent classifiers vs the LLM deciders.
+
+Runs 5-fold cross-validation over the bundled labelled sets and reports
+accuracy, how many messages the local model answers on its own at
+INTENT_CONFIDENCE (coverage), accuracy on those, and per-call latency.
+With --llm it also asks the current LLM decider about every example and
+reports its accuracy, its latency, and the accuracy of the combined path,
+where the LLM answers only what the local model defers. --llm needs
+GROQ_API_KEY and makes one API call per example.
+
+Usage:
+    python bench_intent_classifier.py [--llm]
+"""
+
+import asyncio
+import random
+import sys
+import time
+
+import intent_classifier
+from intent_classifier import CONFIDENCE, IntentClassifier, load_examples
+
+FOLDS = 5
+
+DECIDERS = [
+    (intent_classifier.web_search, intent_classifier.web_search_prompt, "YES"),
+    (intent_classifier.image_edit, intent_classifier.image_action_prompt, "EDIT"),
+]
+
+
+def cross_validate(classifier: IntentClassifier, examples):
+    """Out-of-fold probability for every example."""
+    order = list(range(len(examples)))
+    random.Random(0).shuffle(order)
+    probs = [0.0] * len(examples)
+    for fold in range(FOLDS):
+        held = set(order[fold::FOLDS])
+        model = IntentClassifier(classifier.name, classifier.data_path, classifier.positive)
+        model.fit([ex for i, ex in enumerate(examples) if i not in held])
+        for i in held:
+            probs[i] = model.predict(examples[i][0])
+    return probs
+
+
+def time_predict(classifier: IntentClassifier, examples, rounds: int = 20) -> float:
+    classifier.predict("warm up")
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text, _ in examples:
+            classifier.predict(text)
+    return (time.perf_counter() - started) / (rounds * len(examples))
+
+
+async def ask_llm(prompt_fn, positive: str, examples):
+    import llm_gateway
+
+    answers, latencies = [], []
+    for text, _ in examples:
+        started = time.perf_counter()
+        try:
+            reply = await llm_gateway.complete(
+                prompt_fn(text),
+                model="llama-3.3-70b-versatile",
+                temperature=0,
+                kind="classifier",
+                site="classifier",
+            )
+        except Exception as e:
+            print(f"  LLM error: {e}")
+            reply = None
+        latencies.append(time.perf_counter() - started)
+        answers.append((reply or "").strip().upper().startswith(positive))
+    return answers, latencies
+
+
+def _pct(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def main():
+    use_llm = "--llm" in sys.argv
+    for classifier, prompt_fn, positive in DECIDERS:
+        examples = load_examples(classifier.data_path, classifier.positive)
+        labels = [label for _, label in examples]
+        probs = cross_validate(classifier, examples)
+
+        predicted = [p >= 0.5 for p in probs]
+        accuracy = sum(p == y for p, y in zip(predicted, labels)) / len(examples)
+        confident = [i for i, p in enumerate(probs) if p >= CONFIDENCE or p <= 1 - CONFIDENCE]
+        confident_acc = (
+            sum(predicted[i] == labels[i] for i in confident) / len(confident) if confident else 0.0
+        )
+        latency = time_predict(classifier, examples)
+
+        print(f"\n== {classifier.name} ({len(examples)} examples, {FOLDS}-fold CV) ==")
+        print(f"local  accuracy {accuracy:.1%} | per call {latency * 1e6:.0f} µs")
+        print(
+            f"local  answers {len(confident) / len(examples):.1%} on its own at confidence "
+            f"{CONFIDENCE} with {confident_acc:.1%} accuracy"
+        )
+
+        if use_llm:
+            answers, latencies = asyncio.run(ask_llm(prompt_fn, positive, examples))
+            llm_acc = sum(a == y for a, y in zip(answers, labels)) / len(examples)
+            combined = [predicted[i] if i in confident else answers[i] for i in range(len(examples))]
+            combined_acc = sum(c == y for c, y in zip(combined, labels)) / len(examples)
+            llm_calls = len(examples) - len(confident)
+            print(
+                f"llm    accuracy {llm_acc:.1%} | per call p50 {_pct(latencies, 0.5) * 1000:.0f} ms "
+                f"p95 {_pct(latencies, 0.95) * 1000:.0f} ms"
+            )
+            print(f"hybrid accuracy {combined_acc:.1%} with {llm_calls}/{len(examples)} LLM calls")
+
+
+if __name__ == "__main__":
+    main()
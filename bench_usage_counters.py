@@ -0,0 +1,57 @@
+"""
+Micro-benchmark: rolling attachment limit check + consume, per-timestamp
+history lists (the old attachment_history) vs AttachmentWindow buckets.
+
+Usage:
+    python bench_usage_counters.py
+"""
+
+import random
+import time
+
+from usage_manager import AttachmentWindow, ROLLING_WINDOW
+
+SIZES = [10, 100, 1_000, 10_000, 100_000]
+ROUNDS = 2_000
+
+
+def _prune(history, now):
+    cutoff = now - ROLLING_WINDOW.total_seconds()
+    return [t for t in history if t >= cutoff]
+
+
+def bench_list(history, now):
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        history = _prune(history, now)     # check_total_limit
+        _ = len(history) < float("inf")
+        history.append(now)                # consume_total
+        _ = len(_prune(history, now))      # the log line
+        history.pop()                      # keep the size under test fixed
+    return (time.perf_counter() - started) / ROUNDS
+
+
+def bench_window(window, now):
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        _ = window.count(now) < float("inf")
+        window.add(now)
+        _ = window.total
+    return (time.perf_counter() - started) / ROUNDS
+
+
+def main():
+    now = time.time()
+    span = ROLLING_WINDOW.total_seconds()
+    print(f"{'history':>9} | {'list (µs/op)':>13} | {'buckets (µs/op)':>15}")
+    for size in SIZES:
+        stamps = sorted(now - random.random() * span for _ in range(size))
+        window = AttachmentWindow.from_json(stamps)
+        list_cost = bench_list(list(stamps), now) if size <= 10_000 else None
+        window_cost = bench_window(window, now)
+        list_text = f"{list_cost * 1e6:13.2f}" if list_cost is not None else f"{'(skipped)':>13}"
+        print(f"{size:>9} | {list_text} | {window_cost * 1e6:15.2f}")
+
+
+if __name__ == "__main__":
+    main()
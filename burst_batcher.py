@@ -0,0 +1,81 @@
+"""
+Per-channel micro-batching of bot mentions.
+
+submit(key, item) queues an item for its channel. The first item of a batch
+opens a BURST_WINDOW-second window (300 ms by default); everything that
+arrives for the channel inside the window joins it, and the batch is handed
+to the handler when the window closes, or at once when it reaches MAX_BURST
+items. Each batch runs as its own task, so an item that arrives after a
+batch has been dispatched opens a new window instead of waiting for the
+previous reply to finish.
+
+A batch runs in the context variables of the submit() call that opened its
+window, so handlers must set anything per-message, such as the admission
+tier, from the items themselves.
+
+    batcher = BurstBatcher(handle_mentions)
+    batcher.submit(chan_id, (message, content, mode))
+"""
+
+import asyncio
+import os
+from typing import Awaitable, Callable
+
+BURST_WINDOW = float(os.getenv("BURST_WINDOW", "0.3"))
+MAX_BURST = int(os.getenv("MAX_BURST", "5"))
+
+
+class BurstBatcher:
+    def __init__(
+        self,
+        handler: Callable[[str, list], Awaitable[None]],
+        window: float = BURST_WINDOW,
+        max_batch: int = MAX_BURST,
+    ):
+        self.handler = handler
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: dict[str, list] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._running: set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, key: str, item) -> None:
+        pending = self._pending.setdefault(key, [])
+        pending.append(item)
+        if len(pending) >= self.max_batch:
+            self._dispatch(key)
+        elif key not in self._timers:
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._dispatch, key)
+
+    def pending(self, key: str) -> int:
+        return len(self._pending.get(key, ()))
+
+    def _dispatch(self, key: str) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if not batch:
+            return
+
+        self.batches += 1
+        self.items += len(batch)
+        task = asyncio.create_task(self._handle(key, batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _handle(self, key: str, batch: list) -> None:
+        try:
+            await self.handler(key, batch)
+        except Exception as e:
+            print(f"[BURST ERROR] {key}: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "open_windows": len(self._timers),
+            "running": len(self._running),
+        }
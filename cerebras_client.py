@@ -1,13 +1,21 @@
 import asyncio
 import os
 
+import aiohttp
 from dotenv import load_dotenv
 
+from chat_messages import as_messages
+
 load_dotenv()
 
 CEREBRAS_API_KEY = os.getenv("CEREBRAS_API_KEY")
+CEREBRAS_URL = "https://api.cerebras.ai/v1/chat/completions"
+
+# Kept-alive connections to api.cerebras.ai shared by all calls.
+MAX_CONNECTIONS = int(os.getenv("CEREBRAS_MAX_CONNECTIONS", "20"))
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=60, sock_connect=10)
 
-_client = None
+SESSION: aiohttp.ClientSession | None = None
 
 
 def clean_log(text: str) -> str:
@@ -18,17 +26,26 @@ def clean_log(text: str) -> str:
 	return text
 
 
-def _get_client():
-	"""Return a singleton Cerebras client instance."""
-	global _client
-	if _client is None:
-		from cerebras.cloud.sdk import Cerebras
-		_client = Cerebras(api_key=CEREBRAS_API_KEY)
-	return _client
+async def get_session():
+	global SESSION
+	if SESSION is None or SESSION.closed:
+		SESSION = aiohttp.ClientSession(
+			connector=aiohttp.TCPConnector(limit=MAX_CONNECTIONS, keepalive_timeout=30),
+			timeout=REQUEST_TIMEOUT,
+		)
+	return SESSION
+
+
+async def close_session():
+	"""Close the aiohttp session properly"""
+	global SESSION
+	if SESSION and not SESSION.closed:
+		await SESSION.close()
+		SESSION = None
 
 
 async def call_cerebras(
-	prompt: str,
+	prompt: str | list[dict],
 	model: str = "gpt-oss-120b",
 	temperature: float = 0.2,
 	retries: int = 3,
@@ -36,32 +53,53 @@ async def call_cerebras(
 	"""
 	Call Cerebras API for code testing and fixing.
 	Uses gpt-oss-120b by default — intended for code tasks only.
+
+	Talks to the OpenAI-compatible endpoint over aiohttp, so no worker thread
+	is held while waiting and cancelling the caller aborts the request.
 	"""
 	if not CEREBRAS_API_KEY:
 		print("[CEREBRAS] Missing CEREBRAS_API_KEY")
 		return None
 
-	loop = asyncio.get_running_loop()
+	session = await get_session()
+	payload = {
+		"model": model,
+		"messages": as_messages(prompt),
+		"temperature": temperature,
+	}
+	headers = {
+		"Authorization": f"Bearer {CEREBRAS_API_KEY}",
+		"Content-Type": "application/json",
+	}
 
 	backoff = 1
 	for attempt in range(1, retries + 1):
+		wait = backoff
 		try:
-			def _call():
-				client = _get_client()
-				chat = client.chat.completions.create(
-					messages=[{"role": "user", "content": prompt}],
-					model=model,
-					temperature=temperature,
-				)
-				return chat.choices[0].message.content if chat.choices else None
+			async with session.post(CEREBRAS_URL, headers=headers, json=payload) as resp:
+				if resp.status == 200:
+					data = await resp.json()
+					choices = data.get("choices") or []
+					return choices[0]["message"]["content"] if choices else None
+
+				text = await resp.text()
+				if resp.status in (400, 401, 403, 404):
+					# A bad key, model or request fails the same way on every attempt.
+					print(f"[CEREBRAS ERROR] Status {resp.status}: {clean_log(text)}")
+					return None
 
-			return await loop.run_in_executor(None, _call)
+				if resp.status == 429:
+					try:
+						wait = max(backoff, float(resp.headers.get("retry-after", "")))
+					except ValueError:
+						pass
+				raise Exception(f"status {resp.status}: {text[:300]}")
 
 		except Exception as e:
 			print(f"[CEREBRAS ERROR] Attempt {attempt}/{retries}: {clean_log(str(e))}")
 			if attempt == retries:
 				return None
-			await asyncio.sleep(backoff)
+			await asyncio.sleep(min(wait, 8))
 			backoff = min(backoff * 2, 8)
 
 	return None
@@ -0,0 +1,99 @@
+"""
+Helpers for role-separated chat prompts.
+
+Prompts are either a plain string, sent as one user message as before, or
+an OpenAI-style message list:
+
+    [{"role": "system", "content": <persona + rules, identical every call>},
+     {"role": "system", "content": <rolling summary>},          # optional
+     {"role": "user", "content": "alice: hi\\nbob: yo"},
+     {"role": "assistant", "content": "hey both"},
+     ...
+     {"role": "user", "content": <this turn>}]
+
+Keeping the persona block byte-for-byte identical at the front lets
+providers reuse their cached prefix, and each history turn only shifts the
+tail. Clients that only take one string use flatten() or split_system().
+"""
+
+# Rough chars-per-token ratio for English chat text. Only used to size
+# prompts, so it errs on the side of over-counting.
+CHARS_PER_TOKEN = 4
+
+
+def as_messages(prompt) -> list[dict]:
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    return list(prompt)
+
+
+def history_turns(entries, bot_name: str) -> list[dict]:
+    """
+    Turn (author, text) history entries into alternating turns. The bot's own
+    lines become assistant turns; everyone else's consecutive lines are joined
+    into one user turn as "author: text" so speakers stay distinguishable.
+    """
+    turns = []
+    for author, text in entries:
+        if author == bot_name:
+            if turns and turns[-1]["role"] == "assistant":
+                turns[-1]["content"] += f"\n{text}"
+            else:
+                turns.append({"role": "assistant", "content": text})
+        else:
+            line = f"{author}: {text}"
+            if turns and turns[-1]["role"] == "user":
+                turns[-1]["content"] += f"\n{line}"
+            else:
+                turns.append({"role": "user", "content": line})
+    return turns
+
+
+def add_user_turn(messages: list[dict], text: str) -> list[dict]:
+    """Append text as the user turn, joining it to a trailing user turn if there is one."""
+    messages = list(messages)
+    if messages and messages[-1]["role"] == "user":
+        messages[-1] = {"role": "user", "content": f"{messages[-1]['content']}\n\n{text}"}
+    else:
+        messages.append({"role": "user", "content": text})
+    return messages
+
+
+def add_instruction(prompt, text: str):
+    """Add an instruction after the prompt, at the end of the last user turn for lists."""
+    if isinstance(prompt, str):
+        return f"{prompt}\n\n{text}"
+    return add_user_turn(prompt, text)
+
+
+def split_system(prompt) -> tuple[str | None, list[dict]]:
+    """Separate the system text from the conversation turns."""
+    messages = as_messages(prompt)
+    system = [m["content"] for m in messages if m["role"] == "system"]
+    rest = [m for m in messages if m["role"] != "system"]
+    return ("\n\n".join(system) if system else None), rest
+
+
+def flatten(prompt) -> str:
+    """One string for clients without a message API, laid out like the old prompts."""
+    if isinstance(prompt, str):
+        return prompt
+    system, turns = split_system(prompt)
+    parts = [system] if system else []
+    for turn in turns:
+        if turn["role"] == "assistant":
+            parts.append(f"Assistant: {turn['content']}")
+        else:
+            parts.append(turn["content"])
+    return "\n\n".join(parts)
+
+
+def text_length(prompt) -> int:
+    if isinstance(prompt, str):
+        return len(prompt)
+    return sum(len(m["content"]) for m in prompt if isinstance(m.get("content"), str))
+
+
+def estimate_tokens(prompt) -> int:
+    """Token estimate for a string or message list; memory sizes history with the same rule."""
+    return text_length(prompt) // CHARS_PER_TOKEN + 1
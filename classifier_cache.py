@@ -0,0 +1,137 @@
+"""
+LRU + TTL cache for deterministic classifier calls.
+
+The web-search and image-action deciders run at temperature 0, so the same
+question always gets the same answer. Entries are keyed by
+slang_normalizer.normalize_text, so "What is this??" and "what is this" share
+one answer. Concurrent lookups for a key that is still being computed wait
+for that one call instead of starting their own (single flight).
+
+    decision = await cache.get_or_compute(user_text, lambda: ask_llm(user_text))
+
+Only successful results are stored; if compute raises, every waiter sees
+the error and the next lookup tries again.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from slang_normalizer import normalize_text
+
+MAX_ENTRIES = int(os.getenv("CLASSIFIER_CACHE_SIZE", "4096"))
+TTL = float(os.getenv("CLASSIFIER_CACHE_TTL", "3600"))
+STATS_INTERVAL = 300
+
+_caches: dict[str, "ClassifierCache"] = {}
+
+
+class ClassifierCache:
+    def __init__(self, name: str, max_entries: int = MAX_ENTRIES, ttl: float = TTL):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        _caches[name] = self
+
+    def get(self, text: str):
+        """Return the cached answer for text, or None."""
+        key = normalize_text(text)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, text: str, value) -> None:
+        self._store(normalize_text(text), value)
+
+    def _store(self, key: str, value) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, text: str, compute: Callable[[], Awaitable]):
+        key = normalize_text(text)
+        while True:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # The call we were waiting on was cancelled; run our own.
+                if pending.cancelled():
+                    continue
+                raise
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a failure nobody waited on is not logged as unhandled.
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        self._store(key, value)
+        future.set_result(value)
+        return value
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+
+def get_stats() -> dict:
+    return {name: cache.get_stats() for name, cache in _caches.items()}
+
+
+def _report() -> None:
+    for name, s in get_stats().items():
+        print(
+            f"[CLASSIFIER CACHE] {name}: {s['hits']} hits, {s['coalesced']} coalesced, "
+            f"{s['misses']} misses ({s['hit_rate']:.0%} hit rate), {s['entries']} entries"
+        )
+
+
+async def _stats_loop():
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        _report()
+
+
+def start() -> None:
+    asyncio.create_task(_stats_loop())
@@ -0,0 +1,98 @@
+"""
+One background thread that performs blocking file writes for the bot.
+
+submit(key, fn) queues a zero-argument callable and returns a
+concurrent.futures.Future. Keys are usually file paths or store names. If a
+write for the same key is still waiting when a newer one arrives, the newer
+one replaces it and both callers share its future, so a burst of saves to one
+file costs one write. Only use this for writes that replace the whole file;
+an append must wait for the previous one to finish.
+
+Callers on the event loop either ignore the future (fire and forget) or
+`await write(key, fn)` to wait for durability.
+"""
+
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable
+
+_cond = threading.Condition()
+_order: deque[str] = deque()
+_jobs: dict[str, list] = {}  # key -> [fn, future]
+_busy = 0
+_thread: threading.Thread | None = None
+
+_stats = {
+    "submitted": 0,
+    "coalesced": 0,
+    "written": 0,
+    "errors": 0,
+}
+
+
+def _ensure_thread() -> None:
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _thread = threading.Thread(target=_run, name="disk-writer", daemon=True)
+        _thread.start()
+
+
+def submit(key: str, fn: Callable[[], int | None]) -> Future:
+    with _cond:
+        _stats["submitted"] += 1
+        job = _jobs.get(key)
+        if job is not None:
+            job[0] = fn
+            _stats["coalesced"] += 1
+            return job[1]
+        future = Future()
+        _jobs[key] = [fn, future]
+        _order.append(key)
+        _ensure_thread()
+        _cond.notify_all()
+        return future
+
+
+async def write(key: str, fn: Callable[[], int | None]):
+    """Queue a write and wait until it has finished."""
+    return await asyncio.wrap_future(submit(key, fn))
+
+
+def queue_depth() -> int:
+    with _cond:
+        return len(_order) + _busy
+
+
+def drain(timeout: float | None = None) -> bool:
+    """Block until every queued write has finished. Returns False on timeout."""
+    with _cond:
+        return _cond.wait_for(lambda: not _order and not _busy, timeout)
+
+
+def get_stats() -> dict:
+    with _cond:
+        return {**_stats, "queued": len(_order) + _busy}
+
+
+def _run() -> None:
+    global _busy
+    while True:
+        with _cond:
+            _cond.wait_for(lambda: _order)
+            key = _order.popleft()
+            fn, future = _jobs.pop(key)
+            _busy += 1
+
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(fn())
+                _stats["written"] += 1
+            except BaseException as e:
+                _stats["errors"] += 1
+                future.set_exception(e)
+
+        with _cond:
+            _busy -= 1
+            _cond.notify_all()
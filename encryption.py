@@ -1,5 +1,11 @@
 import os
-from cryptography.fernet import Fernet
+import json
+import base64
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESSIV
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 
 _raw_key = os.getenv("ENCRYPTION_KEY", "").strip()
 
@@ -13,6 +19,18 @@ if not _raw_key:
 
 _fernet = Fernet(_raw_key.encode())
 
+# Record files are encrypted with AES-SIV, which is deterministic: the same
+# record always encrypts to the same bytes, so a save only changes the lines
+# whose records changed and git commits carry just the real delta.
+_siv = AESSIV(HKDF(
+    algorithm=hashes.SHA256(),
+    length=64,
+    salt=None,
+    info=b"codunot-records-v1",
+).derive(base64.urlsafe_b64decode(_raw_key)))
+
+RECORDS_HEADER = b"CODUNOT-RECORDS 1"
+
 
 def encrypt_data(data: str) -> bytes:
     return _fernet.encrypt(data.encode("utf-8"))
@@ -22,12 +40,131 @@ def decrypt_data(data: bytes) -> str:
     return _fernet.decrypt(data).decode("utf-8")
 
 
-def save_encrypted(filepath: str, data: str) -> None:
-    encrypted = encrypt_data(data)
-    with open(filepath, "wb") as f:
-        f.write(encrypted)
+def encrypt_record(data: str) -> bytes:
+    return base64.urlsafe_b64encode(_siv.encrypt(data.encode("utf-8"), None))
+
+
+def decrypt_record(data: bytes) -> str:
+    """Decrypt one line, falling back to Fernet for lines written before AES-SIV."""
+    try:
+        return _siv.decrypt(base64.urlsafe_b64decode(data), None).decode("utf-8")
+    except (InvalidTag, ValueError):
+        return decrypt_data(data)
+
+
+def _atomic_write(filepath: str, payload: bytes) -> int:
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, filepath)
+    return len(payload)
+
+
+def save_encrypted(filepath: str, data: str) -> int:
+    return _atomic_write(filepath, encrypt_data(data))
 
 
 def load_encrypted(filepath: str) -> str:
     with open(filepath, "rb") as f:
         return decrypt_data(f.read())
+
+
+# ---------------- RECORD FILES ----------------
+# A header line followed by one encrypted record per line. A JSON object is
+# split into one record per top-level key, and per second-level key where the
+# value is itself an object, in insertion order. Editing one guild's config or
+# one user's vote touches one line.
+
+def _key(key) -> str:
+    # Object keys come back as strings, exactly as a plain json.dumps would give.
+    return key if isinstance(key, str) else json.dumps(key)
+
+
+def _chunk(data):
+    if not isinstance(data, dict):
+        yield [], data
+        return
+    for key, value in data.items():
+        if isinstance(value, dict) and value:
+            for sub_key, sub_value in value.items():
+                yield [_key(key), _key(sub_key)], sub_value
+        else:
+            yield [_key(key)], value
+
+
+def encode_records(data) -> list[str]:
+    """Serialize data into records. Cheap; encryption happens in write_records."""
+    return [json.dumps([path, value], ensure_ascii=False) for path, value in _chunk(data)]
+
+
+def write_records(filepath: str, records: list[str]) -> int:
+    """Atomically encrypt and write records from encode_records. Returns bytes written."""
+    lines = [RECORDS_HEADER]
+    lines.extend(encrypt_record(record) for record in records)
+    return _atomic_write(filepath, b"\n".join(lines) + b"\n")
+
+
+def save_records(filepath: str, data) -> int:
+    """Atomically write data as a record file. Returns bytes written."""
+    return write_records(filepath, encode_records(data))
+
+
+def load_records(filepath: str):
+    """Load a record file, or a whole-file Fernet blob from the older format."""
+    with open(filepath, "rb") as f:
+        raw = f.read()
+    if not raw.startswith(RECORDS_HEADER):
+        return json.loads(decrypt_data(raw))
+
+    data = {}
+    for line in raw.splitlines()[1:]:
+        if not line.strip():
+            continue
+        path, value = json.loads(decrypt_record(line.strip()))
+        if not path:
+            return value
+        if len(path) == 1:
+            data[path[0]] = value
+        else:
+            data.setdefault(path[0], {})[path[1]] = value
+    return data
+
+
+def is_record_file(filepath: str) -> bool:
+    with open(filepath, "rb") as f:
+        return f.read(len(RECORDS_HEADER)) == RECORDS_HEADER
+
+
+# ---------------- JOURNALS ----------------
+# One encrypted record per line. Records are urlsafe base64, so a newline
+# can never appear inside one. Lines written by older versions as Fernet
+# tokens are still read.
+
+def append_encrypted(filepath: str, records: list[str]) -> int:
+    """Append each record as its own encrypted line. Returns bytes written."""
+    payload = b"".join(encrypt_record(record) + b"\n" for record in records)
+    with open(filepath, "ab") as f:
+        f.write(payload)
+    return len(payload)
+
+
+def write_encrypted_lines(filepath: str, records: list[str]) -> int:
+    """Atomically replace a journal with the given records."""
+    return _atomic_write(filepath, b"".join(encrypt_record(record) + b"\n" for record in records))
+
+
+def load_encrypted_lines(filepath: str) -> list[str]:
+    """Decrypt a journal. A torn trailing record from a crash is skipped."""
+    records = []
+    with open(filepath, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(decrypt_record(line))
+            except InvalidToken:
+                print(f"[ENCRYPTION] Skipping unreadable record in {filepath}")
+    return records
@@ -0,0 +1,113 @@
+"""
+Generation settings per call site.
+
+Every LLM request names the site it comes from, and the site's profile sets
+max_tokens, the default temperature, stop sequences and the request timeout.
+A one-word classifier answer no longer reserves 8000 output tokens against
+the tokens-per-minute limit.
+
+    text = await call_groq(prompt, model=model, site="classifier")
+
+Reasoning models spend output tokens on hidden reasoning before the visible
+answer, so they get REASONING_HEADROOM on top of the profile's max_tokens.
+The result is capped by the model's own limit.
+
+record() counts what each site actually used, and a [GEN PROFILE] line is
+printed every REPORT_EVERY requests per site. If a site is often cut off at
+its limit ("length" finishes), raise its max_tokens.
+"""
+
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    max_tokens: int
+    temperature: float
+    stop: tuple[str, ...] = ()
+    timeout: float = 60
+
+
+PROFILES: dict[str, GenerationProfile] = {
+    # YES/NO and EDIT/NO deciders
+    "classifier": GenerationProfile(max_tokens=8, temperature=0.0, stop=("\n",), timeout=15),
+    # enterprise AI moderation verdict on a single message
+    "moderation": GenerationProfile(max_tokens=128, temperature=0.0, timeout=15),
+    # image and video prompt boosters, 80 and 250 words at most
+    "booster": GenerationProfile(max_tokens=512, temperature=0.1, timeout=20),
+    # fun, roast and rizz replies: short by persona, 2000 characters at most
+    "fun_chat": GenerationProfile(max_tokens=800, temperature=0.7, timeout=60),
+    # serious replies can be long explanations or code; long replies are split on send
+    "serious_chat": GenerationProfile(max_tokens=2048, temperature=0.7, timeout=90),
+    # several numbered answers in one reply
+    "burst_chat": GenerationProfile(max_tokens=2400, temperature=0.7, timeout=90),
+    "vision_ocr": GenerationProfile(max_tokens=1500, temperature=0.1, timeout=45),
+    "vision_answer": GenerationProfile(max_tokens=1200, temperature=0.7, timeout=60),
+    "file_summary": GenerationProfile(max_tokens=1500, temperature=0.7, timeout=90),
+    # rolling channel summary, 120 words at most
+    "summary": GenerationProfile(max_tokens=300, temperature=0.2, timeout=30),
+    # anything that does not name a site keeps the old behaviour
+    "default": GenerationProfile(max_tokens=8000, temperature=1.0, timeout=60),
+}
+
+# Extra output tokens for models that reason before answering.
+REASONING_HEADROOM = {
+    "openai/gpt-oss-120b": 2048,
+    "gpt-oss-120b": 2048,
+    "qwen/qwen3-32b": 2048,
+}
+
+REPORT_EVERY = 50
+
+
+def get(site: str | None) -> GenerationProfile:
+    return PROFILES.get(site or "default", PROFILES["default"])
+
+
+def chat_site(mode: str) -> str:
+    """Profile for a chat reply in the given mode."""
+    return "serious_chat" if mode == "serious" else "fun_chat"
+
+
+def max_tokens(site: str | None, model: str, model_limit: int) -> int:
+    return min(get(site).max_tokens + REASONING_HEADROOM.get(model, 0), model_limit)
+
+
+# ---------------- USAGE PER SITE ----------------
+_stats: dict[str, dict] = {}
+
+
+def record(site: str | None, model: str, usage: dict | None, finish_reason: str | None = None, latency: float | None = None):
+    """Count the completion tokens one request to site used."""
+    site = site or "default"
+    s = _stats.setdefault(site, {
+        "requests": 0, "completion_tokens": 0, "max_completion_tokens": 0,
+        "truncated": 0, "latency": 0.0,
+    })
+    used = (usage or {}).get("completion_tokens") or 0
+    s["requests"] += 1
+    s["completion_tokens"] += used
+    s["max_completion_tokens"] = max(s["max_completion_tokens"], used)
+    if finish_reason == "length":
+        s["truncated"] += 1
+        print(f"[GEN PROFILE] {site} hit max_tokens on {model}")
+    if latency is not None:
+        s["latency"] += latency
+    if s["requests"] % REPORT_EVERY == 0:
+        _report(site, s)
+
+
+def _report(site: str, s: dict):
+    print(
+        f"[GEN PROFILE] {site}: {s['requests']} requests, "
+        f"avg {s['completion_tokens'] / s['requests']:.0f} / max {s['max_completion_tokens']} "
+        f"completion tokens of {get(site).max_tokens} allowed, {s['truncated']} truncated, "
+        f"avg {s['latency'] / s['requests']:.2f}s"
+    )
+
+
+def get_stats() -> dict:
+    return {
+        site: {**s, "limit": get(site).max_tokens, "avg_completion_tokens": s["completion_tokens"] / s["requests"]}
+        for site, s in _stats.items()
+    }
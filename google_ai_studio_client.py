@@ -4,6 +4,8 @@ import os
 import aiohttp
 from dotenv import load_dotenv
 
+from chat_messages import split_system
+
 load_dotenv()
 
 GOOGLE_AI_STUDIO_API_KEY = os.getenv("GOOGLE_AI_STUDIO_API_KEY") or os.getenv("GEMINI_API_KEY")
@@ -28,13 +30,14 @@ async def get_session():
 
 
 async def call_google_ai_studio(
-	prompt: str,
+	prompt: str | list[dict],
 	model: str = "gemini-2.5-flash-lite",
 	temperature: float = 0.7,
 	retries: int = 3,
 ) -> str | None:
 	"""
 	Call Google AI Studio Gemini API via generateContent endpoint.
+	System messages become systemInstruction and assistant turns become model turns.
 	"""
 	if not GOOGLE_AI_STUDIO_API_KEY:
 		print("[GOOGLE AI STUDIO] Missing GOOGLE_AI_STUDIO_API_KEY (or GEMINI_API_KEY)")
@@ -42,12 +45,18 @@ async def call_google_ai_studio(
 
 	session = await get_session()
 	url = f"{GOOGLE_API_BASE}/models/{model}:generateContent?key={GOOGLE_AI_STUDIO_API_KEY}"
+	system, turns = split_system(prompt)
 	payload = {
-		"contents": [{"role": "user", "parts": [{"text": prompt}]}],
+		"contents": [
+			{"role": "model" if t["role"] == "assistant" else "user", "parts": [{"text": t["content"]}]}
+			for t in turns
+		],
 		"generationConfig": {
 			"temperature": temperature,
 		},
 	}
+	if system:
+		payload["systemInstruction"] = {"parts": [{"text": system}]}
 
 	backoff = 1
 	for attempt in range(1, retries + 1):
@@ -18,12 +18,13 @@ from discord.ext import commands
 from dotenv import load_dotenv
 
 from memory import MemoryManager
+from summarizer import RollingSummarizer
 from humanizer import maybe_typo
 from deAPI_client_image import generate_image
 from deAPI_client_image_edit import edit_image, merge_images
 from deAPI_client_text2vid import generate_video as text_to_video_512
 from bot_chess import OnlineChessEngine
-from groq_client import call_groq
+from groq_client import call_groq, stream_groq, history_token_budget
 from replicate_client import call_replicate
 from google_ai_studio_client import call_google_ai_studio
 from slang_normalizer import apply_slang_map
@@ -34,7 +35,7 @@ from typing import Optional
 from topgg_utils import has_voted
 import json
 
-from encryption import save_encrypted, load_encrypted
+from encryption import encode_records, write_records, load_records
 
 from guild_access_config import (
 	load_guild_chat_config,
@@ -46,15 +47,26 @@ from guild_access_config import (
 )
 
 import playlist_manager
+import persistence
+import llm_gateway
+import admission
+import classifier_cache
+import intent_classifier
+import chat_messages
+import generation_profiles
+import model_router
+from burst_batcher import BurstBatcher
 
 from usage_manager import (
 	check_limit,
-	check_total_limit,
+	reserve,
+	LimitExceeded,
 	consume,
 	consume_total,
 	deny_limit,
 	load_usage,
 	save_usage,
+	checkpoint_usage,
 	autosave_usage,
 	get_usage,
 	get_tier_key,
@@ -73,7 +85,8 @@ OWNER_IDS = {int(os.environ.get("OWNER_ID", 0)), 1220934047794987048, 1167443519
 OWNER_IDS.discard(0)
 BYPASS_IDS = {1220934047794987048, 1167443519070290051}
 VOTE_DURATION = 12 * 60 * 60
-MAX_MEMORY = 15
+# Raw lines kept per channel; older ones are folded into a rolling summary.
+MAX_MEMORY = 10
 RATE_LIMIT = 30
 MAX_IMAGE_BYTES = 2_000_000  # 2 MB
 VOTE_FILE = "vote_unlocks.json"
@@ -95,7 +108,9 @@ intents.members = True
 # --- ENABLE SHARDING ---
 bot = commands.AutoShardedBot(command_prefix="!", intents=intents, owner_ids=set(OWNER_IDS))
 
-memory = MemoryManager(limit=15, file_path="codunot_memory.json")
+memory = MemoryManager(limit=MAX_MEMORY, file_path="codunot_memory.json")
+summarizer = RollingSummarizer(memory, bot_name=BOT_NAME)
+memory.on_evict = summarizer.schedule
 chess_engine = OnlineChessEngine()
 IMAGE_PROCESSING_CHANNELS = set()
 
@@ -105,16 +120,11 @@ channel_modes = {}
 channel_mutes = {}
 channel_chess = {}
 channel_images = {}
-channel_memory = {}
 rate_buckets = {}
 user_vote_unlocks = {}
 channel_last_images = {}
 channel_last_chess_result = {}
 
-
-def clear_runtime_channel_memory(chan_id: str):
-	channel_memory.pop(chan_id, None)
-
 channel_message_counts = {}
 PROMO_MIN_MESSAGES = 10
 PROMO_MAX_MESSAGES = 25
@@ -138,9 +148,16 @@ async def setup_hook():
 	slash_commands.set_server_mode = set_server_mode
 	slash_commands.set_channels_mode = set_channels_mode
 	slash_commands.get_guild_config = get_guild_config
-	slash_commands.clear_runtime_channel_memory = clear_runtime_channel_memory
 	
 	await slash_commands.setup(bot)
+	persistence.start()
+	admission.start()
+	classifier_cache.start()
+	model_router.start()
+	await asyncio.to_thread(intent_classifier.warm_up)
+	# Started here rather than in on_ready, which fires again on every reconnect.
+	asyncio.create_task(process_queue())
+	asyncio.create_task(autosave_usage())
 
 	import mod_commands
 	await mod_commands.setup(bot)
@@ -579,12 +596,13 @@ async def test_llama(ctx: commands.Context, mode: str = "funny", *, message: str
 		if mode == "roast":
 			prompt = build_roast_prompt("test", message)
 		else:
-			prompt = build_general_prompt("test", mode, None, False) + f"\nUser says:\n{message}\n\nReply:"
+			prompt = chat_messages.add_user_turn(build_general_prompt("test", mode, None, False), f"User says:\n{message}")
 
 		response = await call_groq(
 			prompt=prompt,
 			model=IMAGE_REQUIRED_MODEL,
 			temperature=1.3 if mode == "roast" else 0.7,
+			site=generation_profiles.chat_site(mode),
 		)
 
 		if response:
@@ -628,64 +646,61 @@ async def test_provider(ctx: commands.Context, provider: str = None, *, message:
 PRIMARY_MODEL = "openai/gpt-oss-120b"
 FALLBACK_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
 IMAGE_REQUIRED_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
-
-PRIMARY_COOLDOWN_UNTIL = None
-PRIMARY_COOLDOWN_DURATION = timedelta(minutes=10)
-
 # ---------------- MODEL HEALTH ----------------
-async def call_groq_with_health(prompt, temperature=0.7, mode: str = "", model_override: str | None = None):
+NO_THINK_INSTRUCTION = (
+	"IMPORTANT: Return only the final user-facing answer. "
+	"Do not include chain-of-thought, reasoning, or any <think> tags."
+)
+
+async def call_groq_with_health(prompt, temperature=0.7, mode: str = "", model_override: str | None = None, site: str | None = None):
 	"""
-	Handles calling Groq with automatic fallback when primary model is overloaded.
-	Tries PRIMARY_MODEL first, falls back to FALLBACK_MODEL on 503 errors.
+	Calls a chat model through llm_gateway, which picks the healthiest backend
+	serving it and fails over between providers. Without model_override the
+	request goes to PRIMARY_MODEL with FALLBACK_MODEL behind it. The
+	generation profile is the mode's chat profile unless site is given.
 	"""
-	global PRIMARY_COOLDOWN_UNTIL
-	
-	# Check if Primary model is in cooldown - if yes, use fallback directly
-	if model_override:
-		model = model_override
-	elif PRIMARY_COOLDOWN_UNTIL and datetime.utcnow() < PRIMARY_COOLDOWN_UNTIL:
-		print(f"[GROQ] Primary model in cooldown until {PRIMARY_COOLDOWN_UNTIL.isoformat()}, using fallback")
-		model = FALLBACK_MODEL
-	else:
-		model = PRIMARY_MODEL
-
-	try:
-		if model == "qwen/qwen3-32b":
-			prompt = (
-				f"{prompt}\n\n"
-				"IMPORTANT: Return only the final user-facing answer. "
-				"Do not include chain-of-thought, reasoning, or any <think> tags."
-			)
-		return await call_groq(
-			prompt=prompt,
-			model=model,
-			temperature=temperature,
-		)
-
-	except Exception as e:
-		msg = str(e)
-
-		# Handle Primary model overload - switch to fallback
-		if model == PRIMARY_MODEL and ("503" in msg or "over capacity" in msg):
-			PRIMARY_COOLDOWN_UNTIL = datetime.utcnow() + PRIMARY_COOLDOWN_DURATION
-			print(
-				f"[GROQ] Primary model overloaded — "
-				f"cooling down until {PRIMARY_COOLDOWN_UNTIL.isoformat()}, "
-				f"using fallback model"
-			)
-			
-			# Retry with fallback model
-			try:
-				return await call_groq(
-					prompt=prompt,
-					model=FALLBACK_MODEL,
-					temperature=temperature,
-				)
-			except Exception as fallback_error:
-				print(f"[GROQ] Fallback model also failed: {fallback_error}")
-				raise fallback_error
+	model = model_override or PRIMARY_MODEL
+	fallbacks = () if model_override else (FALLBACK_MODEL,)
+
+	if model == "qwen/qwen3-32b":
+		prompt = chat_messages.add_instruction(prompt, NO_THINK_INSTRUCTION)
+
+	return await llm_gateway.complete(
+		prompt,
+		model=model,
+		temperature=temperature,
+		fallbacks=fallbacks,
+		hedge=True,
+		site=site or generation_profiles.chat_site(mode),
+	)
 
-		raise e
+# ---------------- AUTO MODEL ROUTING ----------------
+def reply_depth(message, limit: int = 3) -> int:
+	"""How many replies deep a message sits, following only references discord.py already resolved."""
+	depth = 0
+	ref = message.reference
+	while ref is not None and depth < limit:
+		depth += 1
+		resolved = ref.resolved
+		ref = resolved.reference if isinstance(resolved, discord.Message) else None
+	return depth
+
+def pick_chat_model(chan_id, text, mode, message=None, attachments: int = 0):
+	"""
+	The channel's chat model. Channels set to "auto" get a model picked for
+	this message by model_router; the route is returned alongside so the
+	caller can report latency for its bucket, and is None otherwise.
+	"""
+	selected_model = memory.get_channel_model(chan_id)
+	if selected_model != model_router.AUTO_MODEL:
+		return selected_model, None
+	route = model_router.route(
+		text,
+		mode,
+		attachments=attachments,
+		reply_depth=reply_depth(message) if message is not None else 0,
+	)
+	return route.model, route
 
 # ---------------- CODUNOT SELF IMAGE PROMPT ----------------
 CODUNOT_SELF_IMAGE_PROMPT = (
@@ -715,18 +730,20 @@ def load_vote_unlocks():
 		user_vote_unlocks = {}
 		return
 	try:
-		raw = load_encrypted(VOTE_FILE)
-		data = json.loads(raw)
+		data = load_records(VOTE_FILE)
 		user_vote_unlocks = {int(k): v for k, v in data.items()}
 	except Exception as e:
 		print(f"[VOTE] Failed to load vote unlocks: {e}")
 		user_vote_unlocks = {}
 
 def save_vote_unlocks():
-	try:
-		save_encrypted(VOTE_FILE, json.dumps(user_vote_unlocks))
-	except Exception as e:
-		print(f"[VOTE] Failed to save vote unlocks: {e}")
+	persistence.mark_dirty("vote_unlocks")
+
+def _snapshot_vote_unlocks():
+	records = encode_records(user_vote_unlocks)
+	return lambda: write_records(VOTE_FILE, records)
+
+persistence.register("vote_unlocks", _snapshot_vote_unlocks)
 
 def cleanup_expired_votes():
 	now = time.time()
@@ -819,8 +836,6 @@ async def require_vote(message) -> None:
 	is_dm = isinstance(message.channel, discord.DMChannel)
 	chan_id = f"dm_{message.author.id}" if is_dm else str(message.channel.id)
 	
-	channel_memory.setdefault(chan_id, deque(maxlen=MAX_MEMORY))
-	channel_memory[chan_id].append(f"{BOT_NAME}: {vote_message}")
 	memory.add_message(chan_id, BOT_NAME, vote_message)
 	memory.persist()
 
@@ -839,20 +854,14 @@ def format_duration(num: int, unit: str) -> str:
 	name = units.get(unit, "minute")
 	return f"{num} {name}s" if num > 1 else f"1 {name}"
 
-async def send_long_message(channel, text):
-	max_len = 2000
+def split_message(text, max_len=2000) -> list[str]:
+	"""Split text into Discord-sized chunks, preferring newline or space boundaries."""
 	remaining = str(text or "")
+	chunks = []
 
 	while remaining:
 		if len(remaining) <= max_len:
-			try:
-				await channel.send(remaining)
-			except discord.errors.Forbidden:
-				print(f"[PERMISSION ERROR] Cannot send message in channel {channel.id} - Missing Permissions")
-				return
-			except Exception as e:
-				print(f"[SEND ERROR] {e}")
-				return
+			chunks.append(remaining)
 			break
 
 		newline_idx = remaining.rfind("\n", 0, max_len)
@@ -864,9 +873,13 @@ async def send_long_message(channel, text):
 		else:
 			split_at += 1
 
-		chunk = remaining[:split_at]
+		chunks.append(remaining[:split_at])
 		remaining = remaining[split_at:]
-		
+
+	return chunks
+
+async def send_long_message(channel, text):
+	for chunk in split_message(text):
 		try:
 			await channel.send(chunk)
 		except discord.errors.Forbidden:
@@ -916,6 +929,21 @@ def sanitize_model_output(text: str, model_name: str | None = None) -> str:
 		return _strip_thinking_blocks(text)
 	return text
 	
+def resolve_mentions(channel, text: str) -> str:
+	"""Turn @username in model output into real mentions for members of the guild."""
+	if not (hasattr(channel, "guild") and channel.guild):
+		return text
+
+	def replace_mention(match):
+		username = match.group(1).strip().lower()
+		for member in channel.guild.members:
+			if (member.name.lower() == username or
+				member.display_name.lower() == username):
+				return member.mention
+		return match.group(0)
+
+	return re.sub(r'@([\w][\w\s]*\w|[\w]+)', replace_mention, text)
+
 async def send_human_reply(channel, reply_text):
 	if hasattr(channel, "trigger_typing"):
 		try:
@@ -925,16 +953,7 @@ async def send_human_reply(channel, reply_text):
 		except:
 			pass
 
-	if hasattr(channel, "guild") and channel.guild:
-		def replace_mention(match):
-			username = match.group(1).strip().lower()
-			for member in channel.guild.members:
-				if (member.name.lower() == username or
-					member.display_name.lower() == username):
-					return member.mention
-			return match.group(0)
-
-		reply_text = re.sub(r'@([\w][\w\s]*\w|[\w]+)', replace_mention, reply_text)
+	reply_text = resolve_mentions(channel, reply_text)
 
 	try:
 		await send_long_message(channel, reply_text)
@@ -943,6 +962,196 @@ async def send_human_reply(channel, reply_text):
 	except Exception as e:
 		print(f"[SEND ERROR] {e}")
 
+# ---------------- STREAMING REPLIES ----------------
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "1") != "0"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.2"))
+
+# Time from starting the request to the first visible text in the channel
+_ttfvt_samples = deque(maxlen=200)
+
+class ThinkBlockFilter:
+	"""
+	Streaming counterpart of _strip_thinking_blocks. Drops text inside
+	<think>...</think> and stray think tags; a chunk that ends in what may be
+	the start of a tag keeps that tail back until the next chunk arrives. A
+	block that is never closed is released on flush(), as the batch version
+	would leave it in.
+	"""
+	OPEN = "<think>"
+	CLOSE = "</think>"
+
+	def __init__(self):
+		self.inside = False
+		self.pending = ""
+		self.hidden = []
+
+	def _held_tail(self, lower: str) -> int:
+		start = lower.rfind("<", max(0, len(lower) - len(self.CLOSE) + 1))
+		if start == -1:
+			return 0
+		tail = lower[start:]
+		if self.OPEN.startswith(tail) or self.CLOSE.startswith(tail):
+			return len(tail)
+		return 0
+
+	def feed(self, chunk: str) -> str:
+		text = self.pending + chunk
+		self.pending = ""
+		out = []
+		while text:
+			lower = text.lower()
+			if self.inside:
+				idx, tag = lower.find(self.CLOSE), self.CLOSE
+			else:
+				open_idx = lower.find(self.OPEN)
+				close_idx = lower.find(self.CLOSE)
+				if close_idx != -1 and (open_idx == -1 or close_idx < open_idx):
+					idx, tag = close_idx, self.CLOSE
+				else:
+					idx, tag = open_idx, self.OPEN
+
+			if idx == -1:
+				held = self._held_tail(lower)
+				(self.hidden if self.inside else out).append(text[:len(text) - held])
+				self.pending = text[len(text) - held:]
+				break
+
+			(self.hidden if self.inside else out).append(text[:idx])
+			if tag == self.CLOSE:
+				self.hidden.clear()
+			self.inside = tag == self.OPEN
+			text = text[idx + len(tag):]
+		return "".join(out)
+
+	def flush(self) -> str:
+		tail = self.pending
+		if self.inside:
+			tail = re.sub(r"</?think>", "", "".join(self.hidden) + tail, flags=re.IGNORECASE)
+		self.pending = ""
+		self.hidden.clear()
+		return tail
+
+class StreamingReply:
+	"""
+	Posts a reply while the model is still writing it. The first message is
+	sent as soon as there is visible text, later text is added by editing at
+	most every STREAM_EDIT_INTERVAL seconds, and a new message is started when
+	the current one would pass Discord's 2000 character limit.
+	"""
+
+	def __init__(self, channel):
+		self.channel = channel
+		self.text = ""
+		self.messages = []
+		self.shown = []
+		self.created = time.perf_counter()
+		self.first_visible = None
+		self.last_sync = 0.0
+		self.failed = False
+
+	@property
+	def started(self) -> bool:
+		return bool(self.messages)
+
+	async def feed(self, delta: str):
+		self.text += delta
+		if self.failed:
+			return
+		if not self.messages:
+			if self.text.strip():
+				await self._sync(self.text.strip())
+				if self.messages:
+					self.first_visible = time.perf_counter() - self.created
+			return
+		if time.perf_counter() - self.last_sync >= STREAM_EDIT_INTERVAL:
+			await self._sync(self.text.strip())
+
+	async def finish(self, final_text: str, model: str = ""):
+		if not self.failed:
+			await self._sync(final_text, final=True)
+
+		total = time.perf_counter() - self.created
+		if self.first_visible is not None:
+			_ttfvt_samples.append(self.first_visible)
+			ordered = sorted(_ttfvt_samples)
+			p50 = ordered[len(ordered) // 2]
+			print(
+				f"[STREAM] ttfvt={self.first_visible:.2f}s total={total:.2f}s "
+				f"chars={len(final_text)} messages={len(self.messages)} model={model} "
+				f"| ttfvt p50={p50:.2f}s over {len(ordered)}"
+			)
+
+	async def _sync(self, text: str, final: bool = False):
+		"""Make the posted messages show text, editing only the chunks that changed."""
+		self.last_sync = time.perf_counter()
+		chunks = [chunk for chunk in split_message(text) if chunk.strip()]
+		try:
+			for i, chunk in enumerate(chunks):
+				if i < len(self.messages):
+					if self.shown[i] != chunk:
+						await self.messages[i].edit(content=chunk)
+						self.shown[i] = chunk
+				else:
+					self.messages.append(await self.channel.send(chunk))
+					self.shown.append(chunk)
+
+			if final:
+				while len(self.messages) > len(chunks):
+					await self.messages.pop().delete()
+					self.shown.pop()
+		except discord.errors.Forbidden:
+			print(f"[PERMISSION ERROR] Cannot send message in channel {self.channel.id} - Missing Permissions")
+			self.failed = True
+		except Exception as e:
+			print(f"[STREAM SEND ERROR] {e}")
+			self.failed = True
+
+def finalize_reply(response: str, mode: str) -> str:
+	if mode == "funny":
+		return humanize_and_safeify(response)
+	reply = response.strip()
+	if reply and not reply.endswith(('.', '!', '?')):
+		reply += '.'
+	return reply
+
+async def stream_chat_reply(channel, prompt, model, mode, temperature=0.7) -> str | None:
+	"""
+	Stream a chat completion straight into the channel.
+
+	Returns the finished reply once it is posted, or None if no visible text
+	arrived, in which case nothing was sent and the caller should use the
+	non-streaming path instead.
+	"""
+	think_filter = None
+	if model == "qwen/qwen3-32b":
+		prompt = chat_messages.add_instruction(prompt, NO_THINK_INSTRUCTION)
+		think_filter = ThinkBlockFilter()
+
+	if not llm_gateway.available("groq", model):
+		return None
+
+	sink = StreamingReply(channel)
+	try:
+		async for delta in stream_groq(prompt, model=model, temperature=temperature, site=generation_profiles.chat_site(mode)):
+			if think_filter:
+				delta = think_filter.feed(delta)
+			if delta:
+				await sink.feed(delta)
+		if think_filter:
+			tail = think_filter.flush()
+			if tail:
+				await sink.feed(tail)
+	except Exception as e:
+		print(f"[STREAM ERROR] {e}")
+
+	llm_gateway.record("groq", model, time.perf_counter() - sink.created, sink.started)
+	if not sink.started:
+		return None
+
+	reply = finalize_reply(sink.text, mode) or choose_fallback(mode)
+	await sink.finish(resolve_mentions(channel, reply), model)
+	return reply
+
 async def build_reply_context(message):
 	"""
 	If the message is a Discord reply, return extra metadata that is appended
@@ -1237,45 +1446,90 @@ def choose_fallback(mode: str = "funny") -> str:
 	variants = FALLBACK_VARIANTS.get(mode, FALLBACK_VARIANTS["funny"])
 	return random.choice(variants)
 
-def build_general_prompt(chan_id, mode, message, include_last_image=False):
-	mem = channel_memory.get(chan_id, deque())
-	history_text = "\n".join(mem) if mem else "No previous messages."
+HISTORY_RULE = (
+	"The earlier turns are this channel's recent history. Your own past replies are the assistant turns; "
+	"user turns hold everyone else's messages as 'name: message'.\n"
+	"CRITICAL: When user asks 'what did I ask previously' or 'previous question', or anything that refers to previous messages of the user, "
+	f"look at the user turns, not your own ({BOT_NAME}) replies."
+)
 
-	last_img_info = ""
-	if include_last_image:
-		last_img_info = "\nNote: The user has previously requested an image in this conversation."
+ROAST_RULES = (
+	"IMPORTANT: Read the conversation history carefully.\n"
+	"If the user is replying to something, respond to THAT specific thing.\n"
+	"If the user says 'wdym', 'what', 'huh' etc — roast them FOR being confused, referencing exactly what you said before.\n"
+	"NEVER break character. NEVER explain yourself normally. ALWAYS stay in roast mode.\n"
+	"Generate ONE savage roast response."
+)
 
-	persona_text = PERSONAS.get(mode, PERSONAS["funny"])
-	
-	return (
-		f"{persona_text}\n\n"
-		f"{BOT_CAPABILITIES_PROMPT}\n\n"
-		f"=== CONVERSATION HISTORY ===\n"
-		f"{history_text}\n"
-		f"=== END HISTORY ===\n"
-		f"{last_img_info}\n\n"
-		f"CRITICAL: When user asks 'what did I ask previously' or 'previous question', or anything that refers to previous messages of the user, "
-		f"look at messages NOT labeled '{BOT_NAME}:' in the history above.\n\n"
-		f"Reply as Codunot:"
-	)
+_system_prompts = {}
 
-def build_roast_prompt(chan_id, user_message, reply_context=""):
-	mem = channel_memory.get(chan_id, deque())
-	history_text = "\n".join(mem) if mem else "No previous messages."
-	
-	return (
-		PERSONAS["roast"] + "\n\n"
-		+ BOT_CAPABILITIES_PROMPT + "\n\n"
-		f"=== CONVERSATION HISTORY ===\n"
-		f"{history_text}\n"
-		f"=== END HISTORY ===\n\n"
-		+ (f"{reply_context}\n" if reply_context else "")
-		+ f"IMPORTANT: Read the conversation history above carefully.\n"
-		f"If the user is replying to something, respond to THAT specific thing.\n"
-		f"If the user says 'wdym', 'what', 'huh' etc — roast them FOR being confused, referencing exactly what you said before.\n"
-		f"NEVER break character. NEVER explain yourself normally. ALWAYS stay in roast mode.\n\n"
-		f"User's latest message: '{user_message}'\n"
-		f"Generate ONE savage roast response."
+def system_prompt(mode: str) -> str:
+	"""
+	The system message for a mode: persona, capabilities and rules. It is
+	built once per mode and never includes anything per-channel, so every
+	request in that mode starts with the same bytes and the provider can
+	reuse its cached prefix.
+	"""
+	text = _system_prompts.get(mode)
+	if text is None:
+		persona = PERSONAS.get(mode, PERSONAS["funny"])
+		text = f"{persona}\n\n{BOT_CAPABILITIES_PROMPT}\n\n{HISTORY_RULE}"
+		if mode == "roast":
+			text += f"\n\n{ROAST_RULES}"
+		_system_prompts[mode] = text
+	return text
+
+def history_messages(chan_id, model=None) -> list[dict]:
+	"""
+	The channel history as alternating user/assistant turns, within the
+	history budget of model, the model the reply will actually use. Channels
+	on "auto" should pass the routed model.
+	"""
+	history = memory.get_history(chan_id)
+	if not history:
+		return []
+	model = model or memory.get_channel_model(chan_id)
+	budget = history_token_budget(model)
+	entries = history.entries(token_budget=budget)
+
+	# Lines already out of the window but not folded into the summary yet,
+	# newest first, in whatever budget the window left over.
+	remaining = budget - history.total_tokens
+	carried = []
+	for line in reversed(memory.get_unsummarized(chan_id)):
+		remaining -= chat_messages.estimate_tokens(line)
+		if remaining < 0:
+			break
+		author, _, text = line.partition(": ")
+		carried.append((author, text))
+	return chat_messages.history_turns(list(reversed(carried)) + entries, BOT_NAME)
+
+def build_general_prompt(chan_id, mode, message, include_last_image=False, model=None):
+	"""
+	Role-separated prompt for a chat reply: the fixed system message first,
+	then per-channel context (summary) in a second system message, then the
+	history turns, sized for model. Callers add the current turn with
+	chat_messages.add_user_turn.
+	"""
+	messages = [{"role": "system", "content": system_prompt(mode)}]
+
+	context = []
+	summary = memory.get_summary(chan_id)
+	if summary:
+		context.append(f"=== EARLIER IN THIS CONVERSATION (summary) ===\n{summary}")
+	if include_last_image:
+		context.append("Note: The user has previously requested an image in this conversation.")
+	if context:
+		messages.append({"role": "system", "content": "\n\n".join(context)})
+
+	return messages + history_messages(chan_id, model)
+
+def build_roast_prompt(chan_id, user_message, reply_context="", model=None):
+	messages = [{"role": "system", "content": system_prompt("roast")}] + history_messages(chan_id, model)
+	return chat_messages.add_user_turn(
+		messages,
+		(f"{reply_context}\n" if reply_context else "")
+		+ f"User's latest message: '{user_message}'",
 	)
 
 async def handle_roast_mode(chan_id, message, user_message):
@@ -1284,16 +1538,22 @@ async def handle_roast_mode(chan_id, message, user_message):
 		return
 	
 	reply_context = await build_reply_context(message)
-	prompt = build_roast_prompt(chan_id, user_message, reply_context=reply_context)
+	selected_model, route = pick_chat_model(chan_id, user_message, "roast", message, len(message.attachments))
+	prompt = build_roast_prompt(chan_id, user_message, reply_context=reply_context, model=selected_model)
 	
-	selected_model = memory.get_channel_model(chan_id)
-	raw = await call_groq(prompt, model=selected_model, temperature=1.3)
+	generate_started = time.perf_counter()
+	try:
+		raw = await llm_gateway.complete(prompt, model=selected_model, temperature=1.3, hedge=True, site="fun_chat")
+	except Exception as e:
+		print(f"[ROAST ERROR] {e}")
+		raw = None
+	if route:
+		model_router.record(route, chan_id, time.perf_counter() - generate_started, bool(raw))
 	raw = sanitize_model_output(raw, selected_model)
 	reply = raw.strip() if raw else choose_fallback("roast")
 	if reply and not reply.endswith(('.', '!', '?')):
 		reply += '.'
 	await send_human_reply(message.channel, reply)
-	channel_memory[chan_id].append(f"{BOT_NAME}: {reply}")
 	memory.add_message(chan_id, BOT_NAME, reply)
 	memory.persist()
 	await maybe_send_promo_message(message.channel, chan_id)
@@ -1303,126 +1563,297 @@ async def handle_rizz_message(chan_id, message, mode):
 	if guild_id is not None and not await can_send_in_guild(guild_id):
 		return
 
-	mem = channel_memory.get(chan_id, deque())
-	history_text = "\n".join(mem) if mem else "No previous messages."
-
-	persona = PERSONAS.get(mode, PERSONAS["rizz_online"])
-
-	prompt = (
-		f"{persona}\n\n"
-		f"{BOT_CAPABILITIES_PROMPT}\n\n"
-		f"=== CONVERSATION HISTORY ===\n"
-		f"{history_text}\n"
-		f"=== END HISTORY ===\n\n"
-		f"User says:\n{message.content}\n\nReply:"
+	if mode not in PERSONAS:
+		mode = "rizz_online"
+	selected_model, route = pick_chat_model(chan_id, message.content, mode, message, len(message.attachments))
+	prompt = chat_messages.add_user_turn(
+		[{"role": "system", "content": system_prompt(mode)}] + history_messages(chan_id, selected_model),
+		f"User says:\n{message.content}",
 	)
 
+	generate_started = time.perf_counter()
 	try:
-		selected_model = memory.get_channel_model(chan_id)
 		response = await call_groq_with_health(prompt, temperature=0.85, mode=mode, model_override=selected_model)
 		response = sanitize_model_output(response, selected_model)
 	except Exception as e:
 		print(f"[RIZZ ERROR] {e}")
 		response = None
+	if route:
+		model_router.record(route, chan_id, time.perf_counter() - generate_started, bool(response))
 
 	reply = response.strip() if response else choose_fallback(mode)
 
 	await send_human_reply(message.channel, reply)
 
-	channel_memory.setdefault(chan_id, deque(maxlen=MAX_MEMORY))
-	channel_memory[chan_id].append(f"{BOT_NAME}: {reply}")
 	memory.add_message(chan_id, BOT_NAME, reply)
 	memory.persist()
 	await maybe_send_promo_message(message.channel, chan_id)
 
+# ---------------- REPLY PIPELINE ----------------
+# Upper bound per pre-generation stage; a stage that runs over is treated as empty.
+STAGE_TIMEOUTS = {
+	"reply_context": 5.0,
+	"search_decider": 6.0,
+	"web_search": 10.0,
+	"url_fetch": 10.0,
+}
+
+async def run_stage(timings: dict, name: str, coro, default=""):
+	"""Await one pipeline stage under its timeout and record how long it took."""
+	started = time.perf_counter()
+	try:
+		return await asyncio.wait_for(coro, STAGE_TIMEOUTS[name])
+	except asyncio.TimeoutError:
+		print(f"[PIPELINE] {name} timed out after {STAGE_TIMEOUTS[name]:.0f}s")
+		return default
+	except asyncio.CancelledError:
+		name = f"{name} (cancelled)"
+		raise
+	except Exception as e:
+		print(f"[PIPELINE] {name} failed: {e}")
+		return default
+	finally:
+		timings[name] = time.perf_counter() - started
+
+async def web_search_stage(timings: dict, content: str) -> str:
+	"""
+	Decide whether the message needs a web search and run it. When the
+	decider has to go to the network, the search starts alongside it and is
+	cancelled if the answer is no.
+	"""
+	decider = asyncio.create_task(should_search_web(content))
+	# One loop turn lets a local or cached decision finish without any I/O.
+	await asyncio.sleep(0)
+
+	search = None
+	if not decider.done():
+		search = asyncio.create_task(run_stage(timings, "web_search", search_web_context(content)))
+
+	try:
+		needed = await run_stage(timings, "search_decider", decider, False)
+	except asyncio.CancelledError:
+		if search:
+			search.cancel()
+		raise
+
+	if not needed:
+		if search:
+			search.cancel()
+		return ""
+
+	if search is None:
+		search = run_stage(timings, "web_search", search_web_context(content))
+	search_context = await search
+	return search_context or "[Web search attempted but returned no results - use your knowledge base]"
+
+async def fetch_url_stage(content: str) -> str:
+	url_match = re.search(r'https?://[^\s<>"\']+', content)
+	if not url_match:
+		return ""
+	from slash_commands import fetch_url_content  # lazy import to avoid circular dependency
+	extracted = await fetch_url_content(url_match.group(0), max_chars=1500)
+	if extracted and not extracted.startswith("❌"):
+		return extracted
+	return ""
+
+def log_stage_timings(chan_id, timings: dict, started: float):
+	stages = " | ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items())
+	print(f"[PIPELINE] {chan_id}: {stages} | total {(time.perf_counter() - started) * 1000:.0f} ms")
+
 async def generate_and_reply(chan_id, message, content, mode):
 	guild_id = message.guild.id if message.guild else None
 	if guild_id is not None and not await can_send_in_guild(guild_id):
 		return
-	
-	# ---------------- CHECK FOR REPLY CONTEXT ----------------
-	reply_context = await build_reply_context(message)
 
-	search_context = ""
-	if await should_search_web(content):
-		search_context = await search_web_context(content)
+	started = time.perf_counter()
+	timings = {}
 
-		if not search_context:
-			search_context = "[Web search attempted but returned no results - use your knowledge base]"
-
-	# ---------------- FETCH URL CONTENT IF USER SHARED A LINK ----------------
-	url_context = ""
-	url_match = re.search(r'https?://[^\s<>"\']+', content)
-	if url_match:
-		from slash_commands import fetch_url_content  # lazy import to avoid circular dependency
-		try:
-			extracted = await fetch_url_content(url_match.group(0), max_chars=1500)
-			if extracted and not extracted.startswith("❌"):
-				url_context = extracted
-		except Exception as e:
-			print(f"[URL FETCH ERROR] {e}")
+	# ---------------- REPLY CONTEXT, WEB SEARCH AND LINKS, CONCURRENTLY ----------------
+	reply_context, search_context, url_context = await asyncio.gather(
+		run_stage(timings, "reply_context", build_reply_context(message)),
+		web_search_stage(timings, content),
+		run_stage(timings, "url_fetch", fetch_url_stage(content)),
+	)
 
-	prompt = (
-		build_general_prompt(chan_id, mode, message, include_last_image=False)
-		+ (f"\n=== WEB SEARCH CONTEXT ===\n{search_context}\n=== END WEB SEARCH CONTEXT ===\n" if search_context else "")
-		+ (f"\n=== WEBPAGE CONTENT ===\n{url_context}\n=== END WEBPAGE CONTENT ===\n" if url_context else "")
+	selected_model, route = pick_chat_model(chan_id, content, mode, message, len(message.attachments))
+	prompt_started = time.perf_counter()
+	# Per-message context goes in the last user turn, after the stable prefix.
+	prompt = chat_messages.add_user_turn(
+		build_general_prompt(chan_id, mode, message, include_last_image=False, model=selected_model),
+		(f"=== WEB SEARCH CONTEXT ===\n{search_context}\n=== END WEB SEARCH CONTEXT ===\n\n" if search_context else "")
+		+ (f"=== WEBPAGE CONTENT ===\n{url_context}\n=== END WEBPAGE CONTENT ===\n\n" if url_context else "")
 		+ reply_context
-		+ f"\nUser says:\n{content}\n\nReply:"
+		+ f"User says:\n{content}"
 	)
+	timings["prompt"] = time.perf_counter() - prompt_started
 	
-	# ---------------- GENERATE RESPONSE ----------------
+	reply = None
+	response = None
+	generate_started = time.perf_counter()
+
 	try:
-		selected_model = memory.get_channel_model(chan_id)
-		response = await call_groq_with_health(prompt, temperature=0.7, mode=mode, model_override=selected_model)
-		response = sanitize_model_output(response, selected_model)
+		async with admission.slot("chat"):
+			# ---------------- STREAM RESPONSE ----------------
+			if STREAM_REPLIES:
+				reply = await stream_chat_reply(message.channel, prompt, selected_model, mode, temperature=0.7)
+
+			# ---------------- GENERATE RESPONSE ----------------
+			if reply is None:
+				response = await call_groq_with_health(prompt, temperature=0.7, mode=mode, model_override=selected_model)
+				response = sanitize_model_output(response, selected_model)
 	except Exception as e:
 		print(f"[API ERROR] {e}")
-		response = None
-	
-	# ---------------- HUMANIZE / SAFEIFY ----------------
-	if response:
-		if mode == "funny":
-			reply = humanize_and_safeify(response)
-		else:
-			reply = response.strip()
-			if reply and not reply.endswith(('.', '!', '?')):
-				reply += '.'
-	else:
-		reply = choose_fallback(mode)
-	
-	# ---------------- SEND REPLY ----------------
-	await send_human_reply(message.channel, reply)
+	if route:
+		model_router.record(route, chan_id, time.perf_counter() - generate_started, reply is not None or bool(response))
+
+	if reply is None:
+		# ---------------- HUMANIZE / SAFEIFY ----------------
+		reply = finalize_reply(response, mode) if response else choose_fallback(mode)
+
+		# ---------------- SEND REPLY ----------------
+		await send_human_reply(message.channel, reply)
+	timings["generate"] = time.perf_counter() - generate_started
+	log_stage_timings(chan_id, timings, started)
 	
 	# ---------------- SAVE TO MEMORY ----------------
-	channel_memory.setdefault(chan_id, deque(maxlen=MAX_MEMORY))
-	channel_memory[chan_id].append(f"{BOT_NAME}: {reply}")
 	memory.add_message(chan_id, BOT_NAME, reply)
 	memory.persist()
 	
 	# ---------------- PROMOTIONAL MESSAGE ----------------
 	await maybe_send_promo_message(message.channel, chan_id)
 
+# ---------------- MENTION BURSTS ----------------
+BURST_MARKER = re.compile(r"\[\[(\d+)\]\]")
+
+async def handle_mention_batch(chan_id, items):
+	"""
+	Answer a channel's queued mentions: one alone goes the normal way, several
+	share one call. The batch runs in whichever context opened its window, so
+	the admission tier is set here from the batch's own messages.
+	"""
+	if len(items) == 1:
+		admission.set_tier(get_tier_from_message(items[0][0]))
+		await generate_and_reply(chan_id, *items[0])
+		return
+	await generate_burst_reply(chan_id, items)
+
+async def send_routed_reply(message, reply_text):
+	"""Reply to one specific message, continuing in the channel past 2000 characters."""
+	chunks = split_message(resolve_mentions(message.channel, reply_text))
+	try:
+		await message.reply(chunks[0], mention_author=False)
+		for chunk in chunks[1:]:
+			await message.channel.send(chunk)
+	except discord.errors.Forbidden:
+		print(f"[PERMISSION ERROR] Cannot send message in channel {message.channel.id} - Missing Permissions")
+	except Exception as e:
+		print(f"[SEND ERROR] {e}")
+
+async def generate_burst_reply(chan_id, items):
+	"""
+	Answer several mentions that arrived together with one LLM call. The model
+	numbers its answers [[1]], [[2]], ... and each one goes back as a reply to
+	its own message. Any it skipped are answered one by one afterwards.
+	"""
+	first_message = items[0][0]
+	mode = items[-1][2]
+	guild_id = first_message.guild.id if first_message.guild else None
+	if guild_id is not None and not await can_send_in_guild(guild_id):
+		return
+
+	# One call answers everyone, so it queues at the best tier among them.
+	admission.set_tier(admission.top_tier(get_tier_from_message(message) for message, _, _ in items))
+	started = time.perf_counter()
+	questions = "\n".join(
+		f"[{i}] {message.author.display_name}: {content}"
+		for i, (message, content, _) in enumerate(items, start=1)
+	)
+	selected_model, route = pick_chat_model(chan_id, questions, mode)
+	base_prompt = build_general_prompt(chan_id, mode, first_message, include_last_image=False, model=selected_model)
+	prompt = chat_messages.add_user_turn(
+		base_prompt,
+		"=== SEVERAL PEOPLE ARE TALKING TO YOU AT ONCE ===\n"
+		+ f"{questions}\n"
+		+ "=== END ===\n\n"
+		+ "Answer each of them separately, in order. Start each answer with its number "
+		"in double brackets, like [[1]], on its own line, and write nothing before [[1]]."
+	)
+
+	generate_started = time.perf_counter()
+	try:
+		response = await call_groq_with_health(prompt, temperature=0.7, mode=mode, model_override=selected_model, site="burst_chat")
+		response = sanitize_model_output(response, selected_model)
+	except Exception as e:
+		print(f"[BURST ERROR] {e}")
+		response = None
+	if route:
+		model_router.record(route, chan_id, time.perf_counter() - generate_started, bool(response))
+
+	answers = {}
+	if response:
+		parts = BURST_MARKER.split(response)
+		for number, text in zip(parts[1::2], parts[2::2]):
+			index = int(number) - 1
+			if 0 <= index < len(items) and text.strip() and index not in answers:
+				answers[index] = text.strip()
+
+	leftovers = []
+	for index, (message, content, item_mode) in enumerate(items):
+		if index not in answers:
+			leftovers.append((message, content, item_mode))
+			continue
+		reply = finalize_reply(answers[index], mode)
+		await send_routed_reply(message, reply)
+		memory.add_message(chan_id, BOT_NAME, f"@{message.author.display_name} {reply}")
+	memory.persist()
+
+	saved = chat_messages.estimate_tokens(base_prompt) * (len(answers) - 1) if answers else 0
+	print(
+		f"[BURST] {chan_id}: {len(answers)}/{len(items)} mentions answered by one call "
+		f"in {(time.perf_counter() - started) * 1000:.0f} ms, ~{saved} prompt tokens saved"
+	)
+
+	# Shed, failed or unparseable: answer the rest the normal way, in order.
+	for item in leftovers:
+		admission.set_tier(get_tier_from_message(item[0]))
+		await generate_and_reply(chan_id, *item)
+
+	if answers:
+		await maybe_send_promo_message(first_message.channel, chan_id)
+
+mention_batcher = BurstBatcher(handle_mention_batch)
+
+# Both deciders run at temperature 0, so their answers are cached by normalized text.
+web_search_cache = classifier_cache.ClassifierCache("web_search")
+image_action_cache = classifier_cache.ClassifierCache("image_action")
+
 async def should_search_web(user_text: str) -> bool:
 	"""Ask the model if fresh web data is likely needed for this user query."""
 	if not user_text.strip():
 		return False
 
-	classifier_prompt = (
-		"You are a strict classifier. Answer ONLY YES or NO.\n"
-		"Should this query use live web search for freshness/current events/factual lookup?\n"
-		"Search is useful for latest news, current leaders, recent updates, rankings, dates, and changing facts.\n"
-		"Search is not needed for opinions, casual chat, coding help, writing, or timeless explanations.\n\n"
-		f"Query: {user_text}\n"
-		"Answer:"
-	)
+	# The local model settles clear cases; the LLM only sees the ones it is unsure about.
+	verdict = intent_classifier.web_search.decide(user_text)
+	if verdict is not None:
+		return verdict
 
-	try:
-		decision = await call_groq(
-			prompt=classifier_prompt,
+	classifier_prompt = intent_classifier.web_search_prompt(user_text)
+
+	async def ask():
+		decision = await llm_gateway.complete(
+			classifier_prompt,
 			model="llama-3.3-70b-versatile",
 			temperature=0.0,
+			hedge=True,
+			kind="classifier",
+			site="classifier",
 		)
-		return (decision or "").strip().upper().startswith("YES")
+		if decision is None:
+			raise RuntimeError("decider returned no answer")
+		return decision.strip().upper().startswith("YES")
+
+	try:
+		return await web_search_cache.get_or_compute(user_text, ask)
 	except Exception as e:
 		print(f"[WEB SEARCH DECIDER ERROR] {e}")
 		return False
@@ -1622,7 +2053,8 @@ async def handle_image_message(message, mode):
 	try:
 		persona = PERSONAS.get(mode, PERSONAS["serious"])
 		selected_model = memory.get_channel_model(chan_id)
-		if selected_model != IMAGE_REQUIRED_MODEL:
+		# "auto" channels read images with Llama 4 Scout and route the answer per message.
+		if selected_model not in (IMAGE_REQUIRED_MODEL, model_router.AUTO_MODEL):
 			return (
 				"🖼️ For image analysis, please switch this chat model to **Llama 4 Scout** first.\n"
 				"Use `/model` and select `meta-llama/llama-4-scout-17b-16e-instruct`, then send the image again."
@@ -1645,7 +2077,8 @@ async def handle_image_message(message, mode):
 			prompt=ocr_prompt,
 			model=IMAGE_REQUIRED_MODEL,
 			image_bytes=image_bytes,
-			temperature=0.1
+			temperature=0.1,
+			site="vision_ocr",
 		)
 
 		user_request = (message.content or "").strip()
@@ -1661,25 +2094,36 @@ async def handle_image_message(message, mode):
 
 		# If OCR produced usable text, answer using the selected channel chat model.
 		if extracted_text and extracted_text.upper() != "NO_TEXT":
-			final_prompt = (
-				f"{persona}\n"
-				"The user sent an image. OCR text was extracted below.\n"
-				"Use this extracted text as the primary source and answer the user request directly.\n"
-				"If OCR contains [unclear], mention that limitation clearly.\n\n"
-				f"Extracted OCR text:\n{extracted_text}\n\n"
-				f"User request:\n{user_request}\n\n"
-				"Final answer:"
-			)
-
+			final_prompt = [
+				{
+					"role": "system",
+					"content": (
+						f"{persona}\n"
+						"The user sent an image. OCR text was extracted from it and is given below.\n"
+						"Use this extracted text as the primary source and answer the user request directly.\n"
+						"If OCR contains [unclear], mention that limitation clearly."
+					),
+				},
+				{
+					"role": "user",
+					"content": f"Extracted OCR text:\n{extracted_text}\n\nUser request:\n{user_request}",
+				},
+			]
+
+			answer_model, route = pick_chat_model(chan_id, f"{extracted_text}\n{user_request}", mode, message, attachments=1)
+			generate_started = time.perf_counter()
 			response = await call_groq_with_health(
 				prompt=final_prompt,
 				temperature=0.7,
 				mode=mode,
-				model_override=selected_model,
+				model_override=answer_model,
+				site="vision_answer",
 			)
+			if route:
+				model_router.record(route, chan_id, time.perf_counter() - generate_started, bool(response))
 
 			if response:
-				response = sanitize_model_output(response, selected_model)
+				response = sanitize_model_output(response, answer_model)
 				print(f"[VISION FINAL RESPONSE] {response}")
 				return response.strip()
 
@@ -1700,6 +2144,7 @@ async def handle_image_message(message, mode):
 			model=IMAGE_REQUIRED_MODEL,
 			image_bytes=image_bytes,
 			temperature=0.7,
+			site="vision_answer",
 		)
 
 		if vision_response:
@@ -1796,21 +2241,33 @@ async def handle_file_message(message, mode):
 		return None
 
 	persona = PERSONAS.get(mode, PERSONAS["serious"])
-	prompt = (
-		f"{persona}\n"
-		f"The user uploaded a file `{filename}`. Content:\n{text}\n\n"
-		f"The user's specific request is: {message.content}\n"
-		f"Answer ONLY what the user asked. If the user didn't ask anything and just sent the file, just summarize the file, and tell the user what the file is about."
-	)
+	prompt = [
+		{
+			"role": "system",
+			"content": (
+				f"{persona}\n"
+				"The user uploaded a file; its content is given below.\n"
+				"Answer ONLY what the user asked. If the user didn't ask anything and just sent the file, just summarize the file, and tell the user what the file is about."
+			),
+		},
+		{
+			"role": "user",
+			"content": f"File `{filename}`. Content:\n{text}\n\nThe user's specific request is: {message.content}",
+		},
+	]
 	try:
 		chan_id = f"dm_{message.author.id}" if isinstance(message.channel, discord.DMChannel) else str(message.channel.id)
-		selected_model = memory.get_channel_model(chan_id)
+		selected_model, route = pick_chat_model(chan_id, f"{text}\n{message.content}", mode, message, attachments=1)
+		generate_started = time.perf_counter()
 		response = await call_groq_with_health(
 			prompt=prompt,
 			temperature=0.7,
 			mode=mode,
 			model_override=selected_model,
+			site="file_summary",
 		)
+		if route:
+			model_router.record(route, chan_id, time.perf_counter() - generate_started, bool(response))
 		if response:
 			response = sanitize_model_output(response, selected_model)
 			await send_human_reply(message.channel, response.strip())
@@ -1831,46 +2288,32 @@ async def handle_file_message(message, mode):
 async def decide_image_action(user_text: str, image_count: int) -> str:
 	"""
 	Returns one of: 'EDIT' or 'NO'
-	Uses AI to determine if user wants to edit the image.
+	Uses the local intent model, or AI when it is unsure, to determine if user wants to edit the image.
 	"""
 
-	prompt = (
-		"You are an intent classifier.\n"
-		"Answer with ONLY ONE WORD: EDIT or NO.\n\n"
-
-		"Definitions:\n"
-		"- EDIT: user wants to modify, change, or alter an existing image\n"
-		"- NO: user is NOT asking for image editing (they might be asking questions, analyzing, or generating new content)\n\n"
-
-		"IMPORTANT RULES:\n"
-		"- Look for modification intent: change colors, add/remove objects, change style, apply filters, etc.\n"
-		"- Questions about the image (who is this, what is this, describe this) = NO\n"
-		"- Requests to merge/combine multiple images = NO\n"
-		"- Requests to generate something new inspired by the image = NO\n"
-		"- Only return EDIT if the user clearly wants to modify the EXISTING image\n\n"
-
-		"Examples:\n"
-		"User: 'change the background to blue' → EDIT\n"
-		"User: 'make it anime style' → EDIT\n"
-		"User: 'remove the person' → EDIT\n"
-		"User: 'who is this?' → NO\n"
-		"User: 'merge these two images' → NO\n"
-		"User: 'create something like this' → NO\n"
-		"User: 'describe what you see' → NO\n\n"
-
-		f"User message:\n{user_text}\n\n"
-		"Answer:"
-	)
+	verdict = intent_classifier.image_edit.decide(user_text)
+	if verdict is not None:
+		answer = "EDIT" if verdict else "NO"
+		print(f"[IMAGE ACTION DECISION] User: '{user_text}' → local model decided: {answer}")
+		return answer
 
-	try:
-		response = await call_groq(
-			prompt=prompt,
+	prompt = intent_classifier.image_action_prompt(user_text)
+
+	async def ask():
+		response = await llm_gateway.complete(
+			prompt,
 			model="llama-3.3-70b-versatile",
-			temperature=0
+			temperature=0,
+			hedge=True,
+			kind="classifier",
+			site="classifier",
 		)
 		answer = response.strip().upper()
 		print(f"[IMAGE ACTION DECISION] User: '{user_text}' → AI decided: {answer}")
 		return "EDIT" if answer == "EDIT" else "NO"
+
+	try:
+		return await image_action_cache.get_or_compute(user_text, ask)
 	except Exception as e:
 		print("[LLAMA IMAGE ACTION ERROR]", e)
 		return "NO"
@@ -1918,10 +2361,12 @@ User idea:
 {user_prompt}"""
 
 	try:
-		boosted = await call_groq(
-			prompt=boost_instruction,
+		boosted = await llm_gateway.complete(
+			boost_instruction,
 			model="llama-3.1-8b-instant",
-			temperature=0.1
+			temperature=0.1,
+			kind="short",
+			site="booster",
 		)
 
 		if boosted:
@@ -1988,10 +2433,12 @@ async def boost_video_prompt(user_prompt: str) -> str:
 	)
 
 	try:
-		boosted = await call_groq(
-			prompt=boost_instruction,
+		boosted = await llm_gateway.complete(
+			boost_instruction,
 			model="llama-3.1-8b-instant",
-			temperature=0.1
+			temperature=0.1,
+			kind="short",
+			site="booster",
 		)
 
 		if boosted:
@@ -2200,6 +2647,8 @@ async def on_message(message: Message):
 			return
 		
 		get_usage(get_tier_key(message))
+		# Carried into every task this handler starts, for LLM queue priority
+		admission.set_tier(get_tier_from_message(message))
 		
 		# ---------- BASIC SETUP ----------
 		content = message.content.strip()
@@ -2215,8 +2664,6 @@ async def on_message(message: Message):
 			return
 		
 		# ---------- ALWAYS SAVE TO MEMORY ----------
-		channel_memory.setdefault(chan_id, deque(maxlen=MAX_MEMORY))
-		channel_memory[chan_id].append(f"{message.author.display_name}: {content}")
 		memory.add_message(chan_id, message.author.display_name, content)
 
 		# ---------- BOT PING RULE ----------
@@ -2304,63 +2751,63 @@ async def on_message(message: Message):
 			await require_vote(message)
 			log_source(message, "IMAGE_EDIT")
 			
-			if not check_limit(message, "attachments"):
-				await deny_limit(message, "attachments")
+			try:
+				reservation = await reserve(message, "attachments")
+			except LimitExceeded as e:
+				if e.scope == "daily":
+					await deny_limit(message, "attachments")
+				else:
+					await message.reply(
+						"🚫 You've hit your **total image generation limit**.\n"
+						"Contact aarav_2022 for an upgrade."
+					)
 				return
 			
-			if not check_total_limit(message, "attachments"):
-				await message.reply(
-					"🚫 You've hit your **total image generation limit**.\n"
-					"Contact aarav_2022 for an upgrade."
-				)
-				return
+			with reservation:
+				# Extract first image
+				ref_image = None
+				for attachment in message.attachments:
+					if attachment.content_type and attachment.content_type.startswith("image/"):
+						try:
+							ref_image = await attachment.read()
+							break
+						except Exception as e:
+							print(f"[IMAGE ERROR] Failed to read attachment: {e}")
 			
-			# Extract first image
-			ref_image = None
-			for attachment in message.attachments:
-				if attachment.content_type and attachment.content_type.startswith("image/"):
-					try:
-						ref_image = await attachment.read()
-						break
-					except Exception as e:
-						print(f"[IMAGE ERROR] Failed to read attachment: {e}")
-			
-			if not ref_image:
-				await message.channel.send("⚠️ No image found to edit.")
-				return
+				if not ref_image:
+					await message.channel.send("⚠️ No image found to edit.")
+					return
 			
-			await send_human_reply(message.channel, "Sprinkling some pixel magic… back in ~1 min ✨.")
+				await send_human_reply(message.channel, "Sprinkling some pixel magic… back in ~1 min ✨.")
 	
-			try:
-				safe_prompt = content.replace("\n", " ").replace("\r", " ").strip()
-				result = await edit_image(
-					image_bytes=ref_image,
-					prompt=safe_prompt,
-					steps=4
-				)
-				print(f"[DEBUG] edit_image returned bytes length: {len(result)}")
+				try:
+					safe_prompt = content.replace("\n", " ").replace("\r", " ").strip()
+					result = await edit_image(
+						image_bytes=ref_image,
+						prompt=safe_prompt,
+						steps=4
+					)
+					print(f"[DEBUG] edit_image returned bytes length: {len(result)}")
 				
-				channel_last_images.setdefault(chan_id, [])
-				channel_last_images[chan_id].append(result)
-				channel_last_images[chan_id] = channel_last_images[chan_id][-4:]
+					channel_last_images.setdefault(chan_id, [])
+					channel_last_images[chan_id].append(result)
+					channel_last_images[chan_id] = channel_last_images[chan_id][-4:]
 				
-				await message.channel.send(
-					file=discord.File(io.BytesIO(result), filename="edited.png")
-				)
+					await message.channel.send(
+						file=discord.File(io.BytesIO(result), filename="edited.png")
+					)
 	
-				consume(message, "attachments")
-				consume_total(message, "attachments")
-				save_usage()
-				print("[DEBUG] EDIT completed and limits consumed")
+					reservation.commit()
+					print("[DEBUG] EDIT completed and limits consumed")
 	
-			except Exception as e:
-				print("[ERROR] IMAGE EDIT failed:", e)
-				await send_human_reply(
-					message.channel,
-					"🤔 Couldn't edit the image right now."
-				)
+				except Exception as e:
+					print("[ERROR] IMAGE EDIT failed:", e)
+					await send_human_reply(
+						message.channel,
+						"🤔 Couldn't edit the image right now."
+					)
 	
-			return
+				return
 		
 		elif image_action == "VISION":
 			# Run VISION
@@ -2369,7 +2816,6 @@ async def on_message(message: Message):
 			if image_reply is not None:
 				await send_human_reply(message.channel, image_reply)
 				
-				channel_memory[chan_id].append(f"{BOT_NAME}: {image_reply}")
 				memory.add_message(chan_id, BOT_NAME, image_reply)
 				memory.persist()
 				await maybe_send_promo_message(message.channel, chan_id)
@@ -2382,69 +2828,69 @@ async def on_message(message: Message):
 			
 			log_source(message, "IMAGE_MERGE")
 			
-			if not check_limit(message, "attachments"):
-				await deny_limit(message, "attachments")
+			try:
+				reservation = await reserve(message, "attachments")
+			except LimitExceeded as e:
+				if e.scope == "daily":
+					await deny_limit(message, "attachments")
+				else:
+					await message.reply(
+						"🚫 You've hit your **total image merge limit**.\n"
+						"Contact aarav_2022 for an upgrade."
+					)
 				return
 			
-			if not check_total_limit(message, "attachments"):
-				await message.reply(
-					"🚫 You've hit your **total image merge limit**.\n"
-					"Contact aarav_2022 for an upgrade."
-				)
-				return
+			with reservation:
+				images = []
 			
-			images = []
+				for attachment in message.attachments:
+					if attachment.content_type and attachment.content_type.startswith("image/"):
+						try:
+							images.append(await attachment.read())
+						except Exception as e:
+							print("[IMAGE MERGE] Failed to read attachment:", e)
 			
-			for attachment in message.attachments:
-				if attachment.content_type and attachment.content_type.startswith("image/"):
-					try:
-						images.append(await attachment.read())
-					except Exception as e:
-						print("[IMAGE MERGE] Failed to read attachment:", e)
+				if len(images) < 2:
+					await send_human_reply(
+						message.channel,
+						"🖼️ Please attach **at least two images** to merge."
+					)
+					return
 			
-			if len(images) < 2:
 				await send_human_reply(
 					message.channel,
-					"🖼️ Please attach **at least two images** to merge."
+					"🧩 Merging images… hang tight ✨"
 				)
-				return
 			
-			await send_human_reply(
-				message.channel,
-				"🧩 Merging images… hang tight ✨"
-			)
-			
-			merge_prompt = content 
+				merge_prompt = content 
 			
-			try:
-				image_bytes = await merge_images(
-					images=images,
-					prompt=(
-						merge_prompt
-						or "Merge all provided images into one coherent scene. Preserve faces, style, and colors."
-					),
-					steps=4,
-				)
+				try:
+					image_bytes = await merge_images(
+						images=images,
+						prompt=(
+							merge_prompt
+							or "Merge all provided images into one coherent scene. Preserve faces, style, and colors."
+						),
+						steps=4,
+					)
 				
-				await message.channel.send(
-					file=discord.File(
-						io.BytesIO(image_bytes),
-						filename="merge.png"
+					await message.channel.send(
+						file=discord.File(
+							io.BytesIO(image_bytes),
+							filename="merge.png"
+						)
 					)
-				)
 				
-				consume(message, "attachments")
-				consume_total(message, "attachments")
-				save_usage()
-				return
+					reservation.commit()
+					return
 				
-			except Exception as e:
-				print("[IMAGE MERGE ERROR]", e)
-				await send_human_reply(
-					message.channel,
-					"🤔 Couldn't merge images right now. Try again shortly."
-				)
-				return
+				except Exception as e:
+					print("[IMAGE MERGE ERROR]", e)
+					await send_human_reply(
+						message.channel,
+						"🤔 Couldn't merge images right now. Try again shortly."
+					)
+					return
 		
 		# ---------- OWNER COMMANDS ----------
 		if await is_owner_user(message.author):
@@ -2530,10 +2976,12 @@ async def on_message(message: Message):
 					+ f"User says:\n{cleaned}\n\nReply:"
 				)
 		
-				response = await call_groq(
-					prompt=chess_prompt,
+				response = await llm_gateway.complete(
+					chess_prompt,
 					model="llama-3.3-70b-versatile",
-					temperature=0.6
+					temperature=0.6,
+					hedge=True,
+					site="fun_chat",
 				)
 		
 				await send_human_reply(message.channel, humanize_and_safeify(response))
@@ -2631,13 +3079,14 @@ async def on_message(message: Message):
 		
 		consume(message, "messages")
 				
-		asyncio.create_task(generate_and_reply(chan_id, message, content, mode))
+		# Mentions in this channel within BURST_WINDOW (300 ms by default) of each other are answered together
+		mention_batcher.submit(chan_id, (message, content, mode))
 		
 	except VoteRequired:
 		return
 		
 # ---------------- EVENTS ----------------
-bot.event
+@bot.event
 async def on_ready():
 	await bot.change_presence(
 		activity=discord.CustomActivity(
@@ -2646,8 +3095,6 @@ async def on_ready():
 		status=discord.Status.online
 	)
 	print(f"{BOT_NAME} is ready!")
-	asyncio.create_task(process_queue())
-	asyncio.create_task(autosave_usage())
 
 	print("Shard mapping of all servers:")
 	for guild in bot.guilds:
@@ -2666,9 +3113,14 @@ def run():
 	except discord.errors.PrivilegedIntentsRequired as e:
 		print(f"ERROR: Privileged intents are required but not enabled in the Discord Developer Portal: {e}")
 		sys.exit(1)
+	finally:
+		# Shutdown: write out anything the flusher has not reached yet.
+		persistence.flush_all()
 		
 if __name__ == "__main__":
-	atexit.register(save_usage)
+	atexit.register(persistence.flush_all)
+	atexit.register(memory.flush)
+	atexit.register(checkpoint_usage)
 	atexit.register(save_vote_unlocks)
 	atexit.register(save_guild_chat_config)
 	atexit.register(playlist_manager.save)
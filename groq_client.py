@@ -2,16 +2,264 @@ import aiohttp
 import os
 import asyncio
 import base64
+import json
+import re
+import time
 from dotenv import load_dotenv
 
+import generation_profiles
+from chat_messages import as_messages, text_length
+
 load_dotenv()
 
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
 
 SESSION: aiohttp.ClientSession | None = None
 
 
+def _load_keys() -> list[str]:
+    """GROQ_API_KEY may hold several comma-separated keys; GROQ_API_KEY_2 adds one more."""
+    keys = []
+    k1 = os.getenv("GROQ_API_KEY", "").strip()
+    if k1:
+        keys.extend(k.strip() for k in k1.split(",") if k.strip())
+    k2 = os.getenv("GROQ_API_KEY_2", "").strip()
+    if k2 and k2 not in keys:
+        keys.append(k2)
+    return keys
+
+
+GROQ_API_KEYS = _load_keys()
+GROQ_API_KEY = GROQ_API_KEYS[0] if GROQ_API_KEYS else None
+
+MAX_KEY_WAIT = 10          # longest we wait for a throttled key before giving up, in seconds
+DEFAULT_RETRY_AFTER = 2.0  # 429 without retry-after or reset headers
+AUTH_FAILURE_BLOCK = 3600  # a rejected key is left alone this long
+
+
+def _parse_duration(value: str | None) -> float | None:
+    """Parse Groq reset headers such as '7.66s', '2m59.56s', '1h2m' or '120ms'."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total = 0.0
+    for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        total += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total
+
+
+class KeyState:
+    """Rate-limit budget of one API key, as last reported by Groq's response headers."""
+
+    __slots__ = (
+        "key", "label", "remaining_requests", "remaining_tokens",
+        "requests_reset_at", "tokens_reset_at", "blocked_until",
+        "in_flight", "requests", "throttled",
+    )
+
+    def __init__(self, key: str, label: str):
+        self.key = key
+        self.label = label
+        self.remaining_requests: int | None = None
+        self.remaining_tokens: int | None = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+        self.blocked_until = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+
+    def headroom(self, now: float) -> float:
+        """Tokens this key can still spend right now; inf when unknown or reset."""
+        if now < self.blocked_until:
+            return -1
+        if self.remaining_requests is not None and now < self.requests_reset_at and self.remaining_requests <= 0:
+            return -1
+        if self.remaining_tokens is None or now >= self.tokens_reset_at:
+            return float("inf")
+        return self.remaining_tokens - self.in_flight
+
+    def ready_at(self, now: float) -> float:
+        """When this key will have headroom again, judging by what it last reported."""
+        ready = self.blocked_until
+        if self.remaining_requests is not None and self.remaining_requests <= 0:
+            ready = max(ready, self.requests_reset_at)
+        if self.remaining_tokens is not None and self.remaining_tokens - self.in_flight <= 0:
+            ready = max(ready, self.tokens_reset_at)
+        return max(ready, now)
+
+    def update(self, headers, now: float):
+        requests_left = headers.get("x-ratelimit-remaining-requests")
+        tokens_left = headers.get("x-ratelimit-remaining-tokens")
+        if requests_left is not None:
+            self.remaining_requests = int(float(requests_left))
+            self.requests_reset_at = now + (_parse_duration(headers.get("x-ratelimit-reset-requests")) or 0)
+        if tokens_left is not None:
+            self.remaining_tokens = int(float(tokens_left))
+            self.tokens_reset_at = now + (_parse_duration(headers.get("x-ratelimit-reset-tokens")) or 0)
+
+    def throttle(self, headers, now: float) -> float:
+        """Back this key off after a 429 and return how long for."""
+        self.update(headers, now)
+        wait = (
+            _parse_duration(headers.get("retry-after"))
+            or max(self.tokens_reset_at, self.requests_reset_at) - now
+        )
+        if wait <= 0:
+            wait = DEFAULT_RETRY_AFTER
+        self.blocked_until = now + wait
+        self.throttled += 1
+        return wait
+
+
+_keys = [KeyState(key, f"key{i}") for i, key in enumerate(GROQ_API_KEYS, start=1)]
+
+
+async def _acquire_key(cost: int, exclude=()) -> KeyState | None:
+    """
+    Reserve cost tokens on the key with the most headroom. When every key is
+    backing off, wait for the first one to free up, unless that is more than
+    MAX_KEY_WAIT away.
+    """
+    while _keys:
+        now = time.monotonic()
+        usable = [k for k in _keys if k not in exclude and k.headroom(now) > 0]
+        if usable:
+            key = max(usable, key=lambda k: (k.headroom(now), -k.in_flight))
+            key.in_flight += cost
+            key.requests += 1
+            return key
+
+        candidates = [k for k in _keys if k not in exclude] or _keys
+        wait = min(k.ready_at(now) for k in candidates) - now
+        if wait > MAX_KEY_WAIT:
+            print(f"[GROQ KEYS] All keys throttled for another {wait:.1f}s, giving up")
+            return None
+        await asyncio.sleep(max(wait, 0.05))
+        exclude = ()
+    return None
+
+
+def _request_cost(prompt, max_tokens: int = 256) -> int:
+    # Groq counts the max_tokens reservation against the token budget; capped
+    # here because most replies stop well short of it.
+    return text_length(prompt) // 4 + min(max_tokens, 1024)
+
+
+def _payload(prompt, model: str, temperature: float | None, site: str | None, image_bytes: bytes | None = None) -> dict:
+    """Request body with max_tokens, temperature and stop taken from the site's generation profile."""
+    profile = generation_profiles.get(site)
+    payload = {
+        "model": model,
+        "messages": _build_messages(prompt, image_bytes),
+        "temperature": profile.temperature if temperature is None else temperature,
+        "max_tokens": generation_profiles.max_tokens(site, model, _max_tokens_for_model(model)),
+    }
+    if profile.stop:
+        payload["stop"] = list(profile.stop)
+    return payload
+
+
+def _build_messages(prompt, image_bytes: bytes | None = None) -> list[dict]:
+    """Chat messages for a prompt string or message list, with any image on the last user turn."""
+    messages = as_messages(prompt)
+    if image_bytes is None:
+        return messages
+    b64 = base64.b64encode(image_bytes).decode("utf-8")
+    image = {
+        "type": "image_url",
+        "image_url": {
+            "url": f"data:image/png;base64,{b64}"
+        }
+    }
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i]["role"] == "user":
+            messages[i] = {
+                "role": "user",
+                "content": [{"type": "text", "text": messages[i]["content"]}, image],
+            }
+            break
+    return messages
+
+
+# ---------------- PROMPT CACHE USAGE ----------------
+_usage: dict[str, dict] = {}
+USAGE_REPORT_EVERY = 50  # requests per model between [GROQ USAGE] lines
+
+
+def _record_usage(model: str, usage: dict | None):
+    """Count prompt tokens and how many of them Groq served from its prompt cache."""
+    if not usage:
+        return
+    details = usage.get("prompt_tokens_details") or {}
+    s = _usage.setdefault(model, {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0})
+    s["requests"] += 1
+    s["prompt_tokens"] += usage.get("prompt_tokens") or 0
+    s["cached_tokens"] += details.get("cached_tokens") or 0
+    s["completion_tokens"] += usage.get("completion_tokens") or 0
+    if s["requests"] % USAGE_REPORT_EVERY == 0:
+        print(
+            f"[GROQ USAGE] {model}: {s['requests']} requests, {s['prompt_tokens']} prompt tokens, "
+            f"{s['cached_tokens'] / max(s['prompt_tokens'], 1):.0%} cached"
+        )
+
+
+def get_usage_stats() -> dict:
+    return {
+        model: {**s, "cached_ratio": s["cached_tokens"] / s["prompt_tokens"] if s["prompt_tokens"] else 0.0}
+        for model, s in _usage.items()
+    }
+
+
+def _headers(key: KeyState, stream: bool = False) -> dict:
+    headers = {
+        "Authorization": f"Bearer {key.key}",
+        "Content-Type": "application/json",
+    }
+    if stream:
+        headers["Accept"] = "text/event-stream"
+    return headers
+
+
+def _rejected(key: KeyState, status: int, now: float, throttled: set) -> bool:
+    """Park a key that failed authentication. True if another key can take the retry."""
+    if status not in (401, 403):
+        return False
+    key.blocked_until = now + AUTH_FAILURE_BLOCK
+    print(f"[GROQ KEYS] {key.label} rejected with {status}, parking it for {AUTH_FAILURE_BLOCK}s")
+    throttled.add(key)
+    return any(k.headroom(now) > 0 for k in _keys if k not in throttled)
+
+
+def _throttled(key: KeyState, headers, now: float, throttled: set) -> bool:
+    """Back a key off after a 429. True the first time this key is throttled in a call."""
+    wait = key.throttle(headers, now)
+    print(f"[GROQ KEYS] {key.label} throttled for {wait:.1f}s")
+    first = key not in throttled
+    throttled.add(key)
+    return first
+
+
+def get_key_stats() -> list[dict]:
+    now = time.monotonic()
+    return [
+        {
+            "key": k.label,
+            "headroom": k.headroom(now),
+            "remaining_requests": k.remaining_requests,
+            "remaining_tokens": k.remaining_tokens,
+            "in_flight": k.in_flight,
+            "requests": k.requests,
+            "throttled": k.throttled,
+        }
+        for k in _keys
+    ]
+
+
 def _max_tokens_for_model(model: str) -> int:
     """Return a safe max_tokens value per model."""
     strict_limits = {
@@ -19,11 +267,18 @@ def _max_tokens_for_model(model: str) -> int:
     }
     return strict_limits.get(model, 8000)
 
+def history_token_budget(model: str) -> int:
+    """Return how many tokens of channel history to put in a prompt per model."""
+    strict_budgets = {
+        "allam-2-7b": 1024,
+    }
+    return strict_budgets.get(model, 6000)
+
 def clean_log(text: str) -> str:
     if not text:
         return text
-    if GROQ_API_KEY:
-        text = text.replace(GROQ_API_KEY, "***")
+    for key in GROQ_API_KEYS:
+        text = text.replace(key, "***")
     return text
 
 async def get_session():
@@ -41,14 +296,20 @@ async def close_session():
 
 # ---------------- UNIFIED CLIENT ----------------
 async def call_groq(
-    prompt: str,
+    prompt: str | list[dict],
     model: str = "llama-3.3-70b-versatile",
-    temperature: float = 1.0,
+    temperature: float | None = None,
     image_bytes: bytes | None = None,
-    retries: int = 2
+    retries: int = 2,
+    site: str | None = None,
 ) -> str | None:
     """
     Unified Groq client for both text and vision requests.
+
+    prompt is either one string, sent as a single user message, or a list of
+    role-separated chat messages (see chat_messages). site picks the
+    generation profile (max_tokens, stop, timeout, and the temperature when
+    none is given); see generation_profiles.
     """
     if not GROQ_API_KEY:
         print("Missing GROQ API Key")
@@ -56,58 +317,49 @@ async def call_groq(
 
     session = await get_session()
 
-    # Build content
-    content = [{"type": "text", "text": prompt}]
-
-    if image_bytes is not None:
-        b64 = base64.b64encode(image_bytes).decode("utf-8")
-        content.append({
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:image/png;base64,{b64}"
-            }
-        })
-
-    payload = {
-        "model": model,
-        "messages": [
-            {
-                "role": "user",
-                "content": content
-            }
-        ],
-        "temperature": temperature,
-        "max_tokens": _max_tokens_for_model(model)
-    }
-
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json",
-    }
+    payload = _payload(prompt, model, temperature, site, image_bytes)
+    timeout = generation_profiles.get(site).timeout
 
+    cost = _request_cost(prompt, payload["max_tokens"])
+    throttled = set()
     backoff = 1
-    for attempt in range(1, retries + 1):
+    attempt = 0
+    while attempt < retries:
+        key = await _acquire_key(cost, exclude=throttled)
+        if key is None:
+            return None
+        attempt += 1
+        sent_at = time.monotonic()
         try:
-            async with session.post(GROQ_URL, headers=headers, json=payload, timeout=60) as resp:
+            async with session.post(GROQ_URL, headers=_headers(key), json=payload, timeout=timeout) as resp:
+                now = time.monotonic()
                 text = await resp.text()
                 
                 if resp.status == 200:
+                    key.update(resp.headers, now)
                     data = await resp.json()
-                    response_text = data["choices"][0]["message"]["content"]
+                    _record_usage(model, data.get("usage"))
+                    choice = data["choices"][0]
+                    generation_profiles.record(site, model, data.get("usage"), choice.get("finish_reason"), now - sent_at)
+                    response_text = choice["message"]["content"]
                     return response_text
 
                 print("\n===== GROQ ERROR =====")
-                print(f"Attempt {attempt}/{retries}, Status: {resp.status}")
+                print(f"Attempt {attempt}/{retries}, Status: {resp.status}, Key: {key.label}")
                 print(f"Model: {model}")
                 print(clean_log(text))
                 print("================================\n")
 
+                if _rejected(key, resp.status, now, throttled):
+                    attempt -= 1
+                    continue
                 if resp.status in (401, 403):
                     return None
                 
                 if resp.status == 429:
-                    await asyncio.sleep(backoff)
-                    backoff = min(backoff * 2, 8)
+                    # The first 429 from each key moves on to another key without using an attempt
+                    if _throttled(key, resp.headers, now, throttled):
+                        attempt -= 1
                     continue
                 
                 if resp.status == 503:
@@ -122,5 +374,111 @@ async def call_groq(
             
             await asyncio.sleep(backoff)
             backoff = min(backoff * 2, 8)
+        finally:
+            key.in_flight -= cost
 
     return None
+
+
+# ---------------- STREAMING CLIENT ----------------
+async def stream_groq(
+    prompt: str | list[dict],
+    model: str = "llama-3.3-70b-versatile",
+    temperature: float | None = None,
+    retries: int = 2,
+    site: str | None = None,
+):
+    """
+    Stream a text completion from Groq as server-sent events.
+
+    Yields content deltas as they arrive. Retries follow call_groq, but only
+    until the first delta has been yielded; after that an error is raised to
+    the caller, which already holds a partial answer.
+    """
+    if not GROQ_API_KEY:
+        print("Missing GROQ API Key")
+        return
+
+    session = await get_session()
+
+    payload = _payload(prompt, model, temperature, site)
+    payload["stream"] = True
+    timeout = aiohttp.ClientTimeout(total=generation_profiles.get(site).timeout, sock_read=30)
+
+    cost = _request_cost(prompt, payload["max_tokens"])
+    throttled = set()
+    backoff = 1
+    attempt = 0
+    while attempt < retries:
+        key = await _acquire_key(cost, exclude=throttled)
+        if key is None:
+            return
+        attempt += 1
+        started = False
+        sent_at = time.monotonic()
+        usage = finish_reason = None
+        try:
+            async with session.post(GROQ_URL, headers=_headers(key, stream=True), json=payload, timeout=timeout) as resp:
+                now = time.monotonic()
+                if resp.status != 200:
+                    text = await resp.text()
+                    print("\n===== GROQ STREAM ERROR =====")
+                    print(f"Attempt {attempt}/{retries}, Status: {resp.status}, Key: {key.label}")
+                    print(f"Model: {model}")
+                    print(clean_log(text))
+                    print("================================\n")
+
+                    if _rejected(key, resp.status, now, throttled):
+                        attempt -= 1
+                        continue
+                    if resp.status in (401, 403):
+                        return
+
+                    if resp.status == 429:
+                        if _throttled(key, resp.headers, now, throttled):
+                            attempt -= 1
+                        continue
+
+                    if resp.status == 503:
+                        raise Exception(f"503 service overloaded - model {model} over capacity")
+
+                    raise Exception(f"stream failed with status {resp.status}")
+
+                key.update(resp.headers, now)
+                async for raw in resp.content:
+                    line = raw.decode("utf-8", "ignore").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(data)
+                    except ValueError:
+                        continue
+                    # Groq reports usage on the last chunk under x_groq
+                    usage = chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage") or usage
+                    try:
+                        choice = chunk["choices"][0]
+                    except (KeyError, IndexError):
+                        continue
+                    finish_reason = choice.get("finish_reason") or finish_reason
+                    delta = (choice.get("delta") or {}).get("content")
+                    if delta:
+                        started = True
+                        yield delta
+                _record_usage(model, usage)
+                generation_profiles.record(site, model, usage, finish_reason, time.monotonic() - sent_at)
+                return
+
+        except Exception as e:
+            error_msg = clean_log(str(e))
+            print(f"[GROQ STREAM ERROR] Attempt {attempt}/{retries}: {error_msg}")
+
+            if started or attempt == retries:
+                raise e
+
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 8)
+        finally:
+            key.in_flight -= cost
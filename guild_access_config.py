@@ -2,6 +2,8 @@ import json
 from pathlib import Path
 from typing import Dict, List, Optional
 
+import persistence
+
 CONFIG_FILE = Path("guild_chat_config.json")
 DEFAULT_MODE = "server"
 
@@ -50,19 +52,28 @@ def load_guild_chat_config() -> None:
 
 
 def save_guild_chat_config() -> None:
-    try:
-        serialized = {
-            str(gid): {
-                "mode": data.get("mode", DEFAULT_MODE),
-                "channels": [str(ch) for ch in data.get("channels", [])],
-            }
-            for gid, data in _guild_chat_config.items()
+    persistence.mark_dirty("guild_chat_config")
+
+
+def _snapshot_guild_chat_config():
+    serialized = {
+        str(gid): {
+            "mode": data.get("mode", DEFAULT_MODE),
+            "channels": [str(ch) for ch in data.get("channels", [])],
         }
+        for gid, data in _guild_chat_config.items()
+    }
 
+    def write() -> int:
+        payload = json.dumps(serialized, indent=2)
         with CONFIG_FILE.open("w", encoding="utf-8") as f:
-            json.dump(serialized, f, indent=2)
-    except Exception as e:
-        print(f"[CONFIG] Failed to save guild chat config: {e}")
+            f.write(payload)
+        return len(payload)
+
+    return write
+
+
+persistence.register("guild_chat_config", _snapshot_guild_chat_config)
 
 
 def set_server_mode(guild_id: int, channel_ids: Optional[List[int]] = None) -> None:
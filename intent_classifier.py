@@ -0,0 +1,198 @@
+"""
+In-process intent classifiers, consulted before the LLM deciders.
+
+Each classifier is a logistic regression over hashed features of
+slang_normalizer.normalize_text: word unigrams and bigrams plus character
+trigrams, folded into FEATURE_BUCKETS buckets. The weights are trained with
+NumPy from a bundled labelled file the first time the classifier is used,
+which takes milliseconds, so there is no model file to keep in sync.
+
+decide() answers True or False when the model is at least INTENT_CONFIDENCE
+sure either way, and None otherwise. None means ask the LLM decider; its
+prompt is built by the *_prompt() helpers below.
+
+    verdict = intent_classifier.web_search.decide(text)
+    if verdict is None:
+        verdict = await ask_llm(intent_classifier.web_search_prompt(text))
+
+bench_intent_classifier.py reports accuracy, coverage and latency, with
+the LLM decider for comparison.
+"""
+
+import os
+import time
+import zlib
+
+import numpy as np
+
+from slang_normalizer import normalize_text
+
+FEATURE_BUCKETS = 1 << 16
+CONFIDENCE = float(os.getenv("INTENT_CONFIDENCE", "0.8"))
+TRAIN_STEPS = 300
+LEARNING_RATE = 2.0
+L2 = 1e-4
+
+
+def _bucket(token: str) -> int:
+    return zlib.crc32(token.encode("utf-8")) % FEATURE_BUCKETS
+
+
+def features(text: str) -> tuple[np.ndarray, np.ndarray]:
+    """Hashed feature indices and their L2-normalised weights for one text."""
+    norm = normalize_text(text or "")
+    words = norm.split()
+    tokens = [f"w:{w}" for w in words]
+    tokens += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    padded = f" {norm} "
+    tokens += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    if not words:
+        tokens.append("empty")
+
+    counts: dict[int, float] = {}
+    for token in tokens:
+        idx = _bucket(token)
+        counts[idx] = counts.get(idx, 0.0) + 1.0
+    idx = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    vals = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+    return idx, vals / np.linalg.norm(vals)
+
+
+def load_examples(path: str, positive: str) -> list[tuple[str, bool]]:
+    """Read label<TAB>text lines; '#' starts a comment."""
+    examples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line or line.startswith("#"):
+                continue
+            label, _, text = line.partition("\t")
+            examples.append((text, label.strip().upper() == positive))
+    return examples
+
+
+def train(examples: list[tuple[str, bool]]) -> tuple[np.ndarray, float]:
+    """Fit L2-regularised logistic regression by full-batch gradient descent."""
+    rows, cols, vals = [], [], []
+    for row, (text, _) in enumerate(examples):
+        idx, weights = features(text)
+        rows.append(np.full(len(idx), row))
+        cols.append(idx)
+        vals.append(weights)
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    vals = np.concatenate(vals)
+    y = np.array([label for _, label in examples], dtype=np.float64)
+    n = len(examples)
+
+    w = np.zeros(FEATURE_BUCKETS)
+    b = 0.0
+    for _ in range(TRAIN_STEPS):
+        z = np.bincount(rows, weights=w[cols] * vals, minlength=n) + b
+        err = 1.0 / (1.0 + np.exp(-z)) - y
+        grad = np.bincount(cols, weights=err[rows] * vals, minlength=FEATURE_BUCKETS) / n
+        w -= LEARNING_RATE * (grad + L2 * w)
+        b -= LEARNING_RATE * err.mean()
+    return w, b
+
+
+class IntentClassifier:
+    def __init__(self, name: str, data_path: str, positive: str):
+        self.name = name
+        self.data_path = data_path
+        self.positive = positive
+        self._weights: np.ndarray | None = None
+        self._bias = 0.0
+        self.decided = 0
+        self.deferred = 0
+
+    def fit(self, examples: list[tuple[str, bool]] | None = None) -> None:
+        started = time.perf_counter()
+        if examples is None:
+            examples = load_examples(self.data_path, self.positive)
+        self._weights, self._bias = train(examples)
+        print(
+            f"[INTENT] Trained {self.name} on {len(examples)} examples "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+
+    def predict(self, text: str) -> float:
+        """Probability that text belongs to the positive class."""
+        if self._weights is None:
+            self.fit()
+        idx, vals = features(text)
+        z = float(self._weights[idx] @ vals) + self._bias
+        return 1.0 / (1.0 + np.exp(-z))
+
+    def decide(self, text: str, confidence: float = CONFIDENCE) -> bool | None:
+        p = self.predict(text)
+        if p >= confidence:
+            self.decided += 1
+            return True
+        if p <= 1.0 - confidence:
+            self.decided += 1
+            return False
+        self.deferred += 1
+        return None
+
+    def get_stats(self) -> dict:
+        total = self.decided + self.deferred
+        return {
+            "decided": self.decided,
+            "deferred": self.deferred,
+            "local_rate": self.decided / total if total else 0.0,
+        }
+
+
+_here = os.path.dirname(os.path.abspath(__file__))
+web_search = IntentClassifier("web_search", os.path.join(_here, "intent_web_search.tsv"), "YES")
+image_edit = IntentClassifier("image_edit", os.path.join(_here, "intent_image_edit.tsv"), "EDIT")
+
+
+def warm_up() -> None:
+    """Train both classifiers up front, e.g. on a worker thread at startup."""
+    for classifier in (web_search, image_edit):
+        if classifier._weights is None:
+            classifier.fit()
+
+
+# ---------------- LLM DECIDER PROMPTS ----------------
+def web_search_prompt(user_text: str) -> str:
+    return (
+        "You are a strict classifier. Answer ONLY YES or NO.\n"
+        "Should this query use live web search for freshness/current events/factual lookup?\n"
+        "Search is useful for latest news, current leaders, recent updates, rankings, dates, and changing facts.\n"
+        "Search is not needed for opinions, casual chat, coding help, writing, or timeless explanations.\n\n"
+        f"Query: {user_text}\n"
+        "Answer:"
+    )
+
+
+def image_action_prompt(user_text: str) -> str:
+    return (
+        "You are an intent classifier.\n"
+        "Answer with ONLY ONE WORD: EDIT or NO.\n\n"
+
+        "Definitions:\n"
+        "- EDIT: user wants to modify, change, or alter an existing image\n"
+        "- NO: user is NOT asking for image editing (they might be asking questions, analyzing, or generating new content)\n\n"
+
+        "IMPORTANT RULES:\n"
+        "- Look for modification intent: change colors, add/remove objects, change style, apply filters, etc.\n"
+        "- Questions about the image (who is this, what is this, describe this) = NO\n"
+        "- Requests to merge/combine multiple images = NO\n"
+        "- Requests to generate something new inspired by the image = NO\n"
+        "- Only return EDIT if the user clearly wants to modify the EXISTING image\n\n"
+
+        "Examples:\n"
+        "User: 'change the background to blue' → EDIT\n"
+        "User: 'make it anime style' → EDIT\n"
+        "User: 'remove the person' → EDIT\n"
+        "User: 'who is this?' → NO\n"
+        "User: 'merge these two images' → NO\n"
+        "User: 'create something like this' → NO\n"
+        "User: 'describe what you see' → NO\n\n"
+
+        f"User message:\n{user_text}\n\n"
+        "Answer:"
+    )
@@ -0,0 +1,342 @@
+"""
+One entry point for text completions across the LLM providers the bot uses.
+
+A backend is a (provider, model) pair. For each one the gateway keeps an
+EWMA of latency and error rate and a circuit breaker that opens after
+LLM_BREAKER_THRESHOLD failures in a row and lets a single probe through
+once LLM_BREAKER_COOLDOWN has passed. complete() tries the backends that
+serve the requested model (EQUIVALENTS), healthiest first, then the same
+for each fallback model, and returns the first non-empty answer.
+
+With hedge=True, a second backend is started once the first has run past
+its own p95 latency; whichever answers first wins and the other is cancelled.
+The backup holds an admission slot of its own and is skipped when none is
+free, so hedging never pushes past LLM_CONCURRENCY.
+
+    text = await llm_gateway.complete(prompt, model="openai/gpt-oss-120b")
+
+Callers that talk to a provider directly, such as the streaming chat path,
+report outcomes with record() and can check available() first.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+
+import admission
+import generation_profiles
+import groq_client
+from groq_client import call_groq
+from cerebras_client import call_cerebras
+from openrouter_client import call_openrouter
+from google_ai_studio_client import call_google_ai_studio
+
+EWMA_ALPHA = 0.2
+BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "3"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "60"))
+HEDGE_MIN_SAMPLES = 20     # p95 is not trusted before this many successes
+HEDGE_MIN_DELAY = 1.0      # never hedge sooner than this, in seconds
+COLD_LATENCY = 3.0         # assumed latency for a backend with no samples
+ERROR_PENALTY = 4.0        # score multiplier per unit of error rate
+
+
+# ---------------- PROVIDERS ----------------
+async def _groq(model, prompt, temperature, image_bytes, site):
+    return await call_groq(
+        prompt=prompt,
+        model=model,
+        temperature=temperature,
+        image_bytes=image_bytes,
+        retries=1,
+        site=site,
+    )
+
+
+async def _cerebras(model, prompt, temperature, image_bytes, site):
+    return await call_cerebras(prompt=prompt, model=model, temperature=temperature, retries=1)
+
+
+async def _openrouter(model, prompt, temperature, image_bytes, site):
+    return await call_openrouter(prompt=prompt, model=model, temperature=temperature, retries=1)
+
+
+async def _google(model, prompt, temperature, image_bytes, site):
+    return await call_google_ai_studio(prompt=prompt, model=model, temperature=temperature, retries=1)
+
+
+# provider -> (call, has credentials, accepts images)
+PROVIDERS = {
+    "groq": (_groq, lambda: bool(groq_client.GROQ_API_KEY), True),
+    "cerebras": (_cerebras, lambda: bool(os.getenv("CEREBRAS_API_KEY")), False),
+    "openrouter": (_openrouter, lambda: bool(os.getenv("OPENROUTER_API_KEY")), False),
+    "google": (_google, lambda: bool(os.getenv("GOOGLE_AI_STUDIO_API_KEY") or os.getenv("GEMINI_API_KEY")), False),
+}
+
+# Backends that serve the same weights, in order of preference when none has
+# any latency samples yet.
+EQUIVALENTS = [
+    [
+        ("groq", "openai/gpt-oss-120b"),
+        ("cerebras", "gpt-oss-120b"),
+        ("openrouter", "openai/gpt-oss-120b"),
+    ],
+    [
+        ("groq", "llama-3.3-70b-versatile"),
+        ("cerebras", "llama-3.3-70b"),
+        ("openrouter", "meta-llama/llama-3.3-70b-instruct"),
+    ],
+    [
+        ("groq", "llama-3.1-8b-instant"),
+        ("cerebras", "llama3.1-8b"),
+    ],
+    [
+        ("groq", "meta-llama/llama-4-scout-17b-16e-instruct"),
+        ("openrouter", "meta-llama/llama-4-scout"),
+    ],
+]
+
+
+def equivalents(provider: str, model: str) -> list[tuple[str, str]]:
+    backend = (provider, model)
+    for group in EQUIVALENTS:
+        if backend in group:
+            return list(group)
+    return [backend]
+
+
+# ---------------- HEALTH ----------------
+class BackendHealth:
+    __slots__ = (
+        "provider", "model", "latency", "error_rate", "failures",
+        "open_until", "probing", "samples", "calls", "errors",
+    )
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self.latency: float | None = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.samples: deque[float] = deque(maxlen=200)
+        self.calls = 0
+        self.errors = 0
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}/{self.model}"
+
+    def state(self, now: float | None = None) -> str:
+        if self.failures < BREAKER_THRESHOLD:
+            return "closed"
+        if (now or time.monotonic()) < self.open_until:
+            return "open"
+        return "half_open"
+
+    def available(self, now: float | None = None) -> bool:
+        state = self.state(now)
+        return state == "closed" or (state == "half_open" and not self.probing)
+
+    def score(self) -> float:
+        latency = self.latency if self.latency is not None else COLD_LATENCY
+        return latency * (1 + ERROR_PENALTY * self.error_rate)
+
+    def p95(self) -> float | None:
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def record(self, latency: float, ok: bool):
+        self.calls += 1
+        self.probing = False
+        self.error_rate += EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+
+        if ok:
+            self.samples.append(latency)
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += EWMA_ALPHA * (latency - self.latency)
+            if self.failures >= BREAKER_THRESHOLD:
+                print(f"[GATEWAY] {self.name} recovered, closing breaker")
+            self.failures = 0
+            return
+
+        self.errors += 1
+        self.failures += 1
+        if self.failures >= BREAKER_THRESHOLD:
+            self.open_until = time.monotonic() + BREAKER_COOLDOWN
+            print(
+                f"[GATEWAY] {self.name} failed {self.failures}x in a row, "
+                f"breaker open for {BREAKER_COOLDOWN:.0f}s"
+            )
+
+
+_health: dict[tuple[str, str], BackendHealth] = {}
+
+
+def _health_for(backend: tuple[str, str]) -> BackendHealth:
+    health = _health.get(backend)
+    if health is None:
+        health = _health[backend] = BackendHealth(*backend)
+    return health
+
+
+def record(provider: str, model: str, latency: float, ok: bool):
+    """Report the outcome of a call made outside complete()."""
+    _health_for((provider, model)).record(latency, ok)
+
+
+def available(provider: str, model: str) -> bool:
+    return _health_for((provider, model)).available()
+
+
+def get_stats() -> list[dict]:
+    now = time.monotonic()
+    return [
+        {
+            "backend": h.name,
+            "state": h.state(now),
+            "latency": round(h.latency, 3) if h.latency is not None else None,
+            "p95": round(h.p95(), 3) if h.p95() is not None else None,
+            "error_rate": round(h.error_rate, 3),
+            "calls": h.calls,
+            "errors": h.errors,
+        }
+        for h in _health.values()
+    ]
+
+
+# ---------------- ROUTING ----------------
+def _candidates(provider: str, models, image_bytes) -> list[tuple[str, str]]:
+    """Usable backends for each model in turn, best score first within a model."""
+    now = time.monotonic()
+    ordered = []
+    for model in models:
+        group = []
+        for backend in equivalents(provider, model):
+            entry = PROVIDERS.get(backend[0])
+            if entry is None or not entry[1]() or backend in ordered:
+                continue
+            if image_bytes is not None and not entry[2]:
+                continue
+            if _health_for(backend).available(now):
+                group.append(backend)
+        # A backend whose cooldown has passed gets the next call as its probe.
+        group.sort(key=lambda b: (_health_for(b).state(now) != "half_open", _health_for(b).score()))
+        ordered.extend(group)
+    return ordered
+
+
+async def _timed(backend, prompt, temperature, image_bytes, site):
+    health = _health_for(backend)
+    if health.state() == "half_open":
+        health.probing = True
+    call = PROVIDERS[backend[0]][0]
+    started = time.perf_counter()
+    try:
+        # The profile timeout bounds every provider, including those without their own setting.
+        result = await asyncio.wait_for(
+            call(backend[1], prompt, temperature, image_bytes, site),
+            generation_profiles.get(site).timeout,
+        )
+    except asyncio.CancelledError:
+        health.probing = False
+        raise
+    except Exception:
+        health.record(time.perf_counter() - started, False)
+        raise
+    health.record(time.perf_counter() - started, bool(result))
+    return result
+
+
+async def _run(backend, backup, tried, prompt, temperature, image_bytes, site, kind):
+    tried.add(backend)
+    primary = asyncio.create_task(_timed(backend, prompt, temperature, image_bytes, site))
+    delay = _health_for(backend).p95() if backup else None
+    if delay is None:
+        return await primary
+
+    pending = {primary}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=max(delay, HEDGE_MIN_DELAY))
+        if not done and admission.try_acquire(kind):
+            tried.add(backup)
+            print(f"[GATEWAY] {backend[0]}/{backend[1]} past p95 ({delay:.2f}s), hedging with {backup[0]}/{backup[1]}")
+            hedged = asyncio.create_task(_timed(backup, prompt, temperature, image_bytes, site))
+            hedged.add_done_callback(lambda _: admission.release())
+            pending.add(hedged)
+        elif not done:
+            print(f"[GATEWAY] {backend[0]}/{backend[1]} past p95 ({delay:.2f}s), no free slot to hedge")
+
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                elif task.result():
+                    return task.result()
+        if error is not None:
+            raise error
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def complete(
+    prompt: str | list[dict],
+    model: str,
+    temperature: float | None = None,
+    image_bytes: bytes | None = None,
+    provider: str = "groq",
+    fallbacks: tuple[str, ...] = (),
+    hedge: bool = False,
+    kind: str = "chat",
+    site: str | None = None,
+) -> str | None:
+    """
+    Return a completion from the healthiest backend serving model, moving on
+    to equivalent backends and then to the fallback models when one fails.
+    prompt is a string or a chat_messages list; every provider accepts both.
+    site names the generation profile; its temperature applies when none is
+    given and its timeout bounds each backend attempt. Raises the last error if every backend raised, and admission.Overloaded
+    if the call was shed before it started.
+    """
+    if temperature is None:
+        temperature = generation_profiles.get(site).temperature
+    async with admission.slot(kind):
+        return await _complete(prompt, model, temperature, image_bytes, provider, fallbacks, hedge, site, kind)
+
+
+async def _complete(prompt, model, temperature, image_bytes, provider, fallbacks, hedge, site, kind):
+    candidates = _candidates(provider, (model, *fallbacks), image_bytes)
+    if not candidates:
+        # Every breaker is open; ask the requested backend anyway rather than fail outright.
+        print(f"[GATEWAY] No healthy backend for {provider}/{model}, trying it anyway")
+        candidates = [(provider, model)]
+
+    tried: set[tuple[str, str]] = set()
+    last_error = None
+    for i, backend in enumerate(candidates):
+        if backend in tried:
+            continue
+        backup = None
+        if hedge:
+            backup = next((b for b in candidates[i + 1:] if b not in tried), None)
+        try:
+            result = await _run(backend, backup, tried, prompt, temperature, image_bytes, site, kind)
+        except Exception as e:
+            last_error = e
+            print(f"[GATEWAY] {backend[0]}/{backend[1]} failed: {e}")
+            continue
+        if result:
+            return result
+
+    if last_error is not None:
+        raise last_error
+    return None
@@ -1,13 +1,17 @@
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 import os
+import asyncio
 import uvicorn
 import json
 import time
 import hmac
+import base64
+import binascii
 import hashlib
 import httpx
 from pathlib import Path
+import disk_writer
 
 app = FastAPI()
 RESULTS = {}
@@ -16,9 +20,29 @@ DISCORD_BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN", "").strip()
 
 VOTE_FILE = Path("topgg_votes.json")
 VOTE_DURATION_SECONDS = 60 * 60 * 12
+# Held from load to save so concurrent vote webhooks cannot overwrite each other.
+VOTES_LOCK = asyncio.Lock()
 
 PENDING_TRANSCRIPTIONS: dict[str, dict] = {}
 
+# Replicate webhook deliveries signed longer ago than this are refused as replays.
+REPLICATE_WEBHOOK_TOLERANCE = 300
+
+
+def load_replicate_webhook_key() -> bytes | None:
+    """The signing key from REPLICATE_WEBHOOK_SECRET ("whsec_<base64>"), or None if unset or malformed."""
+    secret = os.getenv("REPLICATE_WEBHOOK_SECRET", "").strip()
+    if not secret:
+        return None
+    try:
+        return base64.b64decode(secret.split("_", 1)[-1], validate=True)
+    except (binascii.Error, ValueError):
+        print("[Replicate Webhook] REPLICATE_WEBHOOK_SECRET is not a valid signing secret")
+        return None
+
+
+REPLICATE_WEBHOOK_KEY = load_replicate_webhook_key()
+
 def load_votes():
     if not VOTE_FILE.exists():
         return {}
@@ -29,9 +53,16 @@ def load_votes():
         return {}
 
 
-def save_votes(data):
-    with VOTE_FILE.open("w", encoding="utf-8") as f:
-        json.dump(data, f)
+async def save_votes(data):
+    payload = json.dumps(data)
+
+    def write() -> int:
+        with VOTE_FILE.open("w", encoding="utf-8") as f:
+            f.write(payload)
+        return len(payload)
+
+    # Runs on the writer thread; the webhook answers once the vote is on disk.
+    await disk_writer.write(str(VOTE_FILE), write)
 
 
 async def send_discord_message(channel_id: int, content: str):
@@ -178,9 +209,10 @@ async def topgg_webhook(req: Request):
     event_type = payload.get("type")
     if event_type == "vote.create":
         user_id = payload["data"]["user"]["platform_id"]
-        votes = load_votes()
-        votes[str(user_id)] = int(time.time() + VOTE_DURATION_SECONDS)
-        save_votes(votes)
+        async with VOTES_LOCK:
+            votes = load_votes()
+            votes[str(user_id)] = int(time.time() + VOTE_DURATION_SECONDS)
+            await save_votes(votes)
         print(f"[Top.gg] Vote received for user {user_id}")
     elif event_type == "webhook.test":
         print("[Top.gg] Webhook test received")
@@ -188,6 +220,42 @@ async def topgg_webhook(req: Request):
     return {"status": "ok"}
 
 
+@app.post("/replicate-webhook")
+async def replicate_webhook(req: Request):
+    """Finished Replicate predictions; replicate_client picks them up from /result/{id}."""
+    key = REPLICATE_WEBHOOK_KEY
+    if key is None:
+        return JSONResponse(status_code=500, content={"error": "Webhook secret not configured"})
+    webhook_id = req.headers.get("webhook-id", "")
+    timestamp = req.headers.get("webhook-timestamp", "")
+    signatures = req.headers.get("webhook-signature", "")
+    if not webhook_id or not timestamp or not signatures:
+        return JSONResponse(status_code=401, content={"error": "Missing signature headers"})
+    try:
+        sent_at = int(timestamp)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "Malformed timestamp"})
+    if abs(time.time() - sent_at) > REPLICATE_WEBHOOK_TOLERANCE:
+        return JSONResponse(status_code=401, content={"error": "Stale timestamp"})
+
+    raw_body = await req.body()
+    signed = f"{webhook_id}.{timestamp}.".encode() + raw_body
+    expected = base64.b64encode(hmac.new(key, signed, hashlib.sha256).digest()).decode()
+    if not any(
+        hmac.compare_digest(expected, sig.split(",", 1)[-1])
+        for sig in signatures.split()
+    ):
+        return JSONResponse(status_code=401, content={"error": "Invalid signature"})
+
+    prediction = json.loads(raw_body)
+    prediction_id = prediction.get("id")
+    status = prediction.get("status")
+    print(f"[Replicate Webhook] {status} | prediction_id={prediction_id}")
+    if prediction_id and status in ("succeeded", "failed", "canceled"):
+        RESULTS[prediction_id] = prediction
+    return {"status": "ok"}
+
+
 @app.get("/result/{request_id}")
 async def get_result(request_id: str):
     if request_id in RESULTS:
@@ -1,136 +1,615 @@
 import os
+import re
 import json
-from datetime import datetime
-from encryption import save_encrypted, load_encrypted
+import time
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timezone
+import persistence
+from chat_messages import CHARS_PER_TOKEN, estimate_tokens
+from encryption import (
+    load_encrypted,
+    append_encrypted,
+    write_encrypted_lines,
+    load_encrypted_lines,
+)
+
+DEFAULT_MODEL = "openai/gpt-oss-120b"
+
+# Rewrite a channel segment as a single snapshot record once it holds this
+# many records.
+COMPACT_AFTER_RECORDS = 60
+
+# Upper bound for resident channel histories; least recently used idle
+# channels are dropped from RAM (never from disk) past this.
+MEMORY_BUDGET_BYTES = int(os.getenv("MEMORY_BUDGET_BYTES", str(8 * 1024 * 1024)))
+
+_CHANNEL_OVERHEAD = 512
+_MESSAGE_OVERHEAD = 96
+_FLAGS_SEGMENT = "_flags"
+
+# Evicted lines waiting for the summarizer; the oldest are dropped past this.
+MAX_UNSUMMARIZED = 40
+
+
+class ChannelHistory:
+    """
+    Fixed-capacity ring buffer of (author, text, timestamp) entries.
+    Appending is O(1); once full, each append overwrites the oldest entry.
+    Timestamps are UTC epoch seconds.
+
+    The rendered "author: text" transcript and each line's token estimate
+    are kept up to date on append and evict, so building a prompt does not
+    re-join the whole history every message.
+    """
+
+    __slots__ = (
+        "capacity", "_authors", "_texts", "_times", "_tokens", "_lens",
+        "_start", "_size", "_rendered", "_total_tokens",
+    )
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._authors = [None] * capacity
+        self._texts = [None] * capacity
+        self._times = array("d", bytes(8 * capacity))
+        self._tokens = array("L", bytes(array("L").itemsize * capacity))
+        self._lens = array("L", bytes(array("L").itemsize * capacity))
+        self._start = 0
+        self._size = 0
+        self._rendered = ""
+        self._total_tokens = 0
+
+    def append(self, author, text, ts):
+        """Add an entry. Returns the entry it displaced, if any."""
+        evicted = None
+        if self._size < self.capacity:
+            idx = (self._start + self._size) % self.capacity
+            self._size += 1
+        else:
+            idx = self._start
+            evicted = (self._authors[idx], self._texts[idx], self._times[idx])
+            self._rendered = self._rendered[self._lens[idx] + 1:]
+            self._total_tokens -= self._tokens[idx]
+            self._start = (self._start + 1) % self.capacity
+
+        line = f"{author}: {text}"
+        tokens = estimate_tokens(line)
+        self._authors[idx] = author
+        self._texts[idx] = text
+        self._times[idx] = ts
+        self._tokens[idx] = tokens
+        self._lens[idx] = len(line)
+        self._rendered = f"{self._rendered}\n{line}" if self._rendered else line
+        self._total_tokens += tokens
+        return evicted
+
+    def clear(self):
+        for i in range(self.capacity):
+            self._authors[i] = None
+            self._texts[i] = None
+        self._start = 0
+        self._size = 0
+        self._rendered = ""
+        self._total_tokens = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for i in range(self._size):
+            idx = (self._start + i) % self.capacity
+            yield self._authors[idx], self._texts[idx], self._times[idx]
+
+    def last_timestamp(self):
+        if not self._size:
+            return None
+        return self._times[(self._start + self._size - 1) % self.capacity]
+
+    def lines(self, n=None):
+        entries = list(self)
+        if n is not None:
+            entries = entries[-n:] if n > 0 else []
+        return [f"{author}: {text}" for author, text, _ in entries]
+
+    @property
+    def total_tokens(self):
+        return self._total_tokens
+
+    def render(self, token_budget=None):
+        """
+        Return the transcript, keeping only the newest lines that fit in
+        token_budget. The newest line is always kept, cut down to the
+        budget if it is larger than the budget on its own.
+        """
+        if token_budget is None or self._total_tokens <= token_budget:
+            return self._rendered
+
+        used = 0
+        offset = len(self._rendered) + 1
+        for i in range(self._size - 1, -1, -1):
+            idx = (self._start + i) % self.capacity
+            if used + self._tokens[idx] > token_budget:
+                break
+            used += self._tokens[idx]
+            offset -= self._lens[idx] + 1
+
+        if offset > len(self._rendered):
+            newest_len = self._lens[(self._start + self._size - 1) % self.capacity]
+            newest = self._rendered[len(self._rendered) - newest_len:]
+            return newest[:max(token_budget, 1) * CHARS_PER_TOKEN]
+        return self._rendered[offset:]
+
+    def entries(self, token_budget=None):
+        """
+        Return the newest (author, text) pairs that fit in token_budget,
+        oldest first, with the same budget rule as render().
+        """
+        if token_budget is None or self._total_tokens <= token_budget:
+            return [(author, text) for author, text, _ in self]
+
+        kept = []
+        used = 0
+        for i in range(self._size - 1, -1, -1):
+            idx = (self._start + i) % self.capacity
+            if used + self._tokens[idx] > token_budget:
+                break
+            used += self._tokens[idx]
+            kept.append((self._authors[idx], self._texts[idx]))
+
+        if not kept and self._size:
+            idx = (self._start + self._size - 1) % self.capacity
+            author = self._authors[idx]
+            room = max(max(token_budget, 1) * CHARS_PER_TOKEN - len(author) - 2, 0)
+            return [(author, self._texts[idx][:room])]
+        kept.reverse()
+        return kept
+
+    def text_bytes(self):
+        return len(self._rendered)
 
 
 class MemoryManager:
-    def __init__(self, limit=15, file_path=None):
+    """
+    Conversation memory sharded into one encrypted segment per channel.
+
+    A segment is a snapshot record followed by append-only change records.
+    Channels are read from disk the first time they are needed and kept in
+    an LRU cache bounded by budget_bytes, so startup cost and RSS do not
+    grow with the number of channels the bot has ever seen.
+    """
+
+    def __init__(self, limit=15, file_path=None, budget_bytes=MEMORY_BUDGET_BYTES):
         self.limit = limit
         self.file_path = file_path
-        self.memory = {}
+        self.segment_dir = os.path.splitext(file_path)[0] if file_path else None
+        self.budget_bytes = budget_bytes
+        self.memory = OrderedDict()
         self.flags = {}
 
+        self._sizes = {}
+        self._resident_bytes = 0
+        self._segment_records = {}
+        self._pending = {}
+        self._retry = []
+        # Channel id -> ops queued for the writer or waiting for a retry. A
+        # channel with unwritten ops must stay resident: reloading it from
+        # the stale segment and compacting would overwrite those records.
+        self._unwritten = {}
+        self._unwritten_lock = threading.Lock()
+        self._store_name = f"memory:{file_path}"
+        # Called with a channel id whenever a line leaves its window.
+        self.on_evict = None
+        self.stats = {"loads": 0, "evictions": 0, "compactions": 0}
+
         if self.file_path:
-            self._load()
+            os.makedirs(self.segment_dir, exist_ok=True)
+            self._migrate_legacy()
+            self._load_flags()
+            persistence.register(self._store_name, self._snapshot_pending)
 
     # ---------------- LOAD / SAVE ----------------
 
-    def _load(self):
-        if not self.file_path or not os.path.exists(self.file_path):
+    def _segment_path(self, channel_id):
+        name = re.sub(r"[^A-Za-z0-9_-]", "_", str(channel_id))
+        return os.path.join(self.segment_dir, f"{name}.seg")
+
+    def _load_flags(self):
+        path = self._segment_path(_FLAGS_SEGMENT)
+        if not os.path.exists(path):
             return
         try:
-            raw = load_encrypted(self.file_path)
-            data = json.loads(raw)
-            self.memory = data.get("memory", {})
-            self.flags = data.get("flags", {})
+            for line in load_encrypted_lines(path):
+                self.flags.update(json.loads(line))
         except Exception as e:
-            print(f"[MEMORY] Load error: {e}")
-            self.memory = {}
-            self.flags = {}
+            print(f"[MEMORY] Flags load error: {e}")
 
-    def persist(self):
+    def _load_channel(self, channel_id):
         if not self.file_path:
+            return None
+        path = self._segment_path(channel_id)
+        if not os.path.exists(path):
+            return None
+        chan = self._new_channel()
+        count = 0
+        try:
+            for line in load_encrypted_lines(path):
+                _apply(chan, json.loads(line))
+                count += 1
+        except Exception as e:
+            print(f"[MEMORY] Load error for {channel_id}: {e}")
+        self._segment_records[channel_id] = count
+        self.stats["loads"] += 1
+        return chan
+
+    def _channel(self, channel_id, create=False):
+        """Return the resident record for a channel, loading it on first use."""
+        chan = self.memory.get(channel_id)
+        if chan is not None:
+            self.memory.move_to_end(channel_id)
+            return chan
+
+        chan = self._load_channel(channel_id)
+        if chan is None:
+            if not create:
+                return None
+            chan = self._new_channel()
+            self._segment_records[channel_id] = 0
+        self.memory[channel_id] = chan
+        self._resize(channel_id)
+        self._evict()
+        return chan
+
+    def persist(self):
+        """Schedule the records created since the last flush to be journaled."""
+        if self.file_path and self._pending:
+            persistence.mark_dirty(self._store_name)
+
+    def flush(self):
+        """Write pending records now (blocking when the event loop is down)."""
+        if self.file_path:
+            persistence.flush(self._store_name)
+
+    def _snapshot_pending(self):
+        """
+        Decide on the loop what each segment needs (append or compacting
+        rewrite) and return a writer that does the encryption and file I/O.
+        persistence runs at most one writer for this store at a time, so
+        appends reach each segment in order.
+        """
+        pending, self._pending = self._pending, {}
+        ops, self._retry = self._retry, []
+        for channel_id, records in pending.items():
+            path = self._segment_path(channel_id)
+            if channel_id == _FLAGS_SEGMENT:
+                ops.append((channel_id, write_encrypted_lines, path, _flag_records(self.flags)))
+            else:
+                count = self._segment_records.get(channel_id, 0) + len(records)
+                chan = self.memory.get(channel_id)
+                if chan is not None and count > COMPACT_AFTER_RECORDS:
+                    records = _snapshot(chan)
+                    ops.append((channel_id, write_encrypted_lines, path, records))
+                    self._segment_records[channel_id] = len(records)
+                    self.stats["compactions"] += 1
+                else:
+                    ops.append((channel_id, append_encrypted, path, records))
+                    self._segment_records[channel_id] = count
+            with self._unwritten_lock:
+                self._unwritten[channel_id] = self._unwritten.get(channel_id, 0) + 1
+        self._evict()
+
+        def write() -> int:
+            written = 0
+            for op in ops:
+                channel_id, save, path, records = op
+                try:
+                    written += save(path, records)
+                except Exception as e:
+                    print(f"[MEMORY] Save error for {channel_id}: {e}")
+                    # Retried, in order, with the next flush; the channel stays held.
+                    self._retry.append(op)
+                    continue
+                with self._unwritten_lock:
+                    left = self._unwritten.get(channel_id, 1) - 1
+                    if left > 0:
+                        self._unwritten[channel_id] = left
+                    else:
+                        self._unwritten.pop(channel_id, None)
+            return written
+
+        return write
+
+    def _evict(self):
+        """Drop least recently used channels that have nothing left to write."""
+        if self._resident_bytes <= self.budget_bytes:
+            return
+        with self._unwritten_lock:
+            unwritten = set(self._unwritten)
+        for channel_id in list(self.memory):
+            if self._resident_bytes <= self.budget_bytes or len(self.memory) == 1:
+                break
+            if channel_id in self._pending or channel_id in unwritten:
+                continue
+            del self.memory[channel_id]
+            self._resident_bytes -= self._sizes.pop(channel_id, 0)
+            self._segment_records.pop(channel_id, None)
+            self.stats["evictions"] += 1
+
+    def _resize(self, channel_id):
+        chan = self.memory[channel_id]
+        history = chan["history"]
+        size = (
+            _CHANNEL_OVERHEAD + history.text_bytes() + _MESSAGE_OVERHEAD * len(history)
+            + len(chan["summary"])
+        )
+        self._resident_bytes += size - self._sizes.get(channel_id, 0)
+        self._sizes[channel_id] = size
+
+    def _migrate_legacy(self):
+        """Split a single-file snapshot (+ journal) into per-channel segments."""
+        journal_path = f"{self.file_path}.journal"
+        if not os.path.exists(self.file_path):
             return
         try:
-            # timestamps are datetime objects in memory — convert to strings for JSON
-            serializable = {}
-            for chan_id, data in self.memory.items():
-                serializable[chan_id] = {
-                    "messages":     data.get("messages", []),
-                    "timestamps":   [
-                        t.isoformat() if isinstance(t, datetime) else t
-                        for t in data.get("timestamps", [])
-                    ],
-                    "roast_target": data.get("roast_target"),
-                    "mode":         data.get("mode", "funny"),
-                    "model":        data.get("model", "openai/gpt-oss-120b"),
-                }
-            save_encrypted(self.file_path, json.dumps({"memory": serializable, "flags": self.flags}))
+            data = json.loads(load_encrypted(self.file_path))
         except Exception as e:
-            print(f"[MEMORY] Save error: {e}")
+            print(f"[MEMORY] Legacy load error: {e}")
+            return
+        channels = data.get("memory", {})
+        flags = data.get("flags", {})
+        seq = data.get("seq", 0)
+
+        replay = {}
+        if os.path.exists(journal_path):
+            for line in load_encrypted_lines(journal_path):
+                record = json.loads(line)
+                if record["s"] <= seq:
+                    continue
+                if record["op"] == "flag":
+                    flags[record["k"]] = True
+                    continue
+                replay.setdefault(record["c"], []).append(record)
+
+        for channel_id in set(channels) | set(replay):
+            chan = self._new_channel()
+            if channel_id in channels:
+                _apply(chan, {**channels[channel_id], "op": "snap"})
+            for record in replay.get(channel_id, []):
+                _apply(chan, record)
+            write_encrypted_lines(self._segment_path(channel_id), _snapshot(chan))
+        if flags:
+            write_encrypted_lines(self._segment_path(_FLAGS_SEGMENT), _flag_records(flags))
+
+        os.remove(self.file_path)
+        if os.path.exists(journal_path):
+            os.remove(journal_path)
+        print(f"[MEMORY] Migrated {len(set(channels) | set(replay))} channel(s) to {self.segment_dir}/")
+
+    # ---------------- CHANGE RECORDS ----------------
+
+    def _new_channel(self):
+        return {
+            "history":      ChannelHistory(self.limit),
+            "roast_target": None,
+            "mode":         "funny",
+            "model":        DEFAULT_MODEL,
+            "summary":      "",
+            "unsummarized": [],
+        }
+
+    def _record(self, channel_id, record):
+        chan = self._channel(channel_id, create=True)
+        evicted = _apply(chan, record)
+        if record["op"] in ("msg", "clear", "summary"):
+            self._resize(channel_id)
+        self._pending.setdefault(channel_id, []).append(json.dumps(record))
+        if evicted and self.on_evict is not None:
+            author, text, _ = evicted
+            pending = chan["unsummarized"]
+            pending.append(f"{author}: {text}")
+            del pending[:-MAX_UNSUMMARIZED]
+            self.on_evict(channel_id)
 
     # ---------------- MESSAGE LOGGING ----------------
 
     def add_message(self, channel_id, user, message):
-        self._ensure_channel(channel_id)
-        entry = f"{user}: {message}"
-        self.memory[channel_id]["messages"].append(entry)
-        self.memory[channel_id]["messages"] = self.memory[channel_id]["messages"][-self.limit:]
-        self.memory[channel_id]["timestamps"].append(datetime.utcnow())
-        self.memory[channel_id]["timestamps"] = self.memory[channel_id]["timestamps"][-self.limit:]
+        self._record(channel_id, _message_record(user, message, time.time()))
+
+    def get_history(self, channel_id):
+        """Return the channel's ChannelHistory, or None if it has none yet."""
+        chan = self._channel(channel_id)
+        if chan is not None:
+            return chan["history"]
+        return None
+
+    # ---------------- ROLLING SUMMARY ----------------
+
+    def get_summary(self, channel_id):
+        chan = self._channel(channel_id)
+        return chan["summary"] if chan is not None else ""
+
+    def get_unsummarized(self, channel_id):
+        """Lines that left the window but are not in the summary yet."""
+        chan = self._channel(channel_id)
+        return list(chan["unsummarized"]) if chan is not None else []
+
+    def take_unsummarized(self, channel_id):
+        chan = self._channel(channel_id)
+        if chan is None:
+            return []
+        lines, chan["unsummarized"] = chan["unsummarized"], []
+        return lines
+
+    def restore_unsummarized(self, channel_id, lines):
+        """Put lines back after a failed summary, ahead of newer ones."""
+        chan = self._channel(channel_id)
+        if chan is not None:
+            chan["unsummarized"][:0] = lines
+            del chan["unsummarized"][:-MAX_UNSUMMARIZED]
+
+    def set_summary(self, channel_id, summary):
+        self._record(channel_id, {"op": "summary", "s": summary})
 
     def get_recent_flat(self, channel_id, n):
-        if channel_id in self.memory:
-            return self.memory[channel_id]["messages"][-n:]
+        chan = self._channel(channel_id)
+        if chan is not None:
+            return chan["history"].lines(n)
         return []
 
     def get_last_timestamp(self, channel_id):
-        if channel_id in self.memory and self.memory[channel_id]["timestamps"]:
-            return self.memory[channel_id]["timestamps"][-1]
+        chan = self._channel(channel_id)
+        if chan is not None:
+            ts = chan["history"].last_timestamp()
+            if ts is not None:
+                return datetime.utcfromtimestamp(ts)
         return None
 
     # ---------------- ROAST TARGET ----------------
 
     def set_roast_target(self, channel_id, target_name):
-        self._ensure_channel(channel_id)
-        self.memory[channel_id]["roast_target"] = target_name
+        self._record(channel_id, {"op": "roast", "v": target_name})
 
     def get_roast_target(self, channel_id):
-        if channel_id in self.memory:
-            return self.memory[channel_id]["roast_target"]
+        chan = self._channel(channel_id)
+        if chan is not None:
+            return chan["roast_target"]
         return None
 
     def remove_roast_target(self, channel_id):
-        if channel_id in self.memory:
-            self.memory[channel_id]["roast_target"] = None
+        if self._channel(channel_id) is not None:
+            self._record(channel_id, {"op": "roast", "v": None})
 
     # ---------------- CHANNEL MODE ----------------
 
     def save_channel_mode(self, channel_id, mode):
-        self._ensure_channel(channel_id)
-        self.memory[channel_id]["mode"] = mode
+        self._record(channel_id, {"op": "mode", "v": mode})
 
     def get_channel_mode(self, channel_id):
-        if channel_id in self.memory:
-            return self.memory[channel_id].get("mode")
+        chan = self._channel(channel_id)
+        if chan is not None:
+            return chan.get("mode")
         return None
 
     # ---------------- CHANNEL MODEL ----------------
 
     def save_channel_model(self, channel_id, model):
-        self._ensure_channel(channel_id)
-        self.memory[channel_id]["model"] = model
+        self._record(channel_id, {"op": "model", "v": model})
 
     def get_channel_model(self, channel_id):
-        if channel_id in self.memory:
-            return self.memory[channel_id].get("model", "openai/gpt-oss-120b")
-        return "openai/gpt-oss-120b"
+        chan = self._channel(channel_id)
+        if chan is not None:
+            return chan.get("model", DEFAULT_MODEL)
+        return DEFAULT_MODEL
 
     def clear_channel_messages(self, channel_id):
-        self._ensure_channel(channel_id)
-        self.memory[channel_id]["messages"] = []
-        self.memory[channel_id]["timestamps"] = []
+        self._record(channel_id, {"op": "clear"})
 
     # ---------------- FLAGS ----------------
 
     def set_flag(self, key):
         self.flags[key] = True
+        self._pending[_FLAGS_SEGMENT] = []
 
     def get_flag(self, key):
         return self.flags.get(key, False)
 
     # ---------------- INTERNAL ----------------
 
-    def _ensure_channel(self, channel_id):
-        if channel_id not in self.memory:
-            self.memory[channel_id] = {
-                "messages":     [],
-                "timestamps":   [],
-                "roast_target": None,
-                "mode":         "funny",
-                "model":        "openai/gpt-oss-120b",
-            }
-
     async def close(self):
-        self.persist()
+        if self.file_path:
+            await persistence.flush_now(self._store_name)
+
+
+def _flag_records(flags):
+    return [json.dumps({key: value}) for key, value in flags.items()]
+
+
+def _message_record(author, text, ts):
+    return {
+        "op": "msg",
+        "a":  author,
+        "x":  text,
+        "t":  ts,
+    }
+
+
+def _snapshot(chan):
+    """
+    Encode a channel as a settings record followed by one record per
+    message. Message records match the ones add_message journals, and
+    records encrypt deterministically, so a compacted segment shares most of
+    its lines with the segment it replaces.
+    """
+    records = [{
+        "op":           "snap",
+        "history":      [],
+        "roast_target": chan.get("roast_target"),
+        "mode":         chan.get("mode", "funny"),
+        "model":        chan.get("model", DEFAULT_MODEL),
+        "summary":      chan.get("summary", ""),
+    }]
+    records.extend(_message_record(author, text, ts) for author, text, ts in chan["history"])
+    return [json.dumps(record) for record in records]
+
+
+def _apply(chan, record):
+    """Apply one change record. Returns the entry a message pushed out, if any."""
+    op = record["op"]
+    history = chan["history"]
+    if op == "snap":
+        history.clear()
+        if "messages" in record:
+            # Older snapshots kept "author: text" strings and a parallel
+            # list of ISO timestamps.
+            stamps = record.get("timestamps", [])
+            for i, entry in enumerate(record["messages"]):
+                author, text = _split_entry(entry)
+                history.append(author, text, _to_epoch(stamps[i] if i < len(stamps) else None))
+        for author, text, ts in record.get("history", []):
+            history.append(author, text, ts)
+        chan["roast_target"] = record.get("roast_target")
+        chan["mode"] = record.get("mode", "funny")
+        chan["model"] = record.get("model", DEFAULT_MODEL)
+        chan["summary"] = record.get("summary", "")
+    elif op == "msg":
+        if "e" in record:
+            author, text = _split_entry(record["e"])
+        else:
+            author, text = record["a"], record["x"]
+        return history.append(author, text, _to_epoch(record["t"]))
+    elif op == "summary":
+        chan["summary"] = record["s"]
+    elif op == "roast":
+        chan["roast_target"] = record["v"]
+    elif op == "mode":
+        chan["mode"] = record["v"]
+    elif op == "model":
+        chan["model"] = record["v"]
+    elif op == "clear":
+        history.clear()
+        chan["summary"] = ""
+        chan["unsummarized"] = []
+    return None
+
+
+def _split_entry(entry):
+    author, sep, text = entry.partition(": ")
+    if not sep:
+        return "", entry
+    return author, text
+
+
+def _to_epoch(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return 0.0
+        # Older records stored naive datetime.utcnow() values.
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    return 0.0
@@ -1,6 +1,10 @@
 """
-Run this ONCE before deploying encryption to migrate your existing plain JSON files.
-After running successfully, delete this script.
+Convert the encrypted data files to the record format used by encryption.py.
+
+Handles plain JSON files and whole-file Fernet blobs from older versions,
+and rewrites conversation memory segments with the deterministic record
+cipher. Files already in the new format are left alone, so it is safe to
+run more than once.
 
 Usage:
     python migrate.py
@@ -14,16 +18,22 @@ import sys
 from dotenv import load_dotenv
 load_dotenv()
 
-from encryption import save_encrypted
+from encryption import (
+    save_records,
+    load_records,
+    is_record_file,
+    load_encrypted_lines,
+    write_encrypted_lines,
+)
 
 FILES = [
     "mod_data.json",
     "vote_unlocks.json",
-    "codunot_memory.json",
     "playlists.json",
-    "usage.json",
 ]
 
+MEMORY_DIR = "codunot_memory"
+
 success = 0
 skipped = 0
 failed = 0
@@ -35,25 +45,27 @@ for filepath in FILES:
         continue
 
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
+        if is_record_file(filepath):
+            print(f"[SKIP] {filepath} — already in record format")
+            skipped += 1
+            continue
+
+        with open(filepath, "rb") as f:
             content = f.read()
 
-        # Validate it's actually plain JSON (not already encrypted)
+        # Plain JSON from before encryption, otherwise a whole-file Fernet blob
         try:
-            json.loads(content)
-        except json.JSONDecodeError:
-            print(f"[SKIP] {filepath} — doesn't look like plain JSON, may already be encrypted")
-            skipped += 1
-            continue
+            data = json.loads(content.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            data = load_records(filepath)
 
         # Back up the original just in case
         backup_path = filepath + ".bak"
-        with open(backup_path, "w", encoding="utf-8") as f:
+        with open(backup_path, "wb") as f:
             f.write(content)
         print(f"[BACKUP] {filepath} → {backup_path}")
 
-        # Write encrypted version
-        save_encrypted(filepath, content)
+        save_records(filepath, data)
         print(f"[OK] Migrated {filepath}")
         success += 1
 
@@ -61,10 +73,26 @@ for filepath in FILES:
         print(f"[FAIL] {filepath} — {e}")
         failed += 1
 
+# Memory segments keep their layout; re-encrypting them replaces any
+# Fernet lines with deterministic ones and leaves converted lines unchanged.
+if os.path.isdir(MEMORY_DIR):
+    converted = 0
+    for name in sorted(os.listdir(MEMORY_DIR)):
+        if not name.endswith(".seg"):
+            continue
+        path = os.path.join(MEMORY_DIR, name)
+        try:
+            write_encrypted_lines(path, load_encrypted_lines(path))
+            converted += 1
+        except Exception as e:
+            print(f"[FAIL] {path} — {e}")
+            failed += 1
+    print(f"[OK] Re-encrypted {converted} memory segment(s) in {MEMORY_DIR}/")
+
 print(f"\nDone. {success} migrated, {skipped} skipped, {failed} failed.")
 if failed:
     print("Check the errors above before starting the bot.")
     sys.exit(1)
 else:
-    print("You can now start the bot with encryption active.")
-    print("Once everything works, delete the .bak files and this script.")
+    print("You can now start the bot.")
+    print("Once everything works, delete the .bak files.")
@@ -1,12 +1,13 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import json, os, asyncio, re, random
+import os, asyncio, re, random
 from datetime import datetime, timedelta, timezone
 from collections import defaultdict, deque
 from typing import Literal, Optional
 from dataclasses import dataclass, field
-from encryption import save_encrypted, load_encrypted
+from encryption import encode_records, write_records, save_records, load_records
+import persistence
 
 MOD_DATA_FILE = "mod_data.json"
 
@@ -15,8 +16,7 @@ def load_mod_data() -> dict:
     if not os.path.exists(MOD_DATA_FILE):
         return default
     try:
-        raw = load_encrypted(MOD_DATA_FILE)
-        data = json.loads(raw)
+        data = load_records(MOD_DATA_FILE)
         for k, v in default.items():
             data.setdefault(k, v)
         return data
@@ -24,11 +24,12 @@ def load_mod_data() -> dict:
         print(f"[MOD] Load error: {e}")
         return default
 
-def save_mod_data(data: dict):
+def save_mod_data(data: dict) -> int:
     try:
-        save_encrypted(MOD_DATA_FILE, json.dumps(data, indent=2))
+        return save_records(MOD_DATA_FILE, data)
     except Exception as e:
         print(f"[MOD] Save error: {e}")
+        return 0
 
 def _guild_cfg(data: dict, guild_id: int) -> dict:
     gid = str(guild_id)
@@ -837,12 +838,17 @@ class ModerationCog(commands.Cog, name="ModerationCog"):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.mod_data = load_mod_data()
+        persistence.register("mod_data", self._snapshot)
 
     async def cog_load(self):
         asyncio.create_task(self._process_pending_unbans())
 
     def _save(self):
-        save_mod_data(self.mod_data)
+        persistence.mark_dirty("mod_data")
+
+    def _snapshot(self):
+        records = encode_records(self.mod_data)
+        return lambda: write_records(MOD_DATA_FILE, records)
 
     def _cfg(self, guild_id: int) -> dict:
         return _guild_cfg(self.mod_data, guild_id)
@@ -1488,7 +1494,7 @@ class ModerationCog(commands.Cog, name="ModerationCog"):
         if tier == "enterprise" and cfg.get("ai_moderation_enabled", False):
             try:
                 from groq_client import call_groq
-                result = await call_groq(message.content)
+                result = await call_groq(message.content, site="moderation")
                 if result and result.get("flagged", False):
                     await message.delete()
                     await message.channel.send(
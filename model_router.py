@@ -0,0 +1,167 @@
+"""
+Per-message model choice for channels set to the "auto" model.
+
+score() rates how demanding a message looks from cheap local signals:
+length, question markers, code, maths, attachments, mode and how deep in
+a reply chain it sits. route() maps the score to a bucket:
+
+    fast   score < AUTO_ROUTE_MID     llama-3.1-8b-instant
+    mid    score < AUTO_ROUTE_LARGE   llama-4-scout
+    large  otherwise                  gpt-oss-120b
+
+so "lol" in fun mode goes to the 8B model and a code question in serious
+mode to the 120B one.
+
+    route = model_router.route(content, mode, attachments=1)
+    ...
+    model_router.record(route, chan_id, latency, ok)
+
+record() prints one [ROUTER] line per reply with the score, the signals
+that made it up, the bucket and the latency, which is what the thresholds
+are tuned against offline. A summary of latency by bucket is printed every
+STATS_INTERVAL seconds once start() has been called.
+"""
+
+import asyncio
+import os
+import re
+from collections import deque
+from dataclasses import dataclass
+
+AUTO_MODEL = "auto"
+
+BUCKET_MODELS = {
+    "fast": "llama-3.1-8b-instant",
+    "mid": "meta-llama/llama-4-scout-17b-16e-instruct",
+    "large": "openai/gpt-oss-120b",
+}
+
+MID_THRESHOLD = float(os.getenv("AUTO_ROUTE_MID", "2"))
+LARGE_THRESHOLD = float(os.getenv("AUTO_ROUTE_LARGE", "5"))
+STATS_INTERVAL = 300
+LATENCY_SAMPLES = 200
+
+_CODE = re.compile(r"```|`[^`\n]+`|\b(def|class|function|import|return|const|SELECT|#include)\b|[{};]\s*$", re.M)
+_MATH = re.compile(r"\d\s*[-+*/^=]\s*\d|\b(solve|integral|derivative|equation|prove)\b", re.I)
+_QUESTION_WORDS = re.compile(
+    r"\b(how|why|what|explain|compare|difference|describe|analy[sz]e|summari[sz]e|write|debug|fix)\b", re.I
+)
+
+MODE_WEIGHTS = {
+    "serious": 2.0,
+    "rizz_online": 1.0,
+    "rizz_irl": 1.0,
+}
+
+
+@dataclass(frozen=True)
+class Route:
+    bucket: str
+    model: str
+    score: float
+    signals: tuple[str, ...]
+
+
+def score(text: str, mode: str, attachments: int = 0, reply_depth: int = 0) -> tuple[float, list[str]]:
+    """Complexity score for a message and the signals that contributed to it."""
+    text = text or ""
+    total = 0.0
+    signals = []
+
+    def add(name: str, weight: float):
+        nonlocal total
+        total += weight
+        signals.append(f"{name}+{weight:g}")
+
+    words = len(text.split())
+    if words > 120:
+        add("long", 3)
+    elif words > 40:
+        add("medium", 2)
+    elif words > 12:
+        add("sentence", 1)
+
+    questions = text.count("?")
+    if questions or _QUESTION_WORDS.search(text):
+        add("question", 1)
+    if questions > 1:
+        add("questions", 1)
+    if _CODE.search(text):
+        add("code", 3)
+    if _MATH.search(text):
+        add("math", 2)
+    if attachments:
+        add("attachment", 2)
+    if mode in MODE_WEIGHTS:
+        add(mode, MODE_WEIGHTS[mode])
+    if reply_depth:
+        add("reply", min(reply_depth, 2))
+    return total, signals
+
+
+def route(text: str, mode: str, attachments: int = 0, reply_depth: int = 0) -> Route:
+    total, signals = score(text, mode, attachments, reply_depth)
+    if total >= LARGE_THRESHOLD:
+        bucket = "large"
+    elif total >= MID_THRESHOLD:
+        bucket = "mid"
+    else:
+        bucket = "fast"
+    return Route(bucket, BUCKET_MODELS[bucket], total, tuple(signals))
+
+
+# ---------------- STATS ----------------
+_stats = {bucket: {"replies": 0, "failures": 0, "latencies": deque(maxlen=LATENCY_SAMPLES)} for bucket in BUCKET_MODELS}
+
+
+def record(route: Route, chan_id, latency: float, ok: bool = True) -> None:
+    s = _stats[route.bucket]
+    s["replies"] += 1
+    if ok:
+        s["latencies"].append(latency)
+    else:
+        s["failures"] += 1
+    print(
+        f"[ROUTER] {chan_id}: score {route.score:g} ({', '.join(route.signals) or 'none'}) "
+        f"-> {route.bucket} {route.model} in {latency * 1000:.0f} ms{'' if ok else ' (failed)'}"
+    )
+
+
+def _pct(values, q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def get_stats() -> dict:
+    return {
+        bucket: {
+            "model": BUCKET_MODELS[bucket],
+            "replies": s["replies"],
+            "failures": s["failures"],
+            "p50": _pct(s["latencies"], 0.5),
+            "p95": _pct(s["latencies"], 0.95),
+        }
+        for bucket, s in _stats.items()
+    }
+
+
+def _report() -> None:
+    for bucket, s in get_stats().items():
+        if not s["replies"]:
+            continue
+        print(
+            f"[ROUTER] {bucket} ({s['model']}): {s['replies']} replies, {s['failures']} failed, "
+            f"p50 {s['p50'] or 0:.2f}s p95 {s['p95'] or 0:.2f}s"
+        )
+
+
+async def _stats_loop():
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        _report()
+
+
+def start() -> None:
+    asyncio.create_task(_stats_loop())
@@ -3,6 +3,8 @@ import os
 import asyncio
 from dotenv import load_dotenv
 
+from chat_messages import as_messages
+
 load_dotenv()
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
@@ -23,7 +25,7 @@ async def get_session():
         SESSION = aiohttp.ClientSession()
     return SESSION
 
-async def call_openrouter(prompt: str, model: str, temperature: float = 1.0, retries: int = 4) -> str | None:
+async def call_openrouter(prompt: str | list[dict], model: str, temperature: float = 1.0, retries: int = 4) -> str | None:
     if not OPENROUTER_API_KEY:
         print("Missing OpenRouter API Key")
         return None
@@ -31,7 +33,7 @@ async def call_openrouter(prompt: str, model: str, temperature: float = 1.0, ret
     session = await get_session()
     payload = {
         "model": model,
-        "messages": [{"role": "user", "content": prompt}],
+        "messages": as_messages(prompt),
         "temperature": temperature,
     }
     headers = {
@@ -0,0 +1,269 @@
+"""
+Debounced persistence shared by every JSON / encrypted store.
+
+Stores register a snapshot callback once and then call mark_dirty() instead
+of writing their file. The snapshot runs on the event loop, captures the
+store's current state and returns a writer; the writer does the encryption
+and file I/O on the disk_writer thread, so the gateway loop never blocks on
+disk. A background flusher snapshots each dirty store at most once per
+PERSIST_MAX_LATENCY seconds, so a burst of changes costs one write, and a
+store is never written twice at the same time. flush_all() forces
+everything out on shutdown.
+
+A store that registers on_error is told, on the event loop, when one of its
+writes raised; it can take back whatever that write was carrying, and the
+store is left dirty so the next flush retries it.
+
+Until the flusher is running (imports, scripts, atexit) mark_dirty() writes
+straight away, so nothing depends on the event loop being up. Set
+PERSIST_WRITER_THREAD=0 to do the writes on the loop again, e.g. to compare
+the [LOOP] lag figures.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+import disk_writer
+
+MAX_LATENCY = float(os.getenv("PERSIST_MAX_LATENCY", "2.0"))
+USE_WRITER_THREAD = os.getenv("PERSIST_WRITER_THREAD", "1") != "0"
+STATS_INTERVAL = 300
+LAG_SAMPLE_INTERVAL = 0.25
+
+Writer = Callable[[], int | None]
+
+# name -> callback that snapshots the store and returns its writer
+_stores: dict[str, Callable[[], Writer]] = {}
+_on_error: dict[str, Callable[[Exception], None]] = {}
+_dirty: set[str] = set()
+_in_flight: dict[str, Future] = {}
+
+_wakeup: asyncio.Event | None = None
+_flusher_task: asyncio.Task | None = None
+
+_stats = {
+    "marks": 0,
+    "flushes": 0,
+    "bytes": 0,
+    "errors": 0,
+    "flush_seconds": 0.0,
+    "max_flush_ms": 0.0,
+    "snapshot_seconds": 0.0,
+    "max_snapshot_ms": 0.0,
+}
+_window_start = time.monotonic()
+_lag_samples: list[float] = []
+
+
+def register(name: str, snapshot: Callable[[], Writer], on_error: Callable[[Exception], None] | None = None) -> None:
+    _stores[name] = snapshot
+    if on_error is not None:
+        _on_error[name] = on_error
+
+
+def _flusher_running() -> bool:
+    if _flusher_task is None or _flusher_task.done():
+        return False
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def mark_dirty(name: str) -> None:
+    _stats["marks"] += 1
+    _dirty.add(name)
+    if not _flusher_running():
+        flush(name)
+        return
+    _wakeup.set()
+
+
+def flush(name: str) -> Future | None:
+    """Snapshot a store and write it. Returns the pending write, if queued."""
+    if name in _in_flight:
+        if _flusher_running():
+            # Picked up again once the running write finishes.
+            _dirty.add(name)
+            return _in_flight[name]
+        disk_writer.drain()
+        _in_flight.pop(name, None)
+    _dirty.discard(name)
+    snapshot = _stores.get(name)
+    if snapshot is None:
+        print(f"[PERSIST] No store registered as {name!r}")
+        return None
+
+    started = time.perf_counter()
+    try:
+        writer = snapshot()
+    except Exception as e:
+        _stats["errors"] += 1
+        print(f"[PERSIST] Snapshot of {name} failed: {e}")
+        return None
+    elapsed = time.perf_counter() - started
+    _stats["snapshot_seconds"] += elapsed
+    _stats["max_snapshot_ms"] = max(_stats["max_snapshot_ms"], elapsed * 1000)
+
+    if USE_WRITER_THREAD and _flusher_running():
+        loop = asyncio.get_running_loop()
+        future = disk_writer.submit(name, lambda: _timed(writer))
+        _in_flight[name] = future
+
+        def _done(f: Future) -> None:
+            try:
+                loop.call_soon_threadsafe(_write_done, name, f)
+            except RuntimeError:
+                pass  # loop already closed; flush_all() drains the thread
+
+        future.add_done_callback(_done)
+        return future
+
+    # Never let an inline write land before one still queued on the thread.
+    disk_writer.drain()
+    try:
+        _record_write(_timed(writer))
+    except Exception as e:
+        _write_failed(name, e)
+    return None
+
+
+def _timed(writer: Writer) -> tuple[int, float]:
+    started = time.perf_counter()
+    written = writer() or 0
+    return written, time.perf_counter() - started
+
+
+def _record_write(result: tuple[int, float]) -> None:
+    written, elapsed = result
+    _stats["flushes"] += 1
+    _stats["bytes"] += written
+    _stats["flush_seconds"] += elapsed
+    _stats["max_flush_ms"] = max(_stats["max_flush_ms"], elapsed * 1000)
+
+
+def _write_done(name: str, future: Future) -> None:
+    _in_flight.pop(name, None)
+    try:
+        _record_write(future.result())
+    except Exception as e:
+        _write_failed(name, e)
+    if name in _dirty and _wakeup is not None:
+        _wakeup.set()
+
+
+def _write_failed(name: str, error: Exception) -> None:
+    """Runs on the loop (or inline) after a writer raised."""
+    _stats["errors"] += 1
+    print(f"[PERSIST] Flush of {name} failed: {error}")
+    handler = _on_error.get(name)
+    if handler is None:
+        return
+    try:
+        handler(error)
+    except Exception as e:
+        print(f"[PERSIST] Error handler of {name} failed: {e}")
+    # Retried by the next flush, not straight away, so a dead disk does not spin.
+    _dirty.add(name)
+
+
+async def flush_now(name: str) -> None:
+    """Write a store immediately and wait until it is on disk."""
+    while name in _in_flight:
+        await asyncio.wrap_future(_in_flight[name])
+        await asyncio.sleep(0)  # let _write_done run
+    future = flush(name)
+    if future is not None:
+        await asyncio.wrap_future(future)
+
+
+def flush_all() -> None:
+    """Write every dirty store and wait for the writer thread. Blocks; for shutdown."""
+    disk_writer.drain()
+    _in_flight.clear()
+    for name in list(_dirty):
+        flush(name)
+    disk_writer.drain()
+
+
+def get_stats() -> dict:
+    elapsed = max(time.monotonic() - _window_start, 1e-9)
+    return {
+        **_stats,
+        "window_seconds": elapsed,
+        "flushes_per_sec": _stats["flushes"] / elapsed,
+        "bytes_per_sec": _stats["bytes"] / elapsed,
+        "pending": sorted(_dirty),
+        "writer_queue": disk_writer.queue_depth(),
+    }
+
+
+def _report_and_reset() -> None:
+    global _window_start
+    s = get_stats()
+    print(
+        f"[PERSIST] {s['flushes_per_sec']:.3f} flushes/s | "
+        f"{s['bytes'] / 1024:.1f} KB written | "
+        f"{s['marks']} marks → {s['flushes']} flushes | "
+        f"write time {s['flush_seconds'] * 1000:.0f} ms total, {s['max_flush_ms']:.1f} ms max | "
+        f"on-loop snapshot {s['snapshot_seconds'] * 1000:.0f} ms total, {s['max_snapshot_ms']:.1f} ms max "
+        f"over {s['window_seconds']:.0f}s"
+    )
+    if _lag_samples:
+        lags = sorted(_lag_samples)
+        p50 = lags[len(lags) // 2]
+        p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+        print(
+            f"[LOOP] lag p50 {p50 * 1000:.1f} ms | p99 {p99 * 1000:.1f} ms | "
+            f"max {lags[-1] * 1000:.1f} ms over {len(lags)} samples "
+            f"(writes {'on writer thread' if USE_WRITER_THREAD else 'on loop'})"
+        )
+        _lag_samples.clear()
+    for key in _stats:
+        _stats[key] = 0 if isinstance(_stats[key], int) else 0.0
+    _window_start = time.monotonic()
+
+
+async def _flush_loop():
+    while True:
+        await _wakeup.wait()
+        # Coalesce everything marked within the latency window into one write.
+        await asyncio.sleep(MAX_LATENCY)
+        _wakeup.clear()
+        for name in list(_dirty):
+            flush(name)
+
+
+async def _lag_loop():
+    """Sample how late the loop wakes a sleeping task."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_SAMPLE_INTERVAL)
+        _lag_samples.append(max(0.0, time.perf_counter() - started - LAG_SAMPLE_INTERVAL))
+
+
+async def _stats_loop():
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        _report_and_reset()
+
+
+def start() -> None:
+    """Start the background flusher on the running loop."""
+    global _wakeup, _flusher_task
+    if _flusher_task is not None and not _flusher_task.done():
+        return
+    _wakeup = asyncio.Event()
+    if _dirty:
+        _wakeup.set()
+    _flusher_task = asyncio.create_task(_flush_loop())
+    asyncio.create_task(_lag_loop())
+    asyncio.create_task(_stats_loop())
+    print(
+        f"[PERSIST] Flusher started (max latency {MAX_LATENCY}s, "
+        f"writes {'on writer thread' if USE_WRITER_THREAD else 'on loop'})"
+    )
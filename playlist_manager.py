@@ -1,9 +1,9 @@
-import json
 import os
 import uuid
 from datetime import datetime, timezone
 from typing import Optional
-from encryption import save_encrypted, load_encrypted
+from encryption import encode_records, write_records, load_records
+import persistence
 
 PLAYLIST_FILE = "playlists.json"
 MAX_TRACKS_PER_PLAYLIST = 50
@@ -18,8 +18,7 @@ def load() -> None:
         _data = {"playlists": {}}
         return
     try:
-        raw = load_encrypted(PLAYLIST_FILE)
-        _data = json.loads(raw)
+        _data = load_records(PLAYLIST_FILE)
         _data.setdefault("playlists", {})
     except Exception as e:
         print(f"[PLAYLIST] Load error: {e}")
@@ -27,10 +26,15 @@ def load() -> None:
 
 
 def save() -> None:
-    try:
-        save_encrypted(PLAYLIST_FILE, json.dumps(_data, indent=2, ensure_ascii=False))
-    except Exception as e:
-        print(f"[PLAYLIST] Save error: {e}")
+    persistence.mark_dirty("playlists")
+
+
+def _snapshot():
+    records = encode_records(_data)
+    return lambda: write_records(PLAYLIST_FILE, records)
+
+
+persistence.register("playlists", _snapshot)
 
 
 def get_guild_playlists(guild_id: int) -> dict[str, dict]:
@@ -1,50 +1,336 @@
+"""
+Async Replicate client over the HTTP API.
+
+A prediction is created, then followed without holding a thread:
+
+- Models that stream (urls.stream) are read as server-sent events.
+- Otherwise the prediction is polled with adaptive backoff, starting at
+  POLL_START seconds and growing to POLL_MAX.
+- When REPLICATE_RESULT_BASE points at the main.py server and
+  REPLICATE_WEBHOOK_SECRET is set, Replicate posts the finished prediction
+  to its signed /replicate-webhook. Each poll round then asks that server
+  first and only goes to the Replicate API every API_POLL_WITH_WEBHOOK
+  seconds as a safety net. A delivery only ends the wait early: the final
+  state is always read back from the Replicate API.
+
+At most REPLICATE_MAX_IN_FLIGHT predictions run at once; further calls wait
+for a slot. Cancelling the calling task, or running past its timeout,
+cancels the prediction on Replicate too, so an expired Discord interaction
+does not leave it running and billing:
+
+    text = await call_replicate(prompt, timeout=interaction_timeout(interaction.created_at))
+
+File outputs are read in chunks with iter_output_file().
+"""
+
+import asyncio
+import json
 import os
-import replicate
+import time
+from datetime import datetime, timezone
+
+import aiohttp
 from dotenv import load_dotenv
 
+from chat_messages import flatten, split_system
+
 load_dotenv()
 
 REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
+REPLICATE_API = "https://api.replicate.com/v1"
+RESULT_URL_BASE = os.getenv("REPLICATE_RESULT_BASE", "").strip().rstrip("/")
+# main.py refuses unsigned deliveries, so webhooks are only requested with a secret.
+USE_WEBHOOK = bool(RESULT_URL_BASE and os.getenv("REPLICATE_WEBHOOK_SECRET", "").strip())
+
+MAX_IN_FLIGHT = int(os.getenv("REPLICATE_MAX_IN_FLIGHT", "4"))
+DEFAULT_TIMEOUT = 300        # seconds a prediction may take, queueing included
+POLL_START = 0.25
+POLL_MAX = 5.0
+POLL_GROWTH = 1.5
+API_POLL_WITH_WEBHOOK = 10.0
+INTERACTION_LIFETIME = 15 * 60
+INTERACTION_MARGIN = 20      # left for sending the answer
+
+TERMINAL_STATES = ("succeeded", "failed", "canceled")
+
+SESSION: aiohttp.ClientSession | None = None
+_slots = asyncio.Semaphore(MAX_IN_FLIGHT)
+_stats = {"created": 0, "succeeded": 0, "failed": 0, "canceled": 0, "waiting": 0, "in_flight": 0}
+
+
+class ReplicateError(Exception):
+    pass
+
+
+def clean_log(text: str) -> str:
+    if not text:
+        return text
+    if REPLICATE_API_TOKEN:
+        text = text.replace(REPLICATE_API_TOKEN, "***")
+    return text
+
+
+async def get_session():
+    global SESSION
+    if SESSION is None or SESSION.closed:
+        SESSION = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=MAX_IN_FLIGHT * 2 + 2, keepalive_timeout=30),
+        )
+    return SESSION
+
+
+def _auth_headers() -> dict:
+    # Sent per request, never on the session, so the token only goes to
+    # Replicate and not to the result server or output file hosts.
+    return {"Authorization": f"Bearer {REPLICATE_API_TOKEN}"}
+
+
+async def close_session():
+    """Close the aiohttp session properly"""
+    global SESSION
+    if SESSION and not SESSION.closed:
+        await SESSION.close()
+        SESSION = None
+
+
+def interaction_timeout(created_at: datetime) -> float:
+    """Seconds left to answer a Discord interaction created at created_at."""
+    age = (datetime.now(timezone.utc) - created_at).total_seconds()
+    return max(INTERACTION_LIFETIME - INTERACTION_MARGIN - age, 1.0)
+
+
+# ---------------- PREDICTIONS ----------------
+async def create_prediction(model: str, input_data: dict) -> dict:
+    """Start a prediction. model is "owner/name" or "owner/name:version"."""
+    session = await get_session()
+    if ":" in model:
+        url = f"{REPLICATE_API}/predictions"
+        body = {"version": model.split(":", 1)[1], "input": input_data}
+    else:
+        url = f"{REPLICATE_API}/models/{model}/predictions"
+        body = {"input": input_data}
+    if USE_WEBHOOK:
+        body["webhook"] = f"{RESULT_URL_BASE}/replicate-webhook"
+        body["webhook_events_filter"] = ["completed"]
+
+    async with session.post(url, json=body, headers=_auth_headers(), timeout=aiohttp.ClientTimeout(total=30)) as resp:
+        if resp.status not in (200, 201):
+            raise ReplicateError(f"create failed with {resp.status}: {clean_log(await resp.text())}")
+        prediction = await resp.json()
+    _stats["created"] += 1
+    print(f"[REPLICATE] Created prediction {prediction.get('id')} for {model}")
+    return prediction
+
+
+async def get_prediction(prediction_id: str) -> dict:
+    session = await get_session()
+    async with session.get(f"{REPLICATE_API}/predictions/{prediction_id}", headers=_auth_headers(), timeout=aiohttp.ClientTimeout(total=15)) as resp:
+        if resp.status != 200:
+            raise ReplicateError(f"status check failed with {resp.status}: {clean_log(await resp.text())}")
+        return await resp.json()
+
+
+async def cancel_prediction(prediction_id: str) -> None:
+    session = await get_session()
+    try:
+        async with session.post(f"{REPLICATE_API}/predictions/{prediction_id}/cancel", headers=_auth_headers(), timeout=aiohttp.ClientTimeout(total=10)) as resp:
+            print(f"[REPLICATE] Cancelled prediction {prediction_id} ({resp.status})")
+    except Exception as e:
+        print(f"[REPLICATE ERROR] Cancel of {prediction_id} failed: {clean_log(str(e))}")
+
+
+async def _webhook_delivered(prediction_id: str) -> bool:
+    """Whether main.py's webhook has received the finished prediction."""
+    session = await get_session()
+    try:
+        async with session.get(f"{RESULT_URL_BASE}/result/{prediction_id}", timeout=aiohttp.ClientTimeout(total=5)) as resp:
+            if resp.status != 200:
+                return False
+            data = await resp.json()
+    except Exception:
+        return False
+    return data.get("status") == "done"
 
+
+async def wait_for_prediction(prediction: dict) -> dict:
+    """Poll until the prediction reaches a terminal state, with growing intervals."""
+    prediction_id = prediction["id"]
+    delay = POLL_START
+    last_api_poll = time.monotonic()
+    while prediction.get("status") not in TERMINAL_STATES:
+        await asyncio.sleep(delay)
+        delay = min(delay * POLL_GROWTH, POLL_MAX)
+
+        if USE_WEBHOOK and not await _webhook_delivered(prediction_id):
+            if time.monotonic() - last_api_poll < API_POLL_WITH_WEBHOOK:
+                continue
+        last_api_poll = time.monotonic()
+        prediction = await get_prediction(prediction_id)
+    return prediction
+
+
+async def stream_prediction(prediction: dict, outcome: dict | None = None):
+    """
+    Yield text output from the prediction's server-sent event stream as it
+    is produced. When the stream sends its done event, outcome["status"] is
+    set from the event's reason: "canceled", "failed" or "succeeded". A
+    stream that closes without one leaves outcome untouched.
+    """
+    session = await get_session()
+    timeout = aiohttp.ClientTimeout(total=None, sock_read=60)
+    headers = {**_auth_headers(), "Accept": "text/event-stream", "Cache-Control": "no-store"}
+    async with session.get(prediction["urls"]["stream"], headers=headers, timeout=timeout) as resp:
+        if resp.status != 200:
+            raise ReplicateError(f"stream failed with {resp.status}: {clean_log(await resp.text())}")
+        event, data = "message", []
+        async for raw in resp.content:
+            line = raw.decode("utf-8", "ignore").rstrip("\r\n")
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                data.append(line[5:].removeprefix(" "))
+            elif not line:
+                if event == "output" and data:
+                    yield "\n".join(data)
+                elif event == "error":
+                    raise ReplicateError("\n".join(data) or "prediction failed")
+                elif event == "done":
+                    if outcome is not None:
+                        outcome["status"] = _done_status("\n".join(data))
+                    return
+                event, data = "message", []
+
+
+def _done_status(data: str) -> str:
+    """Final status for a stream's done event; its payload names a reason unless the run succeeded."""
+    try:
+        reason = (json.loads(data or "{}") or {}).get("reason", "")
+    except (ValueError, AttributeError):
+        reason = "error"
+    if reason == "canceled":
+        return "canceled"
+    return "failed" if reason else "succeeded"
+
+
+async def iter_output_file(url: str, chunk_size: int = 64 * 1024):
+    """Yield a file output in chunks instead of reading it into memory at once."""
+    session = await get_session()
+    async with session.get(url, timeout=aiohttp.ClientTimeout(total=None, sock_read=60)) as resp:
+        if resp.status != 200:
+            raise ReplicateError(f"output download failed with {resp.status}")
+        async for chunk in resp.content.iter_chunked(chunk_size):
+            yield chunk
+
+
+async def _follow(model: str, input_data: dict, started: dict, on_output) -> dict:
+    prediction = started["prediction"] = await create_prediction(model, input_data)
+    if (prediction.get("urls") or {}).get("stream"):
+        chunks = []
+        outcome = {}
+        async for chunk in stream_prediction(prediction, outcome):
+            chunks.append(chunk)
+            if on_output is not None:
+                on_output(chunk)
+        if "status" not in outcome:
+            # Closed before its done event; the output may be cut short, so ask the API.
+            print(f"[REPLICATE] Stream for {prediction['id']} ended early, checking its status")
+            return await wait_for_prediction(await get_prediction(prediction["id"]))
+        return {**prediction, "status": outcome["status"], "output": chunks}
+    return await wait_for_prediction(prediction)
+
+
+async def run_prediction(model: str, input_data: dict, timeout: float = DEFAULT_TIMEOUT, on_output=None) -> dict:
+    """
+    Create a prediction and follow it to the end within timeout, holding one
+    of the MAX_IN_FLIGHT slots. Streamed text is passed to on_output(chunk)
+    as it arrives and is also collected into the returned prediction's
+    output. On cancellation or timeout the prediction is cancelled on
+    Replicate before the error propagates.
+    """
+    deadline = time.monotonic() + timeout
+    _stats["waiting"] += 1
+    try:
+        await asyncio.wait_for(_slots.acquire(), timeout)
+    finally:
+        _stats["waiting"] -= 1
+
+    _stats["in_flight"] += 1
+    started = {}
+    try:
+        prediction = await asyncio.wait_for(
+            _follow(model, input_data, started, on_output),
+            max(deadline - time.monotonic(), 0.1),
+        )
+        _stats[prediction["status"]] += 1
+        return prediction
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        prediction = started.get("prediction")
+        if prediction is not None:
+            _stats["canceled"] += 1
+            # Shielded so the cancel request goes out even though this task is being cancelled.
+            await asyncio.shield(cancel_prediction(prediction["id"]))
+        raise
+    finally:
+        _stats["in_flight"] -= 1
+        _slots.release()
+
+
+def get_stats() -> dict:
+    return dict(_stats)
+
+
+# ---------------- TEXT ----------------
 async def call_replicate(
-    prompt: str,
+    prompt: str | list[dict],
     model: str = "prunaai/gpt-oss-120b-fast:e994aeeb46519a8ed196fe72650b4d522280dabd2b67129580d164088133f8ff",
     temperature: float = 0.7,
     max_tokens: int = 8000,
-    system_prompt: str | None = None
+    system_prompt: str | None = None,
+    timeout: float = DEFAULT_TIMEOUT,
 ) -> str | None:
     """
     Call Replicate's GPT-OSS-120B model for text generation.
+    A message-list prompt is flattened, with its system text sent as system_prompt.
     """
-    
+
     if not REPLICATE_API_TOKEN:
         print("[REPLICATE ERROR] Missing REPLICATE_API_TOKEN in .env")
         return None
-    
+
+    if not isinstance(prompt, str):
+        system, turns = split_system(prompt)
+        system_prompt = "\n\n".join(filter(None, (system_prompt, system))) or None
+        prompt = flatten(turns)
+
+    input_data = {
+        "prompt": prompt,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+
+    if system_prompt:
+        input_data["system_prompt"] = system_prompt
+
+    print(f"[REPLICATE] Calling {model} with prompt: {prompt[:100]}...")
+
     try:
-        os.environ["REPLICATE_API_TOKEN"] = REPLICATE_API_TOKEN
-        
-        input_data = {
-            "prompt": prompt,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-        }
-        
-        if system_prompt:
-            input_data["system_prompt"] = system_prompt
-        
-        print(f"[REPLICATE] Calling {model} with prompt: {prompt[:100]}...")
-        
-        output = replicate.run(model, input=input_data)
-        
-        if hasattr(output, '__iter__'):
-            response = "".join(output)
-        else:
-            response = str(output)
-        
-        print(f"[REPLICATE] Response length: {len(response)} chars")
-        return response.strip()
-    
+        prediction = await run_prediction(model, input_data, timeout=timeout)
+    except asyncio.TimeoutError:
+        print(f"[REPLICATE ERROR] Timed out after {timeout:g}s")
+        return None
     except Exception as e:
-        print(f"[REPLICATE ERROR] {e}")
+        print(f"[REPLICATE ERROR] {clean_log(str(e))}")
         return None
+
+    if prediction.get("status") != "succeeded":
+        print(f"[REPLICATE ERROR] Prediction {prediction.get('id')} {prediction.get('status')}: {prediction.get('error')}")
+        return None
+
+    output = prediction.get("output")
+    if isinstance(output, list):
+        response = "".join(str(part) for part in output)
+    else:
+        response = str(output or "")
+
+    print(f"[REPLICATE] Response length: {len(response)} chars")
+    return response.strip()
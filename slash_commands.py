@@ -35,16 +35,14 @@ from cerebras_client import call_cerebras
 from tts_text_polisher import polish_text_for_tts
 
 from usage_manager import (
-	check_limit,
-	check_total_limit,
-	consume,
-	consume_total,
-	save_usage,
+	reserve,
+	LimitExceeded,
 	get_tier_from_message,
 )
 
 from topgg_utils import has_voted
 import playlist_manager
+from model_router import AUTO_MODEL
 
 memory = None
 channel_modes = {}
@@ -475,7 +473,6 @@ save_vote_unlocks = None
 set_server_mode = None
 set_channels_mode = None
 get_guild_config = None
-clear_runtime_channel_memory = None
 pending_transcriptions: dict[str, int] = {}
 guild_history: dict[int, list] = {}
 guild_now_message: dict[int, dict] = {}
@@ -505,6 +502,7 @@ MODEL_CHOICES = [
 	"llama-3.3-70b-versatile",
 	"meta-llama/llama-4-scout-17b-16e-instruct",
 	"llama-3.1-8b-instant",
+	AUTO_MODEL,
 ]
 MODEL_LABELS = {
 	"openai/gpt-oss-120b": "GPT-OSS-120B",
@@ -514,6 +512,7 @@ MODEL_LABELS = {
 	"llama-3.3-70b-versatile": "Llama 3.3 70B Versatile",
 	"meta-llama/llama-4-scout-17b-16e-instruct": "Llama 4 Scout 17B 16E",
 	"llama-3.1-8b-instant": "Llama 3.1 8B Instant",
+	AUTO_MODEL: "Auto (picks 8B, Scout or 120B per message)",
 }
 DEFAULT_MODEL_ID = MODEL_CHOICES[0] if MODEL_CHOICES else ""
 MODEL_CHOICE_OPTIONS = [
@@ -2197,6 +2196,17 @@ class Codunot(commands.Cog):
 	def _should_deliver_paid_output_in_dm(self, interaction: discord.Interaction) -> bool:
 		return self._bot_missing_from_guild(interaction)
 
+	async def _reserve_paid_slot(self, interaction: discord.Interaction, usage_key: str | None):
+		"""Hold one attachment slot for a paid job, or tell the user which limit they hit."""
+		try:
+			return await reserve(interaction, "attachments", usage_key=usage_key)
+		except LimitExceeded as e:
+			if e.scope == "daily":
+				await interaction.followup.send("🚫 You've hit your **daily attachments limit**. Either wait for the limits to renew, or contact my owner aarav_2022 on discord, for an upgrade!")
+			else:
+				await interaction.followup.send("🚫 You've hit your **2 months' attachments limit**. Either wait for the limits to renew, or contact my owner aarav_2022 on discord, for an upgrade!")
+			return None
+
 	async def _deliver_paid_attachment(self, interaction, content, filename, payload_bytes):
 		if not self._should_deliver_paid_output_in_dm(interaction):
 			await interaction.followup.send(
@@ -2414,8 +2424,6 @@ class Codunot(commands.Cog):
 		new_model = model.value
 		memory.save_channel_model(chan_id, new_model)
 		memory.clear_channel_messages(chan_id)
-		if clear_runtime_channel_memory is not None:
-			clear_runtime_channel_memory(chan_id)
 		memory.persist()
 		await interaction.response.send_message(
 			f"🧠✨ **Model switched!**\n"
@@ -3220,33 +3228,29 @@ class Codunot(commands.Cog):
 		if not await require_vote_deferred(interaction):
 			return
 		await interaction.edit_original_response(content="✅ **Vote verified! You're good to go.**")
-		if not check_limit(interaction, "attachments", usage_key=usage_key):
-			await interaction.followup.send("🚫 You've hit your **daily attachments limit**. Either wait for the limits to renew, or contact my owner aarav_2022 on discord, for an upgrade!")
-			return
-		if not check_total_limit(interaction, "attachments", usage_key=usage_key):
-			await interaction.followup.send("🚫 You've hit your **2 months' attachments limit**. Either wait for the limits to renew, or contact my owner aarav_2022 on discord, for an upgrade!")
+		reservation = await self._reserve_paid_slot(interaction, usage_key)
+		if reservation is None:
 			return
 		await interaction.followup.send("🎨 **Cooking up your image... hang tight ✨**")
-		try:
-			boosted_prompt = await boost_image_prompt(prompt)
-			image_bytes, balance = await generate_image(boosted_prompt, aspect_ratio="1:1")
-			output_text = f"{interaction.user.mention} 🖼️ Generated: `{prompt[:150]}{'...' if len(prompt) > 150 else ''}`"
-			await self._deliver_paid_attachment(interaction, output_text, "generated_image.png", image_bytes)
-			consume(interaction, "attachments", usage_key=usage_key)
-			consume_total(interaction, "attachments", usage_key=usage_key, money_left=balance)
-			save_usage()
-		except (requests.exceptions.ReadTimeout, requests.exceptions.ConnectionError) as e:
-			print(f"[SLASH IMAGE ERROR] {e}")
-			traceback.print_exc()
-			await interaction.followup.send(f"{interaction.user.mention} ⏱️ The image API timed out after multiple attempts. The server may be busy — please try again in a moment.")
-		except ImageAPIError as e:
-			print(f"[SLASH IMAGE ERROR] {e}")
-			traceback.print_exc()
-			await interaction.followup.send(f"{interaction.user.mention} ⏱️ The image API returned a server error after multiple attempts. The server may be busy — please try again in a moment.")
-		except Exception as e:
-			print(f"[SLASH IMAGE ERROR] {e}")
-			traceback.print_exc()
-			await interaction.followup.send(f"{interaction.user.mention} 🤔 Couldn't generate image right now.")
+		with reservation:
+			try:
+				boosted_prompt = await boost_image_prompt(prompt)
+				image_bytes, balance = await generate_image(boosted_prompt, aspect_ratio="1:1")
+				output_text = f"{interaction.user.mention} 🖼️ Generated: `{prompt[:150]}{'...' if len(prompt) > 150 else ''}`"
+				await self._deliver_paid_attachment(interaction, output_text, "generated_image.png", image_bytes)
+				reservation.commit(money_left=balance)
+			except (requests.exceptions.ReadTimeout, requests.exceptions.ConnectionError) as e:
+				print(f"[SLASH IMAGE ERROR] {e}")
+				traceback.print_exc()
+				await interaction.followup.send(f"{interaction.user.mention} ⏱️ The image API timed out after multiple attempts. The server may be busy — please try again in a moment.")
+			except ImageAPIError as e:
+				print(f"[SLASH IMAGE ERROR] {e}")
+				traceback.print_exc()
+				await interaction.followup.send(f"{interaction.user.mention} ⏱️ The image API returned a server error after multiple attempts. The server may be busy — please try again in a moment.")
+			except Exception as e:
+				print(f"[SLASH IMAGE ERROR] {e}")
+				traceback.print_exc()
+				await interaction.followup.send(f"{interaction.user.mention} 🤔 Couldn't generate image right now.")
 
 	@app_commands.command(name="generate_video", description="🎬 Generate an AI video from a text prompt")
 	@app_commands.describe(prompt="Describe the video you want to generate")
@@ -3257,25 +3261,21 @@ class Codunot(commands.Cog):
 		if not await require_vote_deferred(interaction):
 			return
 		await interaction.edit_original_response(content="✅ **Vote verified! You're good to go.**")
-		if not check_limit(interaction, "attachments", usage_key=usage_key):
-			await interaction.followup.send("🚫 You've hit your **daily attachments limit**. Either wait for the limits to renew, or contact my owner aarav_2022 on discord, for an upgrade!")
-			return
-		if not check_total_limit(interaction, "attachments", usage_key=usage_key):
-			await interaction.followup.send("🚫 You've hit your **2 months' attachments limit**. Either wait for the limits to renew, or contact my owner aarav_2022 on discord, for an upgrade!")
+		reservation = await self._reserve_paid_slot(interaction, usage_key)
+		if reservation is None:
 			return
 		await interaction.followup.send("🎬 **Rendering your video... this may take up to ~1 min ⏳**")
-		try:
-			boosted_prompt = await boost_video_prompt(prompt)
-			video_bytes = await text_to_video_512(prompt=boosted_prompt)
-			output_text = f"{interaction.user.mention} 🎬 Generated: `{prompt[:150]}{'...' if len(prompt) > 150 else ''}`"
-			await self._deliver_paid_attachment(interaction, output_text, "generated_video.mp4", video_bytes)
-			consume(interaction, "attachments", usage_key=usage_key)
-			consume_total(interaction, "attachments", usage_key=usage_key)
-			save_usage()
-		except Exception as e:
-			print(f"[SLASH VIDEO ERROR] {e}")
-			traceback.print_exc()
-			await interaction.followup.send(f"{interaction.user.mention} 🤔 Couldn't generate video right now.")
+		with reservation:
+			try:
+				boosted_prompt = await boost_video_prompt(prompt)
+				video_bytes = await text_to_video_512(prompt=boosted_prompt)
+				output_text = f"{interaction.user.mention} 🎬 Generated: `{prompt[:150]}{'...' if len(prompt) > 150 else ''}`"
+				await self._deliver_paid_attachment(interaction, output_text, "generated_video.mp4", video_bytes)
+				reservation.commit()
+			except Exception as e:
+				print(f"[SLASH VIDEO ERROR] {e}")
+				traceback.print_exc()
+				await interaction.followup.send(f"{interaction.user.mention} 🤔 Couldn't generate video right now.")
 
 	@app_commands.command(name="generate_tts", description="🔊 Generate text-to-speech audio — pick a voice & language")
 	@app_commands.describe(
@@ -3313,27 +3313,23 @@ class Codunot(commands.Cog):
 		if not await require_vote_deferred(interaction):
 			return
 		await interaction.edit_original_response(content="✅ **Vote verified! You're good to go.**")
-		if not check_limit(interaction, "attachments", usage_key=usage_key):
-			await interaction.followup.send("🚫 You've hit your **daily attachments limit**. Either wait for the limits to renew, or contact my owner aarav_2022 on discord, for an upgrade!")
-			return
-		if not check_total_limit(interaction, "attachments", usage_key=usage_key):
-			await interaction.followup.send("🚫 You've hit your **2 months' attachments limit**. Either wait for the limits to renew, or contact my owner aarav_2022 on discord, for an upgrade!")
+		reservation = await self._reserve_paid_slot(interaction, usage_key)
+		if reservation is None:
 			return
 		await interaction.followup.send(
 			f"🔊 **Generating your audio** (voice: **{voice_code}**, language: **{lang}**)... almost there 🎙️"
 		)
-		try:
-			polished_text = await polish_text_for_tts(text)
-			audio_bytes = await generate_tts_mp3(polished_text, voice_code)
-			output_text = f"{interaction.user.mention} 🔊 TTS ({voice_code} / {lang}): `{text[:200]}{'...' if len(text) > 200 else ''}`"
-			await self._deliver_paid_attachment(interaction, output_text, "speech.mp3", audio_bytes)
-			consume(interaction, "attachments", usage_key=usage_key)
-			consume_total(interaction, "attachments", usage_key=usage_key)
-			save_usage()
-		except Exception as e:
-			print(f"[SLASH TTS ERROR] {e}")
-			traceback.print_exc()
-			await interaction.followup.send(f"{interaction.user.mention} 🤔 Couldn't generate speech right now.")
+		with reservation:
+			try:
+				polished_text = await polish_text_for_tts(text)
+				audio_bytes = await generate_tts_mp3(polished_text, voice_code)
+				output_text = f"{interaction.user.mention} 🔊 TTS ({voice_code} / {lang}): `{text[:200]}{'...' if len(text) > 200 else ''}`"
+				await self._deliver_paid_attachment(interaction, output_text, "speech.mp3", audio_bytes)
+				reservation.commit()
+			except Exception as e:
+				print(f"[SLASH TTS ERROR] {e}")
+				traceback.print_exc()
+				await interaction.followup.send(f"{interaction.user.mention} 🤔 Couldn't generate speech right now.")
 
 	@generate_tts_slash.autocomplete("language")
 	async def _tts_language_autocomplete(
@@ -3459,54 +3455,55 @@ class Codunot(commands.Cog):
 		await interaction.edit_original_response(content="🗳️ **Checking your vote status...**")
 		if not await require_vote_deferred(interaction):
 			return
-		if not check_limit(interaction, "attachments", usage_key=usage_key):
-			await interaction.edit_original_response(content="🚫 Daily transcription limit hit.")
-			return
-		if not check_total_limit(interaction, "attachments", usage_key=usage_key):
-			await interaction.edit_original_response(content="🚫 2-month transcription limit hit.")
+		try:
+			reservation = await reserve(interaction, "attachments", usage_key=usage_key)
+		except LimitExceeded as e:
+			if e.scope == "daily":
+				await interaction.edit_original_response(content="🚫 Daily transcription limit hit.")
+			else:
+				await interaction.edit_original_response(content="🚫 2-month transcription limit hit.")
 			return
 		await interaction.edit_original_response(content="✅ **Submitting transcription...**")
-		deliver_in_dm = self._should_deliver_paid_output_in_dm(interaction)
-		try:
-			request_id = await transcribe_video(video_url=normalized_video_url, max_minutes=30)
-			register_base = self._transcribe_register_base()
-			register_channel_id = interaction.channel.id
-			if deliver_in_dm:
-				if usage_key and usage_key.isdigit():
-					register_channel_id = int(usage_key)
-				else:
+		with reservation:
+			deliver_in_dm = self._should_deliver_paid_output_in_dm(interaction)
+			try:
+				request_id = await transcribe_video(video_url=normalized_video_url, max_minutes=30)
+				register_base = self._transcribe_register_base()
+				register_channel_id = interaction.channel.id
+				if deliver_in_dm:
+					if usage_key and usage_key.isdigit():
+						register_channel_id = int(usage_key)
+					else:
+						try:
+							dm_channel = interaction.user.dm_channel or await interaction.user.create_dm()
+							if dm_channel is not None:
+								register_channel_id = dm_channel.id
+						except Exception as e:
+							print(f"[TRANSCRIBE REGISTER] {e}")
+				if register_base:
 					try:
-						dm_channel = interaction.user.dm_channel or await interaction.user.create_dm()
-						if dm_channel is not None:
-							register_channel_id = dm_channel.id
+						async with aiohttp.ClientSession() as session:
+							async with session.post(
+								f"{register_base}/register-transcription",
+								json={"request_id": request_id, "channel_id": register_channel_id, "user_id": interaction.user.id, "deliver_in_dm": deliver_in_dm},
+								timeout=aiohttp.ClientTimeout(total=15),
+							) as register_resp:
+								if register_resp.status >= 300:
+									print(f"[TRANSCRIBE REGISTER] failed ({register_resp.status})")
 					except Exception as e:
 						print(f"[TRANSCRIBE REGISTER] {e}")
-			if register_base:
-				try:
-					async with aiohttp.ClientSession() as session:
-						async with session.post(
-							f"{register_base}/register-transcription",
-							json={"request_id": request_id, "channel_id": register_channel_id, "user_id": interaction.user.id, "deliver_in_dm": deliver_in_dm},
-							timeout=aiohttp.ClientTimeout(total=15),
-						) as register_resp:
-							if register_resp.status >= 300:
-								print(f"[TRANSCRIBE REGISTER] failed ({register_resp.status})")
-				except Exception as e:
-					print(f"[TRANSCRIBE REGISTER] {e}")
-			consume(interaction, "attachments", usage_key=usage_key)
-			consume_total(interaction, "attachments", usage_key=usage_key)
-			save_usage()
-			asyncio.create_task(self._send_transcription_fallback_result(
-				request_id=request_id, channel_id=register_channel_id,
-				user_id=interaction.user.id, deliver_in_dm=deliver_in_dm,
-			))
-		except VideoToTextError as e:
-			await interaction.edit_original_response(content=f"❌ {e}")
-			return
-		except Exception as e:
-			print(f"[SLASH TRANSCRIBE ERROR] {e}")
-			await interaction.edit_original_response(content="🤔 Couldn't transcribe this video right now.")
-			return
+				reservation.commit()
+				asyncio.create_task(self._send_transcription_fallback_result(
+					request_id=request_id, channel_id=register_channel_id,
+					user_id=interaction.user.id, deliver_in_dm=deliver_in_dm,
+				))
+			except VideoToTextError as e:
+				await interaction.edit_original_response(content=f"❌ {e}")
+				return
+			except Exception as e:
+				print(f"[SLASH TRANSCRIBE ERROR] {e}")
+				await interaction.edit_original_response(content="🤔 Couldn't transcribe this video right now.")
+				return
 		if deliver_in_dm:
 			await interaction.edit_original_response(content="📝 Transcription submitted! Result coming to your DMs.")
 		else:
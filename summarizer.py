@@ -0,0 +1,83 @@
+"""
+Rolling per-channel conversation summaries.
+
+MemoryManager keeps a short raw window per channel. Lines pushed out of it
+are queued on the channel and folded into a compact rolling summary by a
+cheap model, off the reply path. Each channel is summarized at most once per
+SUMMARY_MIN_INTERVAL seconds; lines arriving in between wait in the queue
+and are still shown to the model verbatim until they are folded in.
+"""
+
+import asyncio
+import os
+import time
+
+from groq_client import call_groq
+
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "llama-3.1-8b-instant")
+SUMMARY_MIN_INTERVAL = float(os.getenv("SUMMARY_MIN_INTERVAL", "90"))
+SUMMARY_MIN_LINES = 4
+SUMMARY_MAX_CHARS = 1200
+
+
+class RollingSummarizer:
+    def __init__(self, memory, bot_name="Codunot"):
+        self.memory = memory
+        self.bot_name = bot_name
+        self._tasks: dict = {}
+        self._last_run: dict = {}
+        self.stats = {"runs": 0, "lines": 0, "failures": 0}
+
+    def schedule(self, channel_id):
+        """Fold the channel's queued lines soon. Cheap; safe to call per message."""
+        task = self._tasks.get(channel_id)
+        if task is not None and not task.done():
+            return
+        try:
+            self._tasks[channel_id] = asyncio.get_running_loop().create_task(self._run(channel_id))
+        except RuntimeError:
+            pass  # no loop (scripts, shutdown); lines stay queued
+
+    async def _run(self, channel_id):
+        try:
+            while True:
+                wait = self._last_run.get(channel_id, 0.0) + SUMMARY_MIN_INTERVAL - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                if len(self.memory.get_unsummarized(channel_id)) < SUMMARY_MIN_LINES:
+                    return
+                self._last_run[channel_id] = time.monotonic()
+                await self._fold(channel_id)
+        finally:
+            self._tasks.pop(channel_id, None)
+
+    async def _fold(self, channel_id):
+        lines = self.memory.take_unsummarized(channel_id)
+        previous = self.memory.get_summary(channel_id)
+        prompt = (
+            f"You keep a running summary of a Discord chat for the bot {self.bot_name}.\n"
+            "Merge the new lines into the current summary.\n"
+            "Keep names, facts about users, preferences, decisions, running jokes and open questions. "
+            "Drop greetings and filler. Write plain sentences, at most 120 words. "
+            "Output ONLY the updated summary.\n\n"
+            f"Current summary:\n{previous or '(none)'}\n\n"
+            "New lines:\n" + "\n".join(lines) + "\n\n"
+            "Updated summary:"
+        )
+        try:
+            summary = await call_groq(prompt=prompt, model=SUMMARY_MODEL, temperature=0.2, site="summary")
+        except Exception as e:
+            summary = None
+            print(f"[SUMMARY ERROR] {channel_id}: {e}")
+
+        summary = (summary or "").strip()
+        if not summary:
+            self.stats["failures"] += 1
+            self.memory.restore_unsummarized(channel_id, lines)
+            return
+
+        self.memory.set_summary(channel_id, summary[:SUMMARY_MAX_CHARS])
+        self.memory.persist()
+        self.stats["runs"] += 1
+        self.stats["lines"] += len(lines)
+        print(f"[SUMMARY] {channel_id}: folded {len(lines)} line(s), {len(summary)} chars")
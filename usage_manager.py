@@ -1,19 +1,35 @@
 import os
 import json
 import asyncio
+import time
+from array import array
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
 from datetime import date, datetime, timedelta
 
+import persistence
+
 USAGE_FILE = "daily_usage.json"
 TOTAL_FILE = "total_usage.json"
+# Every consume() / consume_total() since the last checkpoint, one JSON
+# event per line. save_usage() only appends to it; checkpoint_usage()
+# rewrites the two JSON files and truncates it.
+USAGE_LOG = "usage_log.jsonl"
+CHECKPOINT_INTERVAL = 300
 
 PREMIUM_FILE = "tiers_premium.txt"
 GOLD_FILE = "tiers_gold.txt"
 ENTERPRISE_FILE = "enterprise.txt"
 
 channel_usage = {}
-attachment_history = {}
+attachment_history = {}  # key -> AttachmentWindow
 enterprise_overrides = {}
 
+_seq = 0                      # sequence number of the last logged event
+_log_buffer: list[str] = []   # events not yet appended to USAGE_LOG
+_checkpoint_due = False
+
 OWNER_IDS = {int(os.environ.get("OWNER_ID", 0))}
 
 def is_owner(message_or_interaction) -> bool:
@@ -52,6 +68,69 @@ TOTAL_LIMITS = {
 }
 
 ROLLING_WINDOW = timedelta(days=60)
+WINDOW_DAYS = ROLLING_WINDOW.days
+
+def _epoch_day(ts: float) -> int:
+	return int(ts // 86400)
+
+class AttachmentWindow:
+	"""
+	Attachment count over the last WINDOW_DAYS UTC days, kept as one bucket
+	per day in a ring. Checking and adding are O(1) (a day change clears at
+	most WINDOW_DAYS buckets), and memory per key is fixed however many
+	attachments it has used.
+	"""
+
+	__slots__ = ("counts", "day", "total")
+
+	def __init__(self):
+		self.counts = array("I", bytes(4 * WINDOW_DAYS))
+		self.day = 0      # epoch day of the newest bucket
+		self.total = 0
+
+	def _advance(self, day: int):
+		if day <= self.day:
+			return
+		if day - self.day >= WINDOW_DAYS:
+			for i in range(WINDOW_DAYS):
+				self.counts[i] = 0
+			self.total = 0
+		else:
+			for d in range(self.day + 1, day + 1):
+				slot = d % WINDOW_DAYS
+				self.total -= self.counts[slot]
+				self.counts[slot] = 0
+		self.day = day
+
+	def count(self, ts: float) -> int:
+		self._advance(_epoch_day(ts))
+		return self.total
+
+	def add(self, ts: float, n: int = 1):
+		day = _epoch_day(ts)
+		self._advance(day)
+		if day <= self.day - WINDOW_DAYS:
+			return  # already outside the window
+		self.counts[day % WINDOW_DAYS] += n
+		self.total += n
+
+	def to_json(self) -> dict:
+		return {"day": self.day, "counts": self.counts.tolist()}
+
+	@classmethod
+	def from_json(cls, data) -> "AttachmentWindow":
+		window = cls()
+		if isinstance(data, list):
+			# Older files kept every attachment timestamp.
+			for ts in sorted(data):
+				window.add(ts)
+			return window
+		counts = data.get("counts", [])
+		if len(counts) == WINDOW_DAYS:
+			window.counts = array("I", counts)
+			window.day = data.get("day", 0)
+			window.total = sum(counts)
+		return window
 
 def load_tier_file(path: str) -> set[str]:
 	ids = set()
@@ -65,9 +144,6 @@ def load_tier_file(path: str) -> set[str]:
 				ids.add(line)
 	return ids
 
-PREMIUM_IDS = load_tier_file(PREMIUM_FILE)
-GOLD_IDS = load_tier_file(GOLD_FILE)
-
 def _to_limit(value: str):
 	v = value.strip().lower().strip('"')
 	if v in {"inf", "infinite", "infinity", "unlimited"}:
@@ -128,21 +204,94 @@ def load_enterprise_overrides(path: str) -> dict[str, dict]:
 
 	return overrides
 
-ENTERPRISE_OVERRIDES = load_enterprise_overrides(ENTERPRISE_FILE)
-ENTERPRISE_IDS = set(ENTERPRISE_OVERRIDES.keys())
+# ---------------- LIMIT POLICIES ----------------
+# Tier files are re-read when their mtime changes, so tier changes apply
+# without a restart. Each key's limits are compiled once per reload into an
+# immutable LimitPolicy; limit checks are then a dict hit.
 
-print(f"Loaded premium IDs: {sorted(PREMIUM_IDS)}")
-print(f"Loaded gold IDs: {sorted(GOLD_IDS)}")
-print(f"Loaded enterprise IDs: {sorted(ENTERPRISE_IDS)}")
+TIER_FILES = (PREMIUM_FILE, GOLD_FILE, ENTERPRISE_FILE)
+TIER_CHECK_INTERVAL = 5.0
 
-def get_tier_for_key(key: str) -> str:
+PREMIUM_IDS: set[str] = set()
+GOLD_IDS: set[str] = set()
+ENTERPRISE_OVERRIDES: dict[str, dict] = {}
+ENTERPRISE_IDS: set[str] = set()
+
+@dataclass(frozen=True)
+class LimitPolicy:
+	tier: str
+	daily: Mapping[str, float | int]
+	total_attachments: float | int
+
+_policies: dict[str, LimitPolicy] = {}
+_tier_mtimes: tuple = ()
+_next_tier_check = 0.0
+
+def _file_mtime(path: str) -> float | None:
+	try:
+		return os.stat(path).st_mtime
+	except OSError:
+		return None
+
+def reload_tiers(force: bool = False) -> bool:
+	"""Re-read the tier files if any changed on disk. Returns True if reloaded."""
+	global PREMIUM_IDS, GOLD_IDS, ENTERPRISE_OVERRIDES, ENTERPRISE_IDS
+	global _tier_mtimes, _next_tier_check
+	_next_tier_check = time.monotonic() + TIER_CHECK_INTERVAL
+	mtimes = tuple(_file_mtime(path) for path in TIER_FILES)
+	if not force and mtimes == _tier_mtimes:
+		return False
+
+	try:
+		premium = load_tier_file(PREMIUM_FILE)
+		gold = load_tier_file(GOLD_FILE)
+		enterprise = load_enterprise_overrides(ENTERPRISE_FILE)
+	except Exception as e:
+		print(f"[TIERS] Reload failed, keeping previous tiers: {e}")
+		return False
+
+	PREMIUM_IDS, GOLD_IDS = premium, gold
+	ENTERPRISE_OVERRIDES, ENTERPRISE_IDS = enterprise, set(enterprise.keys())
+	_policies.clear()
+	first_load = not _tier_mtimes
+	_tier_mtimes = mtimes
+
+	prefix = "Loaded" if first_load else "[TIERS] Reloaded"
+	print(f"{prefix} premium IDs: {sorted(PREMIUM_IDS)}")
+	print(f"{prefix} gold IDs: {sorted(GOLD_IDS)}")
+	print(f"{prefix} enterprise IDs: {sorted(ENTERPRISE_IDS)}")
+	return True
+
+def _compile_policy(key: str) -> LimitPolicy:
 	if key in ENTERPRISE_IDS:
-		return "enterprise"
-	if key in GOLD_IDS:
-		return "gold"
-	if key in PREMIUM_IDS:
-		return "premium"
-	return "basic"
+		tier = "enterprise"
+	elif key in GOLD_IDS:
+		tier = "gold"
+	elif key in PREMIUM_IDS:
+		tier = "premium"
+	else:
+		tier = "basic"
+
+	daily = dict(LIMITS[tier])
+	total = TOTAL_LIMITS[tier]
+	if tier == "enterprise":
+		override = ENTERPRISE_OVERRIDES.get(key, {})
+		daily.update(override.get("daily", {}))
+		total = override.get("total", {}).get("attachments", total)
+	return LimitPolicy(tier=tier, daily=MappingProxyType(daily), total_attachments=total)
+
+def get_policy(key: str) -> LimitPolicy:
+	if time.monotonic() >= _next_tier_check:
+		reload_tiers()
+	policy = _policies.get(key)
+	if policy is None:
+		policy = _policies[key] = _compile_policy(key)
+	return policy
+
+reload_tiers(force=True)
+
+def get_tier_for_key(key: str) -> str:
+	return get_policy(key).tier
 
 def get_tier_key(message_or_interaction) -> str:
 	if hasattr(message_or_interaction, 'guild'):
@@ -158,15 +307,6 @@ def get_tier_from_message(message_or_interaction) -> str:
 	key = get_tier_key(message_or_interaction)
 	return get_tier_for_key(key)
 
-def _get_limits_for_key(key: str, tier: str) -> tuple[dict, float | int]:
-	daily = dict(LIMITS[tier])
-	total = TOTAL_LIMITS[tier]
-	if tier == "enterprise":
-		override = ENTERPRISE_OVERRIDES.get(key, {})
-		daily.update(override.get("daily", {}))
-		total = override.get("total", {}).get("attachments", total)
-	return daily, total
-
 def get_usage(key: str) -> dict:
 	today = date.today().isoformat()
 	usage = channel_usage.setdefault(key, {
@@ -189,43 +329,31 @@ def check_limit(message_or_interaction, kind: str, usage_key: str | None = None)
 		return True
 	
 	key = usage_key or get_tier_key(message_or_interaction)
-	tier = get_tier_from_message(message_or_interaction)
-	if usage_key is not None:
-		tier = get_tier_for_key(usage_key)
-	usage = get_usage(key)
-	daily_limits, _ = _get_limits_for_key(key, tier)
-	limit = daily_limits[kind]
-	return usage[kind] < limit
+	return get_usage(key)[kind] + _held(key, kind) < get_policy(key).daily[kind]
 
 def consume(message_or_interaction, kind: str, usage_key: str | None = None):
 	if is_owner(message_or_interaction):
 		return
-	
-	key = usage_key or get_tier_key(message_or_interaction)
-	tier = get_tier_from_message(message_or_interaction)
-	if usage_key is not None:
-		tier = get_tier_for_key(usage_key)
+	_consume_key(usage_key or get_tier_key(message_or_interaction), kind)
+
+def _consume_key(key: str, kind: str):
+	policy = get_policy(key)
 	usage = get_usage(key)
-	daily_limits, _ = _get_limits_for_key(key, tier)
 
-	if usage[kind] >= daily_limits[kind]:
+	if usage[kind] >= policy.daily[kind]:
 		print(
 			"[BLOCKED] daily limit hit but consume() was called",
 			"key=", key,
-			"tier=", tier,
+			"tier=", policy.tier,
 			"kind=", kind,
 			"count=", usage[kind]
 		)
 		return
 
 	usage[kind] += 1
+	_log_event(usage, {"k": key, "kind": kind, "day": usage["day"]})
 	save_usage()
 
-def _prune(history: list[float]) -> list[float]:
-	now = datetime.utcnow().timestamp()
-	cutoff = now - ROLLING_WINDOW.total_seconds()
-	return [t for t in history if t >= cutoff]
-
 def check_total_limit(message_or_interaction, kind: str, usage_key: str | None = None) -> bool:
 	if is_owner(message_or_interaction):
 		return True
@@ -234,16 +362,13 @@ def check_total_limit(message_or_interaction, kind: str, usage_key: str | None =
 		return True
 
 	key = usage_key or get_tier_key(message_or_interaction)
-	tier = get_tier_from_message(message_or_interaction)
-	if usage_key is not None:
-		tier = get_tier_for_key(usage_key)
-	_, limit = _get_limits_for_key(key, tier)
-
-	history = attachment_history.get(key, [])
-	history = _prune(history)
-	attachment_history[key] = history
+	return _total_used(key) + _held(key, kind) < get_policy(key).total_attachments
 
-	return len(history) < limit
+def _total_used(key: str) -> int:
+	window = attachment_history.get(key)
+	if window is None:
+		return 0
+	return window.count(datetime.utcnow().timestamp())
 
 def consume_total(message_or_interaction, kind: str, usage_key: str | None = None, money_left: float | None = None):
 	if is_owner(message_or_interaction):
@@ -251,31 +376,127 @@ def consume_total(message_or_interaction, kind: str, usage_key: str | None = Non
 	
 	if kind != "attachments":
 		return
+	_consume_total_key(usage_key or get_tier_key(message_or_interaction), money_left)
 
-	key = usage_key or get_tier_key(message_or_interaction)
-	history = attachment_history.setdefault(key, [])
+def _consume_total_key(key: str, money_left: float | None = None):
+	window = attachment_history.get(key)
+	if window is None:
+		window = attachment_history[key] = AttachmentWindow()
 
 	ts = datetime.utcnow().timestamp()
-	history.append(ts)
+	window.add(ts)
+	_log_event(None, {"k": key, "t": ts})
 
 	daily = get_usage(key)["attachments"]
-	tier = get_tier_from_message(message_or_interaction)
-	if usage_key is not None:
-		tier = get_tier_for_key(usage_key)
-	daily_limits, total_limit = _get_limits_for_key(key, tier)
-	daily_limit = daily_limits["attachments"]
+	policy = get_policy(key)
+	daily_limit = policy.daily["attachments"]
+	total_limit = policy.total_attachments
 
 	print(
 		"[ATTACHMENT LOGGED]",
 		"key=", key,
 		f"daily={daily}/{daily_limit}",
-		f"rolling={len(_prune(history))}/{total_limit}",
+		f"rolling={window.total}/{total_limit}",
 		f"money_left={'unavailable' if money_left is None else f'${money_left:.2f}'}",
 		"time=", datetime.utcfromtimestamp(ts).isoformat()
 	)
 	
 	save_usage()
 
+# ---------------- RESERVATIONS ----------------
+# Paid jobs run for tens of seconds between the limit check and consume().
+# reserve() checks the limits and holds a slot in one step, with no await in
+# between, so concurrent jobs for the same key cannot all pass the check. The slot is counted by
+# check_limit / check_total_limit until it is committed (counted as used)
+# or refunded (released). A reservation that is neither within
+# RESERVATION_TIMEOUT seconds is refunded automatically.
+
+RESERVATION_TIMEOUT = float(os.getenv("RESERVATION_TIMEOUT", "900"))
+
+_reserved: dict[str, int] = {}          # key -> attachment slots held
+
+class LimitExceeded(Exception):
+	"""Raised by reserve(); scope is "daily" or "total"."""
+
+	def __init__(self, scope: str, tier: str):
+		super().__init__(f"{scope} limit reached for tier {tier}")
+		self.scope = scope
+		self.tier = tier
+
+def _held(key: str, kind: str) -> int:
+	return _reserved.get(key, 0) if kind == "attachments" else 0
+
+class Reservation:
+	"""
+	One held attachment slot. Call commit() once the output is delivered;
+	leaving a `with reservation:` block without committing refunds it.
+	"""
+
+	__slots__ = ("key", "state", "_timer")
+
+	def __init__(self, key: str | None):
+		self.key = key
+		self.state = "held" if key is not None else "free"
+		self._timer = None
+		if key is not None:
+			_reserved[key] = _reserved.get(key, 0) + 1
+			try:
+				self._timer = asyncio.get_running_loop().call_later(RESERVATION_TIMEOUT, self._expire)
+			except RuntimeError:
+				pass
+
+	def _release(self, state: str):
+		if self.state != "held":
+			return False
+		self.state = state
+		if self._timer is not None:
+			self._timer.cancel()
+		left = _reserved.get(self.key, 0) - 1
+		if left > 0:
+			_reserved[self.key] = left
+		else:
+			_reserved.pop(self.key, None)
+		return True
+
+	def commit(self, money_left: float | None = None):
+		if self.key is None or self.state in ("committed", "refunded"):
+			return
+		# An expired slot is still counted: the job did finish.
+		self._release("committed")
+		self.state = "committed"
+		_consume_key(self.key, "attachments")
+		_consume_total_key(self.key, money_left)
+
+	def refund(self):
+		self._release("refunded")
+
+	def _expire(self):
+		if self._release("expired"):
+			print(f"[QUOTA] Reservation for key={self.key} timed out after {RESERVATION_TIMEOUT:.0f}s, refunded")
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.refund()
+		return False
+
+async def reserve(message_or_interaction, kind: str = "attachments", usage_key: str | None = None) -> Reservation:
+	"""Check the daily and rolling limits and hold one slot, or raise LimitExceeded."""
+	if kind != "attachments":
+		raise ValueError("only attachment slots can be reserved")
+	if is_owner(message_or_interaction):
+		return Reservation(None)
+
+	key = usage_key or get_tier_key(message_or_interaction)
+	policy = get_policy(key)
+	held = _held(key, kind)
+	if get_usage(key)[kind] + held >= policy.daily[kind]:
+		raise LimitExceeded("daily", policy.tier)
+	if _total_used(key) + held >= policy.total_attachments:
+		raise LimitExceeded("total", policy.tier)
+	return Reservation(key)
+
 async def deny_limit(message_or_interaction, kind: str):
 	tier = get_tier_from_message(message_or_interaction)
 	msg = (
@@ -291,23 +512,112 @@ async def deny_limit(message_or_interaction, kind: str):
 		else:
 			await message_or_interaction.response.send_message(msg, ephemeral=False)
 
+def _log_event(usage: dict | None, event: dict):
+	global _seq
+	_seq += 1
+	event["n"] = _seq
+	if usage is not None:
+		# Lets replay skip events a checkpoint already counted.
+		usage["n"] = _seq
+	_log_buffer.append(json.dumps(event, separators=(",", ":")))
+
+def _replay(event: dict, total_seq: int) -> bool:
+	"""Apply a logged event unless the last checkpoint already counted it."""
+	key = event["k"]
+	if "t" in event:
+		if event["n"] <= total_seq:
+			return False
+		window = attachment_history.get(key)
+		if window is None:
+			window = attachment_history[key] = AttachmentWindow()
+		window.add(event["t"])
+		return True
+	usage = channel_usage.setdefault(key, {"day": event["day"], "messages": 0, "attachments": 0})
+	if usage.get("n", 0) >= event["n"]:
+		return False
+	if usage["day"] != event["day"]:
+		usage.update({"day": event["day"], "messages": 0, "attachments": 0})
+	usage[event["kind"]] = usage.get(event["kind"], 0) + 1
+	usage["n"] = event["n"]
+	return True
+
 def save_usage():
-	try:
-		with open(USAGE_FILE, "w", encoding="utf-8") as f:
-			json.dump(channel_usage, f, indent=2)
-	except Exception as e:
-		print("[SAVE DAILY ERROR]", e)
+	"""Append the events logged since the last save. O(1) per consume."""
+	if _log_buffer or _checkpoint_due:
+		persistence.mark_dirty("usage")
+
+def checkpoint_usage():
+	"""Rewrite both JSON files with the full state and truncate the log."""
+	global _checkpoint_due
+	_checkpoint_due = True
+	persistence.mark_dirty("usage")
+
+class UnsavedUsage(Exception):
+	"""A usage write failed; carries what it was writing back to the loop."""
+	def __init__(self, events: list[str], checkpoint: bool, cause: Exception):
+		super().__init__(str(cause))
+		self.events = events
+		self.checkpoint = checkpoint
+
+def _atomic_write_text(path: str, payload: str) -> int:
+	tmp_path = f"{path}.tmp"
+	with open(tmp_path, "w", encoding="utf-8") as f:
+		f.write(payload)
+	os.replace(tmp_path, path)
+	return len(payload)
+
+def _snapshot_usage():
+	global _log_buffer, _checkpoint_due
+	events, _log_buffer = _log_buffer, []
+
+	if not _checkpoint_due:
+		def append() -> int:
+			payload = "".join(line + "\n" for line in events)
+			try:
+				with open(USAGE_LOG, "a", encoding="utf-8") as f:
+					f.write(payload)
+			except Exception as e:
+				raise UnsavedUsage(events, False, e) from e
+			return len(payload)
+		return append
+
+	_checkpoint_due = False
+	# Compact dumps use the C encoder and are quick enough for the loop;
+	# the indented copies that land on disk are produced on the writer thread.
+	daily = json.dumps(channel_usage)
+	total = json.dumps({
+		"attachments": {key: window.to_json() for key, window in attachment_history.items()},
+		"seq": _seq,
+	})
 
-	try:
-		with open(TOTAL_FILE, "w", encoding="utf-8") as f:
-			json.dump({
-				"attachments": attachment_history
-			}, f, indent=2)
-	except Exception as e:
-		print("[SAVE TOTAL ERROR]", e)
+	def checkpoint() -> int:
+		# The log is kept until both files are written; replay skips
+		# whatever a half-written checkpoint already counted.
+		try:
+			written = _atomic_write_text(USAGE_FILE, json.dumps(json.loads(daily), indent=2))
+			written += _atomic_write_text(TOTAL_FILE, json.dumps(json.loads(total), indent=2))
+		except Exception as e:
+			raise UnsavedUsage(events, True, e) from e
+
+		# Everything in the log is now in the files above.
+		open(USAGE_LOG, "w").close()
+		return written
+
+	return checkpoint
+
+def _usage_write_failed(error: Exception):
+	"""On the loop: put a failed write's events back in front of newer ones."""
+	global _checkpoint_due
+	if not isinstance(error, UnsavedUsage):
+		return
+	_log_buffer[:0] = error.events
+	if error.checkpoint:
+		_checkpoint_due = True
+
+persistence.register("usage", _snapshot_usage, on_error=_usage_write_failed)
 
 def load_usage():
-	global channel_usage, attachment_history
+	global channel_usage, attachment_history, _seq
 
 	if os.path.exists(USAGE_FILE):
 		try:
@@ -317,16 +627,37 @@ def load_usage():
 		except Exception as e:
 			print(f"[LOAD DAILY ERROR] {e}")
 
+	total_seq = 0
 	if os.path.exists(TOTAL_FILE):
 		try:
 			with open(TOTAL_FILE, encoding="utf-8") as f:
 				data = json.load(f)
-				attachment_history = data.get("attachments", {})
+				attachment_history = {
+					key: AttachmentWindow.from_json(value)
+					for key, value in data.get("attachments", {}).items()
+				}
+				total_seq = data.get("seq", 0)
 			print(f"[LOAD] Loaded total usage from {TOTAL_FILE}")
 		except Exception as e:
 			print(f"[LOAD TOTAL ERROR] {e}")
+	_seq = total_seq
+
+	if os.path.exists(USAGE_LOG):
+		replayed = 0
+		with open(USAGE_LOG, encoding="utf-8") as f:
+			for line in f:
+				try:
+					event = json.loads(line)
+				except json.JSONDecodeError:
+					continue  # torn last line from a crash
+				_seq = max(_seq, event["n"])
+				if _replay(event, total_seq):
+					replayed += 1
+		if replayed:
+			print(f"[LOAD] Replayed {replayed} usage event(s) from {USAGE_LOG}")
 
 async def autosave_usage():
+	"""Periodic checkpoint; between checkpoints the log is what makes usage durable."""
 	while True:
-		await asyncio.sleep(300)
-		save_usage()
+		await asyncio.sleep(CHECKPOINT_INTERVAL)
+		checkpoint_usage()